@@ -0,0 +1,219 @@
+#! /usr/bin/env python
+"""
+Benchmark reading NEXRAD Level 3 files, one file per supported product.
+
+Each stage of reading a file is timed separately, the best of several
+repeats is reported, and the peak memory allocated while reading the file
+and scaling the data is recorded with tracemalloc.  Results are written as
+JSON and compared against the baseline results in bench_baseline.json, a
+stage which regresses by more than the thresholds fails the run.
+
+Usage: bench_nexrad_level3.py [-o results.json] [--baseline baseline.json]
+
+The baseline holds the results of the sample_data files on the machine the
+benchmarks are run on, regenerate it after intended performance changes,
+or when the machine, Python or NumPy changes, with::
+
+    bench_nexrad_level3.py --repeat 20 --no-compare -o bench_baseline.json
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import nexrad_level3_scan
+from nexrad_level3 import (NEXRADLevel3File, MessageHeader, ProductDescription,
+                           BZ2_CHUNK_SIZE, SUPPORTED_PRODUCTS,
+                           _decompress_symbology_block, _text_header_size)
+
+# stages timed for each file, in order, and the complete read
+STAGES = ('read', 'headers', 'decompress', 'decode', 'scale', 'total')
+
+# results the benchmarks are compared against by default
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'bench_baseline.json')
+
+
+def find_files(paths):
+    """ Return a dictionary mapping product codes to one file of each. """
+    inventory = nexrad_level3_scan.scan(paths)
+    files = {}
+    for path, code in sorted(zip(inventory['path'],
+                                 inventory['product_code'])):
+        code = int(code)
+        if code in SUPPORTED_PRODUCTS and code not in files:
+            files[code] = path
+    return files
+
+
+def time_stages(filename, repeat):
+    """ Return the best time in seconds of each stage of reading a file. """
+    times = dict((stage, []) for stage in STAGES)
+    timer = time.perf_counter
+    for _ in range(repeat):
+        start = timer()
+        with open(filename, 'rb') as fhandle:
+            buf = fhandle.read()
+        times['read'].append(timer() - start)
+
+        start = timer()
+        bpos = _text_header_size(buf)
+        MessageHeader.unpack_from(buf, bpos)
+        ProductDescription.unpack_from(buf, bpos + 18)
+        bpos += 120
+        times['headers'].append(timer() - start)
+
+        start = timer()
+        if buf[bpos:bpos + 2] == b'BZ':
+            view = memoryview(buf)
+            buf2 = _decompress_symbology_block(
+                view[i:i + BZ2_CHUNK_SIZE]
+                for i in range(bpos, len(buf), BZ2_CHUNK_SIZE))
+        else:
+            buf2 = memoryview(buf)[bpos:]
+        times['decompress'].append(timer() - start)
+
+        nfile = NEXRADLevel3File(buf, lazy=True)
+        start = timer()
+        nfile._read_symbology_block(buf2)
+        times['decode'].append(timer() - start)
+
+        start = timer()
+        nfile.get_data()
+        times['scale'].append(timer() - start)
+
+        start = timer()
+        NEXRADLevel3File(filename).get_data()
+        times['total'].append(timer() - start)
+    return dict((stage, min(values)) for stage, values in times.items())
+
+
+def peak_memory(filename):
+    """ Return the peak memory in bytes allocated reading a file. """
+    tracemalloc.start()
+    try:
+        nfile = NEXRADLevel3File(filename)
+        nfile.get_data()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(paths, repeat):
+    """ Return the benchmark results for the files in paths. """
+    results = {}
+    for code, filename in sorted(find_files(paths).items()):
+        result = time_stages(filename, repeat)
+        result['peak_memory'] = peak_memory(filename)
+        result['file'] = filename
+        results[str(code)] = result
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def rerun(results, codes, repeat):
+    """
+    Time the files of some product codes again, in place.
+
+    The time of each stage is the best of the earlier and the new times, so
+    regressions caused by a noisy machine are not reported.
+
+    """
+    for code in codes:
+        result = results['results'][code]
+        times = time_stages(result['file'], repeat)
+        for stage in STAGES:
+            result[stage] = min(result[stage], times[stage])
+
+
+def compare(results, baseline, threshold, min_time=5e-4):
+    """
+    Return a list of regressions of results compared to a baseline.
+
+    A stage regresses when its time exceeds the baseline time by more than
+    threshold (a fraction) and by at least min_time seconds, peak memory
+    regresses when it exceeds the baseline by more than threshold.
+
+    """
+    regressions = []
+    for code, result in sorted(results['results'].items()):
+        base = baseline['results'].get(code)
+        if base is None:
+            continue
+        for key in STAGES + ('peak_memory', ):
+            if key not in base:
+                continue
+            limit = base[key] * (1. + threshold)
+            if key != 'peak_memory':
+                limit = max(limit, base[key] + min_time)
+            if result[key] > limit:
+                regressions.append((code, key, base[key], result[key]))
+    return regressions
+
+
+def main():
+    """ main function. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='*', default=['sample_data'],
+                        help='files or directories, default sample_data')
+    parser.add_argument('-o', '--output', help='JSON file of the results')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='JSON file of earlier results, default '
+                        'bench_baseline.json next to this script')
+    parser.add_argument('--no-compare', action='store_true',
+                        help='do not compare against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed fractional increase, default 0.25')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='allowed increase in ms, default 0.5')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='repeats of each stage, default 5')
+    args = parser.parse_args()
+
+    results = run(args.paths, args.repeat)
+    print('%5s %9s %9s %9s %9s %9s %9s %9s' % (
+        ('code', ) + tuple(STAGES) + ('peak kB', )))
+    for code, result in sorted(results['results'].items(),
+                               key=lambda item: int(item[0])):
+        print('%5s' % (code) + ''.join(
+            [' %7.3fms' % (result[stage] * 1e3) for stage in STAGES]) +
+            ' %9i' % (result['peak_memory'] // 1024))
+    if args.output:
+        with open(args.output, 'w') as fhandle:
+            json.dump(results, fhandle, indent=2, sort_keys=True)
+
+    if not args.no_compare:
+        with open(args.baseline) as fhandle:
+            baseline = json.load(fhandle)
+        for key in ['python', 'numpy', 'platform']:
+            if results[key] != baseline[key]:
+                print('WARNING %s differs from the baseline: %s, baseline %s'
+                      % (key, results[key], baseline[key]))
+        regressions = compare(results, baseline, args.threshold,
+                              args.min_time * 1e-3)
+        if regressions:
+            # confirm the regressions with more repeats
+            rerun(results, set([r[0] for r in regressions]),
+                  args.repeat * 4)
+            regressions = compare(results, baseline, args.threshold,
+                                  args.min_time * 1e-3)
+        for code, key, base, value in regressions:
+            print('REGRESSION code %s %s: %g -> %g' % (code, key, base, value))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
 #! /usr/bin/env python
+""" Convert the NEXRAD Level 3 files in sample_data to NetCDF files. """
 
 import glob
 import subprocess
+import sys
 
+import nexrad_level3_netcdf
 
-def convert_file(infile, outfile):
 
+def convert_file_java(infile, outfile):
+    """ Convert a file using the netCDF Java library. """
     cmd = ("java -Xmx1g -classpath netcdfAll-4.5.jar " +
            "ucar.nc2.dataset.NetcdfDataset -in %s -out %s")
     return subprocess.call(cmd % (infile, outfile), shell=True)
@@ -13,7 +17,12 @@ def convert_file(infile, outfile):
 
 if __name__ == "__main__":
 
-    #convert_file('sample_data/KBMX_SDUS54_N0QBMX_201501020205', 'foo.nc')
-    for infile in glob.glob('sample_data/*'):
-        outfile = infile + '.nc'
-        convert_file(infile, outfile)
+    infiles = [f for f in glob.glob('sample_data/*') if not f.endswith('.nc')]
+    if '--java' in sys.argv[1:]:
+        # reference files for test_convert.py are written by the Java library
+        for infile in infiles:
+            convert_file_java(infile, infile + '.nc')
+    else:
+        errors = nexrad_level3_netcdf.convert_many(infiles, workers=None)
+        for infile, error in sorted(errors.items()):
+            print(infile, error)
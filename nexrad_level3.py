@@ -9,15 +9,33 @@ Class for reading data from NEXRAD Level 3 files.
     :template: dev_template.rst
 
     NEXRADLevel3File
+    MessageHeader
+    ProductDescription
+    SymbologyHeader
+    RadialPacketHeader
+    StatsAggregator
 
 .. autosummary::
     :toctree: generated/
 
     nexrad_level3_message_code
+    _text_header_size
+    _is_filename
+    _read_buffer
     _datetime_from_mdate_mtime
+    _gate_coordinates
+    _data_lut
+    _scale_data
+    _scale_data_8_or_16_levels
+    _scale_data_msg_134
+    _decompress_symbology_block
+    _decode_af1f_radials
     _structure_size
     _unpack_from_buf
     _unpack_structure
+    _record_class
+    _make_record_class
+    _Record
     _int16_to_float16
 
 
@@ -76,8 +94,15 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import bisect
 import bz2
+import mmap
+import os
+import re
 import struct
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 import numpy as np
@@ -87,41 +112,112 @@ class NEXRADLevel3File(object):
     """
     A Class for accessing data in NEXRAD Level III (3) files.
 
+    Parameters
+    ----------
+    filename : str, file-like or buffer
+        Filename of the NEXRAD Level 3 file to read, a binary file-like
+        object or an object supporting the buffer protocol (bytes,
+        bytearray, memoryview, mmap, etc) containing the file data.  Files
+        are memory mapped and buffers are used without being copied.
+    lazy : bool
+        True to read only the text header, message header and product
+        description when the object is created.  File-like objects are
+        always read completely.  The symbology block is then
+        read, uncompressed and decoded on first access to the
+        symbology_header, packet_header, radial_headers or raw_data
+        attributes, for example by calling get_data.  False, the default,
+        reads the entire file during initalization.
+    stats : bool or None
+        True to collect the time spent in each stage of reading the file in
+        the stats attribute and the process-wide STATS aggregator.  None,
+        the default, uses the value of COLLECT_STATS.
+    sector : tuple of float, optional
+        Only decode the radials with start angles from sector[0] up to
+        sector[1] degrees clockwise, the sector may include north, for
+        example (350, 10).
+    range_window : tuple of float, optional
+        Only decode the gates overlapping ranges from range_window[0] up to
+        range_window[1] meters.
+    stride : int or tuple of int
+        Decode every stride radials and gates, or every stride[0] radials
+        and stride[1] gates, of those selected by sector and range_window.
+
+    When sector, range_window or stride select part of the sweep the
+    radial_headers and raw_data attributes and the arrays returned by the
+    get methods only contain the selected radials and gates.  The
+    packet_header describes the complete sweep.
+
+    The msg_header, prod_descr, symbology_header and packet_header
+    attributes are records which support dictionary style access to the
+    fields in the MESSAGE_HEADER, PRODUCT_DESCRIPTION, SYMBOLOGY_HEADER and
+    RADIAL_PACKET_HEADER structures.
+
     Attributes
     ----------
     text_header : dic
         File textual header.
-    msg_header : dic
+    msg_header : MessageHeader
         Message header.
-    prod_descr : dic
+    prod_descr : ProductDescription
         Product description.
-    symbology_header : dict
+    symbology_header : SymbologyHeader
         Symbology header.
-    packet_header : dict
+    packet_header : RadialPacketHeader
         Radial data array packet header.
-    radial_headers : list of dicts
-        List of radials headers
+    radial_headers : structured array
+        Radial headers with the fields in RADIAL_HEADER.  For packet code 16
+        products this is typically a view into the symbology block.
     raw_data : array
-        Raw unscaled, unmasked data.
+        Raw unscaled, unmasked data.  For packet code 16 products this is
+        typically a read-only view into the symbology block.
     data : array
         Scaled, masked radial data.
+    stats : dict or None
+        When statistics are collected, the seconds spent in the 'read'
+        (headers), 'decompress', 'decode' (radials) and 'scale' (get_data)
+        stages, the 'compressed_bytes' and 'decompressed_bytes' of the
+        symbology block, the number of radials 'nradials' and the
+        'packet_code'.  None when statistics are not collected.
 
     """
 
-    def __init__(self, filename):
+    # sector, range window and stride selecting the decoded radials and
+    # gates, the first gate and gate stride of the decoded gates
+    _window = None
+    _first_gate = 0
+    _gate_stride = 1
+
+    def __init__(self, filename, lazy=False, stats=None, sector=None,
+                 range_window=None, stride=1):
         """ initalize the object. """
-        # read the entire file into memory
-        fhandle = open(filename, 'rb')
-        buf = fhandle.read()    # string buffer containing file data
-        fhandle.close()
+        self._cache = {}
+        if isinstance(stride, int):
+            stride = (stride, stride)
+        self._window = None
+        if sector is not None or range_window is not None or stride != (1, 1):
+            self._window = (sector, range_window, tuple(stride))
+        if stats is None:
+            stats = COLLECT_STATS
+        self.stats = None
+        if stats:
+            self.stats = {}
+            start = time.perf_counter()
+
+        # memory map the file or use the buffer, only read the headers of
+        # files opened lazily.
+        if lazy and _is_filename(filename):
+            buf = _read_buffer(filename, HEADERS_READ_SIZE)
+        else:
+            buf = _read_buffer(filename)
 
         # Text header
         # Format of Text header is SDUSXX KYYYY DDHHMM\r\r\nAAABBB\r\r\n
-        self.text_header = buf[:30]
-        bpos = 30       # current reading position in buffer
+        # the WMO heading may have an additional BBB indicator.
+        bpos = _text_header_size(buf)   # current reading position in buffer
+        self.text_header = bytes(buf[:bpos])
 
         # Read and decode 18 byte Message Header Block
-        self.msg_header = _unpack_from_buf(buf, bpos, MESSAGE_HEADER)
+        self.msg_header = MessageHeader.unpack_from(buf, bpos)
         if self.msg_header['code'] not in SUPPORTED_PRODUCTS:
             code = self.msg_header['code']
             raise NotImplementedError(
@@ -129,51 +225,154 @@ class NEXRADLevel3File(object):
         bpos += 18
 
         # Read and decode 102 byte Product Description Block
-        self.prod_descr = _unpack_from_buf(buf, bpos, PRODUCT_DESCRIPTION)
+        self.prod_descr = ProductDescription.unpack_from(buf, bpos)
         bpos += 102
+        if self.stats is not None:
+            self._record_stage('read', start)
 
+        if lazy:
+            # symbology block is read when one of its attributes is accessed
+            if _is_filename(filename):
+                self._lazy_source = (filename, bpos)
+            else:
+                self._lazy_source = (buf, bpos)
+        else:
+            self._read_symbology(buf, bpos)
+
+    def __getattr__(self, name):
+        """ Read the symbology block on first access when opened lazily. """
+        if name in _SYMBOLOGY_ATTRS and '_lazy_source' in self.__dict__:
+            source, bpos = self.__dict__.pop('_lazy_source')
+            self._read_symbology(_read_buffer(source), bpos)
+            return getattr(self, name)
+        raise AttributeError(
+            "'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    def _read_symbology(self, buf, bpos):
+        """ Read the, possibly compressed, symbology block at bpos. """
+        if self.stats is not None:
+            start = time.perf_counter()
         # uncompressed symbology block if necessary
-        if buf[bpos:bpos+2] == 'BZ':
-            buf2 = bz2.decompress(buf[bpos:])
+        if buf[bpos:bpos+2] == b'BZ':
+            chunks = (buf[i:i + BZ2_CHUNK_SIZE]
+                      for i in range(bpos, len(buf), BZ2_CHUNK_SIZE))
+            buf2 = _decompress_symbology_block(chunks)
         else:
             buf2 = buf[bpos:]
 
+        if self.stats is None:
+            self._read_symbology_block(buf2)
+            return
+        self._record_stage('decompress', start)
+        start = time.perf_counter()
         self._read_symbology_block(buf2)
+        self._record_stage('decode', start)
+        self.stats['compressed_bytes'] = len(buf) - bpos
+        self.stats['decompressed_bytes'] = len(buf2)
+        self.stats['nradials'] = self.packet_header['nradials']
+        self.stats['packet_code'] = self.packet_header['packet_code']
+        STATS.count(self.msg_header['code'], self.stats)
+
+    def _record_stage(self, stage, start):
+        """ Record the time since start spent in a stage. """
+        seconds = time.perf_counter() - start
+        self.stats[stage] = self.stats.get(stage, 0.) + seconds
+        STATS.observe(self.msg_header['code'], stage, seconds)
 
     def _read_symbology_block(self, buf2):
         """ Read symbology block. """
+        self.clear_cache()
+
         # Read and decode symbology header
-        self.symbology_header = _unpack_from_buf(buf2, 0, SYMBOLOGY_HEADER)
+        self.symbology_header = SymbologyHeader.unpack_from(buf2, 0)
 
         # Read radial packets
         packet_code = struct.unpack('>h', buf2[16:18])[0]
         assert packet_code in SUPPORTED_PACKET_CODES
-        self.packet_header = _unpack_from_buf(buf2, 16, RADIAL_PACKET_HEADER)
-        self.radial_headers = []
+        self.packet_header = RadialPacketHeader.unpack_from(buf2, 16)
         nbins = self.packet_header['nbins']
         nradials = self.packet_header['nradials']
-        nbytes = _unpack_from_buf(buf2, 30, RADIAL_HEADER)['nbytes']
-        if packet_code == 16 and nbytes != nbins:
+        if packet_code == AF1F:
+            gates = self._select_gates(nbins)
+            self.radial_headers, self.raw_data = _decode_af1f_radials(
+                buf2, 30, nradials, nbins, self._select_radials, gates)
+            return
+
+        nbytes = struct.unpack_from('>h', buf2, 30)[0]
+        if nbytes != nbins:
             nbins = nbytes  # sometimes these do not match, use nbytes
-        self.raw_data = np.empty((nradials, nbins), dtype='uint8')
+        gates = self._select_gates(nbins)
+
+        # when all radials have the same number of bytes the radial headers
+        # and data are strided views into the symbology block buffer.
+        stride = 6 + nbytes
+        if len(buf2) >= 30 + nradials * stride:
+            radial_headers = np.ndarray(
+                (nradials, ), dtype=RADIAL_HEADER_DTYPE, buffer=buf2,
+                offset=30, strides=(stride, ))
+            if np.all(radial_headers['nbytes'] == nbytes):
+                radials = self._select_radials(radial_headers)
+                first, last, step = gates.indices(nbins)
+                self.radial_headers = radial_headers[radials]
+                self.raw_data = np.ndarray(
+                    (nradials, len(range(first, last, step))), dtype='uint8',
+                    buffer=buf2, offset=36 + first,
+                    strides=(stride, step))[radials]
+                return
+
+        # radials differ in length, copy the data from each radial
+        self.radial_headers = np.empty((nradials, ), RADIAL_HEADER_DTYPE)
+        self.raw_data = np.zeros((nradials, nbins), dtype='uint8')
         pos = 30
-
-        for radial in self.raw_data:
-            radial_header = _unpack_from_buf(buf2, pos, RADIAL_HEADER)
-            pos += 6
-            if packet_code == 16:
-                radial[:] = np.fromstring(buf2[pos:pos+nbins], '>u1')
-                pos += radial_header['nbytes']
-            else:
-                assert packet_code == AF1F
-                # decode run length encoding
-                rle_size = radial_header['nbytes'] * 2
-                rle = np.fromstring(buf2[pos:pos+rle_size], dtype='>u1')
-                colors = np.bitwise_and(rle, 0b00001111)
-                runs = np.bitwise_and(rle, 0b11110000) / 16
-                radial[:] = np.repeat(colors, runs)
-                pos += rle_size
-            self.radial_headers.append(radial_header)
+        for i in range(nradials):
+            radial_header = np.frombuffer(
+                buf2, RADIAL_HEADER_DTYPE, count=1, offset=pos)[0]
+            radial_nbytes = min(radial_header['nbytes'], nbins)
+            self.raw_data[i, :radial_nbytes] = np.frombuffer(
+                buf2, 'u1', count=radial_nbytes, offset=pos + 6)
+            self.radial_headers[i] = radial_header
+            pos += 6 + radial_header['nbytes']
+        if self._window is not None:
+            radials = self._select_radials(self.radial_headers)
+            self.radial_headers = self.radial_headers[radials]
+            self.raw_data = np.ascontiguousarray(
+                self.raw_data[radials, gates])
+
+    def _select_radials(self, radial_headers):
+        """ Return an index of the radials selected by sector and stride. """
+        if self._window is None:
+            return slice(None)
+        sector, _, (radial_stride, _) = self._window
+        if sector is None:
+            return slice(None, None, radial_stride)
+        azimuth = radial_headers['angle_start'] * 0.1
+        start, stop = sector
+        if start <= stop:
+            selected = (azimuth >= start) & (azimuth < stop)
+        else:
+            selected = (azimuth >= start) | (azimuth < stop)
+        return np.flatnonzero(selected)[::radial_stride]
+
+    def _select_gates(self, nbins):
+        """ Return a slice of the gates selected by range and stride. """
+        self._first_gate = 0
+        self._gate_stride = 1
+        if self._window is None:
+            return slice(0, nbins)
+        _, range_window, (_, gate_stride) = self._window
+        first, last = 0, nbins
+        if range_window is not None:
+            first_bin = self.packet_header['first_bin']
+            spacing = (self.packet_header['range_scale'] *
+                       PRODUCT_RANGE_RESOLUTION[self.msg_header['code']])
+            first = int(np.clip(
+                np.floor((range_window[0] - first_bin) / spacing), 0, nbins))
+            last = int(np.clip(
+                np.ceil((range_window[1] - first_bin) / spacing), first,
+                nbins))
+        self._first_gate = first
+        self._gate_stride = gate_stride
+        return slice(first, last, gate_stride)
 
     def get_location(self):
         """ Return the latitude, longitude and height of the radar. """
@@ -182,18 +381,48 @@ class NEXRADLevel3File(object):
         height = self.prod_descr['height']
         return latitude, longitude, height
 
+    def clear_cache(self):
+        """
+        Clear the cached results of the get_data, get_azimuth,
+        get_azimuth_delta and get_range methods.
+
+        This must be called after modifying the raw_data, radial_headers,
+        packet_header, msg_header or prod_descr attributes.
+
+        """
+        self._cache = {}
+
     def get_azimuth(self):
         """ Return an array of starting azimuth angles in degrees. """
-        azimuths = [d['angle_start'] for d in self.radial_headers]
-        return np.array(azimuths, dtype='float32') * 0.1
+        if 'azimuth' not in self._cache:
+            azimuth = self.radial_headers['angle_start'].astype('float32')
+            azimuth *= 0.1
+            azimuth.flags.writeable = False
+            self._cache['azimuth'] = azimuth
+        return self._cache['azimuth']
+
+    def get_azimuth_delta(self):
+        """ Return an array of azimuth angle spacing in degrees. """
+        if 'azimuth_delta' not in self._cache:
+            delta = self.radial_headers['angle_delta'].astype('float32')
+            delta *= 0.1
+            delta.flags.writeable = False
+            self._cache['azimuth_delta'] = delta
+        return self._cache['azimuth_delta']
 
     def get_range(self):
         """ Return an array of gate range spacing in meters. """
-        nbins = self.raw_data.shape[1]
-        first_bin = self.packet_header['first_bin']
-        range_scale = (self.packet_header['range_scale'] *
-                       PRODUCT_RANGE_RESOLUTION[self.msg_header['code']])
-        return np.arange(nbins, dtype='float32') * range_scale + first_bin
+        if 'range' not in self._cache:
+            nbins = self.raw_data.shape[1]
+            first_bin = self.packet_header['first_bin']
+            range_scale = (self.packet_header['range_scale'] *
+                           PRODUCT_RANGE_RESOLUTION[self.msg_header['code']])
+            rng = np.arange(nbins, dtype='float32') * self._gate_stride
+            rng += self._first_gate
+            rng = rng * range_scale + first_bin
+            rng.flags.writeable = False
+            self._cache['range'] = rng
+        return self._cache['range']
 
     def get_elevation(self):
         """ Return the sweep elevation angle in degrees. """
@@ -206,98 +435,338 @@ class NEXRADLevel3File(object):
         return _datetime_from_mdate_mtime(self.prod_descr['vol_scan_date'],
                                           self.prod_descr['vol_scan_time'])
 
-    def get_data(self):
-        """ Return an masked array containing the field data. """
-        msg_code = self.msg_header['code']
-        threshold_data = self.prod_descr['threshold_data']
-
-        if msg_code in _8_OR_16_LEVELS:
-            mdata = self._get_data_8_or_16_levels()
-
-        elif msg_code in [134]:
-            mdata = self._get_data_msg_134()
-
-        elif msg_code in [94, 99, 182, 186]:
-            hw31, hw32 = np.fromstring(threshold_data[:4], '>i2')
-            data = (self.raw_data - 2) * (hw32/10.) + hw31/10.
-            mdata = np.ma.array(data, mask=self.raw_data < 2)
-
-        elif msg_code in [32]:
-            hw31, hw32 = np.fromstring(threshold_data[:4], '>i2')
-            data = (self.raw_data) * (hw32/10.) + hw31/10.
-            mdata = np.ma.array(data, mask=self.raw_data < 2)
+    def get_data(self, out=None, dtype='float32', fill_value=np.nan,
+                 masked=True, copy=True):
+        """
+        Return an masked array containing the field data.
+
+        The arrays returned by get_azimuth, get_azimuth_delta and get_range
+        are cached and read-only, copy them before modifying.  By default
+        get_data returns a new array on each call, with copy=False the
+        scaled data is cached and shared between calls.
+
+        Parameters
+        ----------
+        out : array, optional
+            Array in which to place the field data, must have the same
+            shape as raw_data.  Data placed in out is not cached.
+        dtype : str or dtype
+            Data type of the returned data when out is not provided.
+        fill_value : float
+            Value of masked gates when masked is False.
+        masked : bool
+            True to return a masked array, False to return an array with
+            masked gates set to fill_value.
+        copy : bool
+            False to return a masked array of the cached, read-only data
+            when out is not provided, masked is True and dtype is float32,
+            avoiding scaling the data on each call.  The mask of the array
+            is not shared and can be modified.  Ignored otherwise.
+
+        Returns
+        -------
+        data : MaskedArray or array
+            Field data.
+
+        """
+        if self.stats is None:
+            return self._get_data(out, dtype, fill_value, masked, copy)
+        start = time.perf_counter()
+        data = self._get_data(out, dtype, fill_value, masked, copy)
+        self._record_stage('scale', start)
+        return data
+
+    def _get_data(self, out, dtype, fill_value, masked, copy):
+        """ Return the field data, see get_data. """
+        data_lut, mask_lut = _data_lut(self.msg_header['code'],
+                                       self.prod_descr['threshold_data'])
+        raw_data = self.raw_data
+
+        cacheable = out is None and masked and np.dtype(dtype) == np.float32
+        # copy data cached by an earlier call or primed by a SharedSweep
+        if cacheable and copy and 'data' in self._cache:
+            data, mask = self._cache['data']
+            return np.ma.array(data, mask=mask, copy=True)
+        if cacheable and not copy:
+            if 'data' not in self._cache:
+                data = data_lut.take(raw_data, mode='clip')
+                data.flags.writeable = False
+                mask = np.ma.nomask
+                if mask_lut.any():
+                    mask = mask_lut.take(raw_data, mode='clip')
+                self._cache['data'] = data, mask
+            data, mask = self._cache['data']
+            if mask is not np.ma.nomask:
+                mask = mask.copy()
+            return np.ma.array(data, mask=mask, copy=False)
+
+        if out is None:
+            out = np.empty(raw_data.shape, dtype=dtype)
+        elif out.shape != raw_data.shape:
+            raise ValueError(
+                'out has shape %s, expected %s' % (out.shape, raw_data.shape))
+        if not masked:
+            data_lut = np.where(mask_lut, fill_value, data_lut)
+        data_lut.astype(out.dtype).take(raw_data, out=out, mode='clip')
+        if not masked:
+            return out
+        mask = np.ma.nomask
+        if mask_lut.any():
+            mask = mask_lut.take(raw_data, mode='clip')
+        return np.ma.array(out, mask=mask, copy=False)
+
+    def get_gate_cartesian(self):
+        """
+        Return the location of the gates relative to the radar.
+
+        The locations are those of the azimuths and ranges returned by
+        get_azimuth and get_range for a 4/3 earth radius model.  The
+        arrays are cached for all files with the same radar location,
+        elevation, azimuths and ranges and are read-only.
+
+        Returns
+        -------
+        x, y, z : array
+            Distance east and north along the surface and height of the
+            gates above the radar in meters, each with the shape of
+            raw_data.
+
+        """
+        return _gate_coordinates(
+            self.get_location(), self.get_elevation(), self.get_azimuth(),
+            self.get_range(), 'cartesian')
+
+    def get_gate_coordinates(self):
+        """
+        Return the geographic location of the gates.
+
+        See get_gate_cartesian, the locations on the surface are found with
+        an azimuthal equidistant projection centered on the radar.
+
+        Returns
+        -------
+        latitude, longitude : array
+            Latitude and longitude of the gates in degrees, each with the
+            shape of raw_data.
+        altitude : array
+            Altitude of the gates above mean sea level in meters.
+
+        """
+        return _gate_coordinates(
+            self.get_location(), self.get_elevation(), self.get_azimuth(),
+            self.get_range(), 'geographic')
+
+
+def _gate_coordinates(location, elevation, azimuth, rng, name):
+    """
+    Return cached coordinates of the gates of a sweep.
 
-        elif msg_code in [138]:
-            hw31, hw32 = np.fromstring(threshold_data[:4], '>i2')
-            data = self.raw_data * (hw32/100.) + hw31/100.
-            mdata = np.ma.array(data)
+    Parameters
+    ----------
+    location : tuple
+        Latitude, longitude in degrees and height in feet of the radar.
+    elevation : float
+        Elevation angle in degrees.
+    azimuth, rng : array
+        Azimuth angles in degrees and ranges in meters of the gates.
+    name : 'cartesian' or 'geographic'
+        Coordinates to return.
+
+    Returns
+    -------
+    coordinates : tuple of arrays
+        Read-only (nradials, nbins) arrays of the x, y and z location of
+        the gates in meters relative to the radar when name is 'cartesian',
+        otherwise the latitude and longitude in degrees and altitude in
+        meters above mean sea level.
 
-        elif msg_code in [159, 161, 163]:
-            scale, offset = np.fromstring(threshold_data[:8], '>f4')
-            data = (self.raw_data - offset) / (scale)
-            mdata = np.ma.array(data, mask=self.raw_data < 2)
+    """
+    key = (tuple(location), elevation, azimuth.tobytes(), rng.tobytes())
+    with _GATE_COORDINATES_LOCK:
+        coordinates = _GATE_COORDINATES_CACHE.get(key)
+        if coordinates is None:
+            if len(_GATE_COORDINATES_CACHE) >= GATE_COORDINATES_CACHE_SIZE:
+                _GATE_COORDINATES_CACHE.popitem(last=False)
+            coordinates = _GATE_COORDINATES_CACHE[key] = {}
+        else:
+            _GATE_COORDINATES_CACHE.move_to_end(key)
+    if name in coordinates:
+        return coordinates[name]
+
+    # beam height and distance along the surface for a 4/3 earth model,
+    # which only depend on range
+    rng = rng.astype('float64')
+    sin_elev = np.sin(np.radians(elevation))
+    cos_elev = np.cos(np.radians(elevation))
+    radius = EARTH_RADIUS * 4. / 3.
+    z = np.sqrt(rng ** 2 + radius ** 2 + 2. * rng * radius * sin_elev)
+    z -= radius
+    s = radius * np.arcsin(rng * cos_elev / (radius + z))
+
+    azimuth = np.radians(azimuth.astype('float64'))[:, np.newaxis]
+    sin_az = np.sin(azimuth)
+    cos_az = np.cos(azimuth)
+    shape = (len(azimuth), len(rng))
+    if name == 'cartesian':
+        z = np.broadcast_to(z, shape)
+        result = s * sin_az, s * cos_az, z
+    else:
+        # inverse azimuthal equidistant projection about the radar
+        latitude, longitude, height = location
+        lat0 = np.radians(latitude)
+        c = s / EARTH_RADIUS
+        sin_c = np.sin(c)
+        cos_c = np.cos(c)
+        lat = np.degrees(np.arcsin(
+            cos_c * np.sin(lat0) + cos_az * sin_c * np.cos(lat0)))
+        lon = longitude + np.degrees(np.arctan2(
+            sin_az * sin_c,
+            np.cos(lat0) * cos_c - cos_az * np.sin(lat0) * sin_c))
+        lon = (lon + 180.) % 360. - 180.
+        alt = np.broadcast_to(z + height * FEET_TO_METERS, shape)
+        result = lat, lon, alt
+    for array in result:
+        if array.flags.writeable:
+            array.flags.writeable = False
+    coordinates[name] = result
+    return result
+
+
+def _data_lut(msg_code, threshold_data):
+    """
+    Return lookup tables for scaling and masking the raw data of a product.
 
-        elif msg_code in [170, 172, 173, 174, 175]:
-            # units are 0.01 inches
-            scale, offset = np.fromstring(threshold_data[:8], '>f4')
-            data = (self.raw_data - offset) / (scale) * 0.01
-            mdata = np.ma.array(data, mask=self.raw_data < 1)
+    The tables are cached by message code and threshold data, they should
+    not be modified.
 
-        elif msg_code in [165, 177]:
-            # Corresponds to classifications in table on page 3-37
-            mdata = np.ma.masked_equal(self.raw_data, 0)
+    Parameters
+    ----------
+    msg_code : int
+        Message code of the product.
+    threshold_data : str
+        Threshold data from the product description.
+
+    Returns
+    -------
+    data_lut : array
+        Float32 array with 256 elements containing the scaled data value of
+        each raw data value.
+    mask_lut : array
+        Boolean array with 256 elements, True for raw data values which are
+        masked.
 
-        elif msg_code in [135]:
-            mdata = np.ma.array(self.raw_data - 2, mask=self.raw_data <= 1)
-            mdata[self.raw_data >= 128] -= 128
+    """
+    key = (msg_code, bytes(threshold_data))
+    luts = _DATA_LUT_CACHE.get(key)
+    if luts is None:
+        raw = np.arange(256, dtype='uint8')
+        mdata = _scale_data(msg_code, threshold_data, raw)
+        data_lut = np.ma.getdata(mdata).astype('float32')
+        mask_lut = np.ma.getmaskarray(mdata)
+        data_lut.flags.writeable = False
+        mask_lut.flags.writeable = False
+        luts = data_lut, mask_lut
+        if len(_DATA_LUT_CACHE) >= DATA_LUT_CACHE_SIZE:
+            _DATA_LUT_CACHE.clear()
+        _DATA_LUT_CACHE[key] = luts
+    return luts
+
+
+def _scale_data(msg_code, threshold_data, raw_data):
+    """ Return a masked array of scaled raw data for a product. """
+    if msg_code in _8_OR_16_LEVELS:
+        mdata = _scale_data_8_or_16_levels(threshold_data, raw_data)
+
+    elif msg_code in [134]:
+        mdata = _scale_data_msg_134(threshold_data, raw_data)
+
+    elif msg_code in [94, 99, 182, 186]:
+        hw31, hw32 = np.frombuffer(threshold_data[:4], '>i2')
+        data = (raw_data - 2) * (hw32/10.) + hw31/10.
+        mdata = np.ma.array(data, mask=raw_data < 2)
+
+    elif msg_code in [32]:
+        hw31, hw32 = np.frombuffer(threshold_data[:4], '>i2')
+        data = (raw_data) * (hw32/10.) + hw31/10.
+        mdata = np.ma.array(data, mask=raw_data < 2)
+
+    elif msg_code in [138]:
+        hw31, hw32 = np.frombuffer(threshold_data[:4], '>i2')
+        data = raw_data * (hw32/100.) + hw31/100.
+        mdata = np.ma.array(data)
+
+    elif msg_code in [159, 161, 163]:
+        scale, offset = np.frombuffer(threshold_data[:8], '>f4')
+        data = (raw_data - offset) / (scale)
+        mdata = np.ma.array(data, mask=raw_data < 2)
+
+    elif msg_code in [170, 172, 173, 174, 175]:
+        # units are 0.01 inches
+        scale, offset = np.frombuffer(threshold_data[:8], '>f4')
+        data = (raw_data - offset) / (scale) * 0.01
+        mdata = np.ma.array(data, mask=raw_data < 1)
+
+    elif msg_code in [165, 177]:
+        # Corresponds to classifications in table on page 3-37
+        mdata = np.ma.masked_equal(raw_data, 0)
+
+    elif msg_code in [135]:
+        # values above 128 are flagged as topped
+        data = raw_data - 2.
+        data[raw_data >= 128] -= 128
+        mdata = np.ma.array(data, mask=raw_data <= 1)
 
-        else:
-            assert msg_code in [34]
-            # There does not seem to be any discussion on what this product
-            # contains.
-            mdata = np.ma.array(self.raw_data.copy())
-
-        return mdata.astype('float32')
-
-    def _get_data_8_or_16_levels(self):
-        """ Return a masked array for products with 8 or 16 data levels. """
-        thresh = np.fromstring(self.prod_descr['threshold_data'], '>B')
-        flags = thresh[::2]
-        values = thresh[1::2]
-
-        sign = np.choose(np.bitwise_and(flags, 0x01), [1, -1])
-        bad = np.bitwise_and(flags, 0x80) == 128
-        scale = 1.
-        if flags[0] & 2**5:
-            scale = 1/20.
-        if flags[0] & 2**4:
-            scale = 1/10.
-
-        data_levels = values * sign * scale
-        data_levels[bad] = -999     # sentinal for bad data points
-
-        data = np.choose(self.raw_data, data_levels)
-        mdata = np.ma.masked_equal(data, -999)
-        return mdata
-
-    def _get_data_msg_134(self):
-        """ Return a masked array for product with message code 134. """
-        hw31, hw32, hw33, hw34, hw35 = np.fromstring(
-            self.prod_descr['threshold_data'][:10], '>i2')
-        linear_scale = _int16_to_float16(hw31)
-        linear_offset = _int16_to_float16(hw32)
-        log_start = hw33
-        log_scale = _int16_to_float16(hw34)
-        log_offset = _int16_to_float16(hw35)
-        # linear scale data
-        data = np.zeros(self.raw_data.shape, dtype=np.float32)
-        lin = self.raw_data < log_start
-        data[lin] = ((self.raw_data[lin] - linear_offset) / (linear_scale))
-        # log scale data
-        log = self.raw_data >= log_start
-        data[log] = np.exp((self.raw_data[log] - log_offset) / (log_scale))
-        mdata = np.ma.masked_array(data, mask=self.raw_data < 2)
-        return mdata
+    else:
+        assert msg_code in [34]
+        # There does not seem to be any discussion on what this product
+        # contains.
+        mdata = np.ma.array(raw_data.copy())
+
+    return mdata
+
+
+def _scale_data_8_or_16_levels(threshold_data, raw_data):
+    """ Return a masked array for products with 8 or 16 data levels. """
+    thresh = np.frombuffer(threshold_data, '>B')
+    flags = thresh[::2]
+    values = thresh[1::2]
+
+    sign = np.choose(np.bitwise_and(flags, 0x01), [1, -1])
+    bad = np.bitwise_and(flags, 0x80) == 128
+    scale = 1.
+    if flags[0] & 2**5:
+        scale = 1/20.
+    if flags[0] & 2**4:
+        scale = 1/10.
+
+    data_levels = values * sign * scale
+    data_levels[bad] = -999     # sentinal for bad data points
+
+    # raw data values without a data level are also bad
+    data = np.full(raw_data.shape, -999, dtype=data_levels.dtype)
+    valid = raw_data < len(data_levels)
+    data[valid] = data_levels[raw_data[valid]]
+    mdata = np.ma.masked_equal(data, -999)
+    return mdata
+
+
+def _scale_data_msg_134(threshold_data, raw_data):
+    """ Return a masked array for product with message code 134. """
+    hw31, hw32, hw33, hw34, hw35 = struct.unpack('>5h', threshold_data[:10])
+    linear_scale = _int16_to_float16(hw31)
+    linear_offset = _int16_to_float16(hw32)
+    log_start = hw33
+    log_scale = _int16_to_float16(hw34)
+    log_offset = _int16_to_float16(hw35)
+    # linear scale data
+    data = np.zeros(raw_data.shape, dtype=np.float32)
+    lin = raw_data < log_start
+    data[lin] = ((raw_data[lin] - linear_offset) / (linear_scale))
+    # log scale data
+    log = raw_data >= log_start
+    data[log] = np.exp((raw_data[log] - log_offset) / (log_scale))
+    mdata = np.ma.masked_array(data, mask=raw_data < 2)
+    return mdata
 
 
 def _datetime_from_mdate_mtime(mdate, mtime):
@@ -306,31 +775,436 @@ def _datetime_from_mdate_mtime(mdate, mtime):
     return epoch + timedelta(days=mdate - 1, seconds=mtime)
 
 
+def _decompress_symbology_block(chunks):
+    """
+    Incrementally decompress a bzip2 compressed symbology block.
+
+    Decompressed data is written directly into a buffer sized from the
+    block length in the symbology header, so only a single chunk of the
+    compressed and uncompressed data is held in memory at any time.
+    Decompression stops at the end of the symbology block.  A ValueError is
+    raised when the block length exceeds MAX_SYMBOLOGY_BLOCK_LENGTH.
+
+    Parameters
+    ----------
+    chunks : iterable of str
+        Chunks of the compressed data.
+
+    Returns
+    -------
+    buf2 : bytearray
+        Uncompressed symbology block.
+
+    """
+    decompressor = bz2.BZ2Decompressor()
+    chunks = iter(chunks)
+    buf2 = bytearray(16)    # symbology header
+    pos = 0
+    while pos < len(buf2) and not decompressor.eof:
+        chunk = b''
+        if decompressor.needs_input:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break   # truncated data
+        data = decompressor.decompress(
+            chunk, min(len(buf2) - pos, BZ2_CHUNK_SIZE))
+        buf2[pos:pos + len(data)] = data
+        pos += len(data)
+        if pos == 16 and len(buf2) == 16:
+            # grow the buffer to the length of the symbology block
+            block_length = struct.unpack('>i', bytes(buf2[4:8]))[0]
+            if block_length > MAX_SYMBOLOGY_BLOCK_LENGTH:
+                raise ValueError(
+                    'symbology block length %i exceeds %i bytes, the product '
+                    'is corrupt' % (block_length, MAX_SYMBOLOGY_BLOCK_LENGTH))
+            if block_length > 16:
+                header = buf2
+                buf2 = bytearray(block_length)
+                buf2[:16] = header
+    del buf2[pos:]
+    return buf2
+
+
+def _decode_af1f_radials(buf, pos, nradials, nbins, select_radials=None,
+                         gates=None):
+    """
+    Decode all run length encoded radials in a AF1F packet at once.
+
+    Parameters
+    ----------
+    buf : str
+        Buffer containing the symbology block.
+    pos : int
+        Position of the first radial header in the buffer.
+    nradials, nbins : int
+        Number of radials and range bins in the packet.
+    select_radials : callable, optional
+        Called with the radial headers, returns an index of the radials to
+        decode, by default all radials are decoded.
+    gates : slice, optional
+        Gates to decode, by default all gates.  Runs are only expanded
+        within the range of the selected gates.
+
+    Returns
+    -------
+    radial_headers : structured array
+        Radial headers of the decoded radials, RADIAL_HEADER_DTYPE array.
+    raw_data : array
+        Decoded data, uint8 array of shape (radials, gates).
+
+    """
+    # find the location of every run length encoded radial, nbytes is the
+    # number of halfwords in the radial, each byte holds a run and a color.
+    starts = np.empty((nradials, ), dtype='intp')
+    sizes = np.empty((nradials, ), dtype='intp')
+    for i in range(nradials):
+        starts[i] = pos + 6
+        sizes[i] = struct.unpack_from('>h', buf, pos)[0] * 2
+        pos += 6 + sizes[i]
+    buf_bytes = np.frombuffer(buf, dtype='u1', count=pos)
+
+    # gather the radial headers
+    header_bytes = buf_bytes[(starts - 6)[:, np.newaxis] + np.arange(6)]
+    radial_headers = header_bytes.view(RADIAL_HEADER_DTYPE)[:, 0]
+    if select_radials is not None:
+        radials = select_radials(radial_headers)
+        radial_headers = radial_headers[radials]
+        starts = starts[radials]
+        sizes = sizes[radials]
+        nradials = len(starts)
+    if gates is None:
+        gates = slice(0, nbins)
+    first, last, step = gates.indices(nbins)
+    ngates = max(last - first, 0)
+
+    # gather the run length encoded bytes of the radials
+    cumsizes = np.cumsum(sizes)
+    offsets = np.repeat(starts - (cumsizes - sizes), sizes)
+    rle = buf_bytes[offsets + np.arange(cumsizes[-1] if nradials else 0)]
+    colors = np.bitwise_and(rle, 0b00001111)
+    runs = np.right_shift(rle, 4)
+
+    if first != 0 or last != nbins:
+        # clip the runs of each radial to the selected range of gates
+        run_ends = np.cumsum(runs, dtype='intp')
+        previous = cumsizes - sizes - 1
+        radial_starts = np.where(
+            previous >= 0, run_ends[np.maximum(previous, 0)], 0)
+        run_ends -= np.repeat(radial_starts, sizes)
+        runs = (np.minimum(run_ends, last) -
+                np.maximum(run_ends - runs, first)).clip(0)
+
+    # expand the runs
+    data = np.repeat(colors, runs)
+    run_ends = np.concatenate(([0], np.cumsum(runs, dtype='intp')))
+    radial_starts = run_ends[cumsizes - sizes]
+    radial_ends = run_ends[cumsizes]
+    if np.all(radial_ends - radial_starts == ngates):
+        raw_data = data.reshape(nradials, ngates)
+    else:
+        # radials do not all expand to nbins, truncate or zero pad each
+        raw_data = np.zeros((nradials, ngates), dtype='uint8')
+        for radial, start, end in zip(raw_data, radial_starts, radial_ends):
+            radial_data = data[start:end][:ngates]
+            radial[:len(radial_data)] = radial_data
+    if step != 1:
+        raw_data = np.ascontiguousarray(raw_data[:, ::step])
+    return radial_headers, raw_data
+
+
 def _structure_size(structure):
     """ Find the size of a structure in bytes. """
-    return struct.calcsize('>' + ''.join([i[1] for i in structure]))
+    return _record_class(structure).size
 
 
 def _unpack_from_buf(buf, pos, structure):
     """ Unpack a structure from a buffer. """
-    size = _structure_size(structure)
-    return _unpack_structure(buf[pos:pos + size], structure)
+    return _record_class(structure).unpack_from(buf, pos)
 
 
 def _unpack_structure(string, structure):
     """ Unpack a structure from a string """
+    return _record_class(structure).unpack_from(string)
+
+
+def _record_class(structure):
+    """ Return the record class for a structure, creating it if needed. """
+    record_class = _RECORD_CLASSES.get(structure)
+    if record_class is None:
+        record_class = _make_record_class('Record', structure)
+        _RECORD_CLASSES[structure] = record_class
+    return record_class
+
+
+def _make_record_class(name, structure, doc=None):
+    """ Create a record class with a precompiled decoder for a structure. """
     fmt = '>' + ''.join([i[1] for i in structure])  # NEXRAD is big-endian
-    lst = struct.unpack(fmt, string)
-    return dict(zip([i[0] for i in structure], lst))
+    return type(name, (_Record, ), {
+        '__slots__': tuple([i[0] for i in structure]),
+        '__doc__': doc,
+        '_struct': struct.Struct(fmt),
+        'size': struct.calcsize(fmt),
+    })
+
+
+class _Record(object):
+    """
+    Base class for records of the fields in a NEXRAD Level 3 structure.
+
+    Records store the fields in slots rather than a dictionary and support
+    dictionary style access to the fields by name.  Subclasses are created
+    by _make_record_class.
+
+    """
+    __slots__ = ()
+    _struct = None
+    size = 0
+
+    @classmethod
+    def unpack_from(cls, buf, pos=0):
+        """ Unpack a record from a buffer starting at pos. """
+        record = cls.__new__(cls)
+        values = cls._struct.unpack_from(buf, pos)
+        for name, value in zip(cls.__slots__, values):
+            setattr(record, name, value)
+        return record
+
+    def pack(self):
+        """ Return the record packed into bytes. """
+        return self._struct.pack(*self.values())
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __eq__(self, other):
+        if not hasattr(other, 'items'):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            ['%s=%r' % (k, v) for k, v in self.items()]))
+
+    def keys(self):
+        """ Return a list of the field names. """
+        return list(self.__slots__)
+
+    def values(self):
+        """ Return a list of the field values. """
+        return [getattr(self, k) for k in self.__slots__]
+
+    def items(self):
+        """ Return a list of (name, value) pairs of the fields. """
+        return [(k, getattr(self, k)) for k in self.__slots__]
+
+    def get(self, key, default=None):
+        """ Return the value of a field, default if it does not exist. """
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+
+class StatsAggregator(object):
+    """
+    Process-wide statistics of reading NEXRAD Level 3 files.
+
+    Stage durations are kept in histograms and byte and radial counts in
+    counters, both per message code.  The module level STATS instance is
+    updated by NEXRADLevel3File objects which collect statistics.
+
+    Parameters
+    ----------
+    buckets : sequence of float or None
+        Upper bounds of the histogram buckets in seconds, None for
+        STATS_BUCKETS.
+
+    """
+
+    def __init__(self, buckets=None):
+        """ initalize the object. """
+        if buckets is None:
+            buckets = STATS_BUCKETS
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Discard all statistics. """
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+
+    def observe(self, msg_code, stage, seconds):
+        """ Record the seconds spent in a stage reading a product. """
+        with self._lock:
+            key = (msg_code, stage)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [[0] * (len(self.buckets) + 1), 0, 0.]
+                self._histograms[key] = histogram
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    def count(self, msg_code, stats):
+        """ Add the byte and radial counts of a decoded product. """
+        with self._lock:
+            counters = self._counters.setdefault(msg_code, dict(
+                (name, 0) for name in STATS_COUNTERS))
+            counters['files'] += 1
+            for name in STATS_COUNTERS[1:]:
+                counters[name] += stats[name]
+
+    def as_dict(self):
+        """
+        Return the statistics as a dictionary.
+
+        The dictionary is keyed by message code, each value a dictionary
+        with the counters in STATS_COUNTERS and 'stages', a dictionary
+        keyed by stage of dictionaries with the 'count' and 'sum' of the
+        observations and 'buckets', a list of (upper bound, cumulative
+        count) pairs.
+
+        """
+        with self._lock:
+            result = {}
+            for msg_code, counters in self._counters.items():
+                result[msg_code] = dict(counters, stages={})
+            for (msg_code, stage), histogram in self._histograms.items():
+                if msg_code not in result:
+                    result[msg_code] = dict(
+                        [(name, 0) for name in STATS_COUNTERS], stages={})
+                cumulative = np.cumsum(histogram[0]).tolist()
+                result[msg_code]['stages'][stage] = {
+                    'count': histogram[1],
+                    'sum': histogram[2],
+                    'buckets': list(zip(self.buckets + (float('inf'), ),
+                                        cumulative)),
+                }
+        return result
+
+    def to_prometheus(self, prefix='nexrad_level3'):
+        """ Return the statistics in the Prometheus text format. """
+        stats = self.as_dict()
+        lines = [
+            '# HELP %s_stage_seconds Time spent in each stage of reading '
+            'files.' % (prefix),
+            '# TYPE %s_stage_seconds histogram' % (prefix)]
+        for msg_code in sorted(stats):
+            for stage in sorted(stats[msg_code]['stages']):
+                histogram = stats[msg_code]['stages'][stage]
+                labels = 'code="%i",stage="%s"' % (msg_code, stage)
+                for bound, count in histogram['buckets']:
+                    bound = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_stage_seconds_bucket{%s,le="%s"} %i' % (
+                        prefix, labels, bound, count))
+                lines.append('%s_stage_seconds_sum{%s} %r' % (
+                    prefix, labels, histogram['sum']))
+                lines.append('%s_stage_seconds_count{%s} %i' % (
+                    prefix, labels, histogram['count']))
+        for name in STATS_COUNTERS:
+            lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+            for msg_code in sorted(stats):
+                lines.append('%s_%s_total{code="%i"} %i' % (
+                    prefix, name, msg_code, stats[msg_code][name]))
+        return '\n'.join(lines) + '\n'
 
 
 def nexrad_level3_message_code(filename):
-    """ Return the message (product) code for a NEXRAD Level 3 file. """
-    fhl = open(filename, 'r')
-    buf = fhl.read(48)
-    fhl.close()
-    msg_header = _unpack_from_buf(buf, 30, MESSAGE_HEADER)
-    return msg_header['code']
+    """
+    Return the message (product) code for a NEXRAD Level 3 file.
+
+    Parameters
+    ----------
+    filename : str, file-like or buffer
+        Filename, binary file-like object or buffer of a NEXRAD Level 3
+        file.  Only the first HEADERS_READ_SIZE bytes of files and
+        file-like objects are read.
+
+    """
+    buf = _read_buffer(filename, HEADERS_READ_SIZE)
+    return MessageHeader.unpack_from(buf, _text_header_size(buf))['code']
+
+
+def _text_header_size(buf):
+    """
+    Return the size of the text header at the start of a buffer.
+
+    The text header is the WMO heading and AWIPS identifier lines, 30 bytes
+    unless the heading has a BBB indicator.  30 is returned when the buffer
+    does not start with a text header.
+
+    """
+    match = TEXT_HEADER_RE.match(buf)
+    if match is None:
+        return 30
+    return match.end()
+
+
+def _is_filename(source):
+    """ Return True if source is a filename, False otherwise. """
+    return isinstance(source, str) or hasattr(source, '__fspath__')
+
+
+def _read_buffer(source, size=None):
+    """
+    Return a memoryview of the data in a NEXRAD Level 3 file.
+
+    Parameters
+    ----------
+    source : str, file-like or buffer
+        Filename, binary file-like object or buffer containing the data.
+        Filenames are memory mapped unless size is specified.
+    size : int or None
+        Number of bytes to read from the start of a file or file-like
+        object, None to read all data.
+
+    Returns
+    -------
+    buf : memoryview
+        Byte memoryview of the data.
+
+    """
+    if _is_filename(source):
+        fhandle = open(source, 'rb')
+        try:
+            if size is not None:
+                return memoryview(fhandle.read(size))
+            if os.fstat(fhandle.fileno()).st_size == 0:
+                return memoryview(b'')  # empty files cannot be mapped
+            return memoryview(
+                mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ))
+        finally:
+            fhandle.close()
+    if hasattr(source, 'read'):
+        if size is None:
+            return memoryview(source.read())
+        return memoryview(source.read(size))
+    return memoryview(source).cast('B')
 
 
 # NEXRAD Level III file structures, sizes, and static data
@@ -353,6 +1227,51 @@ def _int16_to_float16(val):
         return (-1)**sign * 2**(exponent-16) * (1 + fraction/2**10.)
 
 
+# size of the chunks of compressed data read when decompressing the
+# symbology block, in bytes.
+BZ2_CHUNK_SIZE = 65536
+
+# largest symbology block length of compressed products, in bytes, larger
+# lengths are from corrupt products.  Blocks of the largest products, 720
+# radials of 1840 gates, are below 2 MB.
+MAX_SYMBOLOGY_BLOCK_LENGTH = 16 * 1024 * 1024
+
+# WMO heading, with optional BBB indicator, and AWIPS identifier lines
+TEXT_HEADER_RE = re.compile(
+    b'[A-Z]{4}[0-9]{2} [A-Z0-9]{4} [0-9]{6}( [A-Z]{3})?\r\r\n'
+    b'[A-Z0-9 ]{1,12}\r\r\n')
+
+# bytes read from files opened lazily, the text, message header and
+# product description blocks.
+HEADERS_READ_SIZE = 256
+
+# maximum number of products whose data lookup tables are cached
+DATA_LUT_CACHE_SIZE = 256
+_DATA_LUT_CACHE = {}
+
+# statistics collection, see NEXRADLevel3File and StatsAggregator
+COLLECT_STATS = False
+STATS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+STATS_COUNTERS = ('files', 'compressed_bytes', 'decompressed_bytes',
+                  'nradials')
+STATS = StatsAggregator()
+
+# gate coordinates cached by radar location, elevation, azimuths and ranges,
+# the least recently used are evicted.  Each entry holds up to four float64
+# arrays of (nradials, nbins), 32 bytes per gate, about 42 MB for a sweep of
+# 720 radials of 1840 gates.
+GATE_COORDINATES_CACHE_SIZE = 8
+_GATE_COORDINATES_CACHE = OrderedDict()
+_GATE_COORDINATES_LOCK = threading.Lock()
+
+EARTH_RADIUS = 6371000.     # mean radius of the earth in meters
+FEET_TO_METERS = 0.3048
+
+# attributes of NEXRADLevel3File read from the symbology block
+_SYMBOLOGY_ATTRS = ('symbology_header', 'packet_header', 'radial_headers',
+                    'raw_data')
+
 _8_OR_16_LEVELS = [19, 20, 25, 27, 28, 30, 56, 78, 79, 80, 169, 171, 181]
 
 PRODUCT_RANGE_RESOLUTION = {
@@ -413,6 +1332,8 @@ MESSAGE_HEADER = (
     ('dest', INT2),     # Destination ID
     ('nblocks', INT2),  # Number of blocks in the message (inclusive)
 )
+MessageHeader = _make_record_class(
+    'MessageHeader', MESSAGE_HEADER, 'Message Header Block record.')
 
 # Graphic Product Message: Product Description Block
 # Description: section 3.3.1.1, page 3-3
@@ -443,6 +1364,9 @@ PRODUCT_DESCRIPTION = (
     ('offset_graphic', INT4),   # halfword offset to Graphic block
     ('offset_tabular', INT4)    # halfword offset to Tabular block
 )
+ProductDescription = _make_record_class(
+    'ProductDescription', PRODUCT_DESCRIPTION,
+    'Product Description Block record.')
 
 # Graphic Product Message: Product Symbology Block
 # Description
@@ -458,6 +1382,8 @@ SYMBOLOGY_HEADER = (
     ('layer_length', INT4)      # Length of data layer in bytes
     # Display data packets
 )
+SymbologyHeader = _make_record_class(
+    'SymbologyHeader', SYMBOLOGY_HEADER, 'Product Symbology Block record.')
 
 # Digital Radial Data Array Packet - Packet Code 16 (Sheet 2)
 # Figure 3-11c (Sheet 1 and 2), page 3-120.
@@ -475,12 +1401,24 @@ RADIAL_PACKET_HEADER = (
     ('range_scale', INT2),      # Range Scale factor
     ('nradials', INT2)          # Total number of radials in the product
 )
+RadialPacketHeader = _make_record_class(
+    'RadialPacketHeader', RADIAL_PACKET_HEADER,
+    'Radial data array packet header record.')
 
 RADIAL_HEADER = (
     ('nbytes', INT2),           # Number of bytes in the radial.
     ('angle_start', INT2),      # Starting angle at which data was collected.
     ('angle_delta', INT2)       # Delta angle from previous radial.
 )
+RADIAL_HEADER_DTYPE = np.dtype([(k, '>' + v) for k, v in RADIAL_HEADER])
+
+# record classes of the structures, others are created when first used
+_RECORD_CLASSES = {
+    MESSAGE_HEADER: MessageHeader,
+    PRODUCT_DESCRIPTION: ProductDescription,
+    SYMBOLOGY_HEADER: SymbologyHeader,
+    RADIAL_PACKET_HEADER: RadialPacketHeader,
+}
 
 # A list of the NEXRAD Level 3 Product supported by this module taken
 # from the "Message Code for Products" Table III pages 3-15 to 3-22
@@ -0,0 +1,146 @@
+"""
+nexrad_level3_batch
+===================
+
+Reading many NEXRAD Level 3 files in parallel.
+
+.. autosummary::
+    :toctree: generated/
+
+    read_many
+    _read_fields
+    _stack_results
+
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from nexrad_level3 import NEXRADLevel3File
+
+# fields which can be requested from read_many and the value used to pad
+# arrays of files with fewer radials or bins when results are stacked.
+READ_MANY_FIELDS = {
+    'raw_data': 0,
+    'data': np.nan,
+    'azimuth': np.nan,
+    'range': np.nan,
+    'elevation': np.nan,
+    'time': None,
+}
+
+
+def read_many(filenames, workers=None, fields=None, stack=False, lazy=False):
+    """
+    Read many NEXRAD Level 3 files using a pool of processes.
+
+    Parameters
+    ----------
+    filenames : list of str
+        Filenames of the NEXRAD Level 3 files to read.
+    workers : int or None
+        Number of worker processes, None uses one per CPU.  When 1 the
+        files are read in the calling process.
+    fields : list of str or None
+        Fields to return for each file, any of the keys in
+        READ_MANY_FIELDS.  None returns the NEXRADLevel3File objects,
+        only valid when stack is False.
+    stack : bool
+        True to stack the fields of all files into arrays, False to return
+        a list with the results for each file.
+    lazy : bool
+        Passed to NEXRADLevel3File, only useful when fields are limited to
+        elevation and time.
+
+    Returns
+    -------
+    results : list or dict
+        When stack is False, a list with a NEXRADLevel3File or a dictionary
+        of fields for each file, in the order of filenames.  Files which
+        could not be read have the raised exception in their place.
+        When stack is True, a dictionary of arrays with the stacked fields
+        of all files read successfully.  Files with fewer radials or bins
+        are padded with the values in READ_MANY_FIELDS.  The 'filenames' key
+        lists the files stacked and 'errors' maps the filenames of the files
+        which could not be read to the raised exception.
+
+    """
+    if fields is None and stack:
+        raise ValueError('fields must be specified when stacking results')
+    if fields is not None:
+        for field in fields:
+            if field not in READ_MANY_FIELDS:
+                raise ValueError('unknown field: %s' % (field))
+    filenames = list(filenames)
+    args = [(filename, fields, lazy) for filename in filenames]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        results = [_read_fields(arg) for arg in args]
+    else:
+        chunksize = max(1, len(args) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_read_fields, args,
+                                        chunksize=chunksize))
+
+    if stack:
+        return _stack_results(filenames, results, fields)
+    return results
+
+
+def _read_fields(args):
+    """ Read fields from a file, return the exception raised on failure. """
+    filename, fields, lazy = args
+    try:
+        nfile = NEXRADLevel3File(filename, lazy=lazy)
+        if fields is None:
+            return nfile
+        results = {}
+        for field in fields:
+            if field == 'raw_data':
+                results[field] = np.asarray(nfile.raw_data)
+            elif field == 'data':
+                results[field] = nfile.get_data().filled(np.nan)
+            elif field == 'azimuth':
+                results[field] = nfile.get_azimuth()
+            elif field == 'range':
+                results[field] = nfile.get_range()
+            elif field == 'elevation':
+                results[field] = nfile.get_elevation()
+            else:
+                assert field == 'time'
+                results[field] = nfile.get_volume_start_datetime()
+        return results
+    except Exception as error:
+        return error
+
+
+def _stack_results(filenames, results, fields):
+    """ Stack the fields of successfully read files into arrays. """
+    read = [(f, r) for f, r in zip(filenames, results)
+            if not isinstance(r, Exception)]
+    stacked = {
+        'filenames': [f for f, _ in read],
+        'errors': dict((f, r) for f, r in zip(filenames, results)
+                       if isinstance(r, Exception)),
+    }
+    for field in fields:
+        values = [r[field] for _, r in read]
+        if field == 'time':
+            stacked[field] = np.array(values, dtype='datetime64[s]')
+            continue
+        if field == 'elevation':
+            stacked[field] = np.array(values, dtype='float32')
+            continue
+        shape = (len(values), ) + tuple(
+            np.max([v.shape for v in values], axis=0) if values else
+            (0, ) * (2 if field in ['raw_data', 'data'] else 1))
+        dtype = 'uint8' if field == 'raw_data' else 'float32'
+        array = np.full(shape, READ_MANY_FIELDS[field], dtype=dtype)
+        for out, value in zip(array, values):
+            out[tuple(slice(0, i) for i in value.shape)] = value
+        stacked[field] = array
+    return stacked
@@ -0,0 +1,325 @@
+"""
+nexrad_level3_catalog
+=====================
+
+Persistent SQLite catalog of NEXRAD Level 3 files.
+
+.. autosummary::
+    :toctree: generated/
+    :template: dev_template.rst
+
+    Catalog
+
+.. autosummary::
+    :toctree: generated/
+
+    _read_rows
+    _read_row
+    _datetime_to_seconds
+
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from nexrad_level3 import (NEXRADLevel3File, MessageHeader, ProductDescription,
+                           MESSAGE_HEADER, PRODUCT_DESCRIPTION,
+                           _text_header_size)
+from nexrad_level3_scan import (_iter_paths, _batches, _map_bounded,
+                                _parse_text_header, _MAX_PENDING)
+
+# number of files read by a thread in one task
+_BATCH_SIZE = 64
+
+# SQLite column types of the structure element formats
+_SQLITE_TYPES = {'B': 'INTEGER', 'h': 'INTEGER', 'i': 'INTEGER',
+                 'I': 'INTEGER', 'f': 'REAL'}
+
+# columns of the products table, the message header and product
+# description fields are prefixed with msg_ and prod_.
+_FILE_COLUMNS = (
+    ('path', 'TEXT PRIMARY KEY'),
+    ('size', 'INTEGER'),            # file size in bytes
+    ('mtime_ns', 'INTEGER'),        # file modification time
+    ('hash', 'TEXT'),               # SHA-1 of the file content
+    ('wmo_header', 'TEXT'),
+    ('site', 'TEXT'),
+    ('volume_start', 'INTEGER'),    # volume scan start, sec since 1/1/1970
+    ('elevation', 'REAL'),          # elevation angle in degrees
+    ('symbology_offset', 'INTEGER'),    # byte offset of symbology block
+    ('compressed', 'INTEGER'),      # 1 if the symbology block is compressed
+)
+_COLUMNS = _FILE_COLUMNS + tuple(
+    [('msg_' + k, _SQLITE_TYPES.get(v, 'BLOB')) for k, v in MESSAGE_HEADER] +
+    [('prod_' + k, _SQLITE_TYPES.get(v, 'BLOB')) for k, v in
+     PRODUCT_DESCRIPTION])
+COLUMNS = tuple([c[0] for c in _COLUMNS])
+
+
+class Catalog(object):
+    """
+    A persistent catalog of NEXRAD Level 3 files stored in SQLite.
+
+    The catalog stores one row per file with the message header and product
+    description fields, the location of the symbology block and a hash of
+    the file content.  Rows are indexed by site, message code and volume
+    start time.
+
+    Parameters
+    ----------
+    database : str
+        Filename of the SQLite database, created if it does not exist.
+        ':memory:' creates a temporary in-memory catalog.
+
+    Attributes
+    ----------
+    database : str
+        Filename of the SQLite database.
+    connection : sqlite3.Connection
+        Connection to the database.
+
+    """
+
+    def __init__(self, database):
+        """ initalize the object. """
+        self.database = database
+        self.connection = sqlite3.connect(database)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS products (%s)' % (
+                    ', '.join(['%s %s' % column for column in _COLUMNS])))
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS products_site_code_time ON '
+                'products (site, msg_code, volume_start)')
+
+    def close(self):
+        """ Close the connection to the database. """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM products WHERE msg_code IS NOT NULL'
+        ).fetchone()[0]
+
+    def update(self, paths, workers=None, prune=True):
+        """
+        Add or update the files in paths to the catalog.
+
+        Only files whose size or modification time differ from those in the
+        catalog are read.  The database itself is skipped.  Files which are
+        not NEXRAD Level 3 files are recorded with empty metadata so they
+        are not read again.
+
+        Parameters
+        ----------
+        paths : str or list of str
+            Files or directories to add, directories are scanned
+            recursively.
+        workers : int or None
+            Number of threads reading files, None for the
+            ThreadPoolExecutor default.
+        prune : bool
+            True to remove files which no longer exist in the scanned
+            directories from the catalog.  Files below directories which
+            could not be scanned are kept.
+
+        Returns
+        -------
+        counts : dict
+            Number of files 'added', 'updated', 'unchanged' and 'removed'.
+
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        known = dict(
+            (path, (size, mtime_ns)) for path, size, mtime_ns in
+            self.connection.execute(
+                'SELECT path, size, mtime_ns FROM products'))
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+        seen = set()
+        missing = []
+        insert = 'INSERT OR REPLACE INTO products (%s) VALUES (%s)' % (
+            ', '.join(COLUMNS), ', '.join(['?'] * len(COLUMNS)))
+
+        database = os.path.abspath(self.database)
+        unscanned = {}
+        batches = _batches(
+            (p for p in _iter_paths(paths, False, unscanned)
+             if os.path.abspath(p) != database), _BATCH_SIZE)
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                self.connection:
+            for rows in _map_bounded(executor, lambda b: _read_rows(b, known),
+                                     batches, _MAX_PENDING):
+                for path, row in rows:
+                    if row is None:
+                        missing.append(path)
+                        continue
+                    seen.add(path)
+                    if row is True:
+                        counts['unchanged'] += 1
+                        continue
+                    counts['updated' if path in known else 'added'] += 1
+                    self.connection.execute(insert, row)
+
+            if prune:
+                roots = [os.path.join(p, '') for p in paths
+                         if os.path.isdir(p)]
+                kept = tuple([os.path.join(d, '') for d in unscanned])
+                missing.extend([
+                    path for path in known if path not in seen and
+                    any(path.startswith(root) for root in roots) and
+                    not path.startswith(kept)])
+            missing = [path for path in missing if path in known]
+            self.connection.executemany(
+                'DELETE FROM products WHERE path = ?',
+                [(path, ) for path in missing])
+            counts['removed'] = len(missing)
+        return counts
+
+    def query(self, site=None, code=None, start=None, end=None,
+              elevation=None, elevation_tolerance=0.05):
+        """
+        Return the paths of the files matching all given criteria.
+
+        Parameters
+        ----------
+        site : str, optional
+            Three letter site identifier, for example 'BMX'.
+        code : int, optional
+            Message (product) code.
+        start, end : datetime, optional
+            Earliest and latest volume start time, inclusive.  Naive
+            datetimes are in UTC.
+        elevation : float, optional
+            Elevation angle in degrees.
+        elevation_tolerance : float
+            Maximum difference from elevation in degrees.
+
+        Returns
+        -------
+        paths : list of str
+            Paths of the matching files ordered by volume start time.
+
+        """
+        conditions = ['msg_code IS NOT NULL']
+        params = []
+        if site is not None:
+            conditions.append('site = ?')
+            params.append(site)
+        if code is not None:
+            conditions.append('msg_code = ?')
+            params.append(code)
+        if start is not None:
+            conditions.append('volume_start >= ?')
+            params.append(_datetime_to_seconds(start))
+        if end is not None:
+            conditions.append('volume_start <= ?')
+            params.append(_datetime_to_seconds(end))
+        if elevation is not None:
+            conditions.append('elevation BETWEEN ? AND ?')
+            params.extend([elevation - elevation_tolerance,
+                           elevation + elevation_tolerance])
+        sql = 'SELECT path FROM products WHERE %s ORDER BY volume_start, path'
+        cursor = self.connection.execute(
+            sql % (' AND '.join(conditions)), params)
+        return [row[0] for row in cursor]
+
+    def open(self, lazy=False, **kwargs):
+        """
+        Return NEXRADLevel3File objects for the files matching a query.
+
+        Parameters
+        ----------
+        lazy : bool
+            Passed to NEXRADLevel3File.
+        kwargs :
+            Criteria passed to query.
+
+        Returns
+        -------
+        nfiles : list of NEXRADLevel3File
+            Opened files ordered by volume start time.
+
+        """
+        return [NEXRADLevel3File(path, lazy=lazy)
+                for path in self.query(**kwargs)]
+
+    def get_row(self, path):
+        """ Return a dictionary of the catalog columns of a file. """
+        cursor = self.connection.execute(
+            'SELECT %s FROM products WHERE path = ?' % (', '.join(COLUMNS)),
+            (path, ))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(path)
+        return dict(zip(COLUMNS, row))
+
+
+def _read_rows(paths, known):
+    """
+    Return a list of (path, row) for a list of paths.
+
+    row is None for files which do not exist, True for files which are
+    unchanged from known and a tuple of column values otherwise.
+
+    """
+    rows = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            rows.append((path, None))
+            continue
+        if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+            rows.append((path, True))
+            continue
+        try:
+            rows.append((path, _read_row(path, stat)))
+        except OSError:
+            rows.append((path, None))
+    return rows
+
+
+def _read_row(path, stat):
+    """ Return the catalog columns of a file as a tuple. """
+    with open(path, 'rb') as fhandle:
+        buf = fhandle.read()
+    file_columns = (path, stat.st_size, stat.st_mtime_ns,
+                    hashlib.sha1(buf).hexdigest())
+    empty = (None, ) * (len(_COLUMNS) - len(file_columns))
+    bpos = _text_header_size(buf)
+    if len(buf) < bpos + 120:
+        return file_columns + empty
+    msg_header = MessageHeader.unpack_from(buf, bpos)
+    prod_descr = ProductDescription.unpack_from(buf, bpos + 18)
+    if prod_descr['divider'] != -1:
+        return file_columns + empty
+
+    wmo_header, site = _parse_text_header(buf[:bpos])
+    volume_start = ((prod_descr['vol_scan_date'] - 1) * 86400 +
+                    prod_descr['vol_scan_time'])
+    elevation = round(
+        struct.unpack('>h', prod_descr['halfwords_30'])[0] * 0.1, 1)
+    symbology_offset = bpos + 2 * prod_descr['offet_symbology']
+    compressed = int(buf[bpos + 120:bpos + 122] == b'BZ')
+    return (file_columns +
+            (wmo_header, site, volume_start, elevation, symbology_offset,
+             compressed) +
+            tuple(msg_header.values()) + tuple(prod_descr.values()))
+
+
+def _datetime_to_seconds(value):
+    """ Return the seconds since 1 Jan, 1970 of a naive UTC datetime. """
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return int((value - datetime(1970, 1, 1)).total_seconds())
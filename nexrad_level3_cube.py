@@ -0,0 +1,149 @@
+"""
+nexrad_level3_cube
+==================
+
+Stacking many NEXRAD Level 3 files of one site and product into a
+(time, azimuth, range) cube.
+
+.. autosummary::
+    :toctree: generated/
+
+    build_cube
+    _open
+    _grow
+
+"""
+
+import numpy as np
+
+from nexrad_level3 import NEXRADLevel3File, _data_lut
+
+
+def build_cube(sources, scaled=True, fill_value=np.nan, shape=None):
+    """
+    Stack the data of NEXRAD Level 3 files of one site and product.
+
+    The cube is allocated once and each file is decoded directly into its
+    time slice, so memory use is bounded by the size of the cube and one
+    decoded file.  Files with fewer radials or bins than the cube are
+    padded.  When a file has more radials or bins than the cube the cube is
+    enlarged, which copies it, pass shape to avoid this.
+
+    Parameters
+    ----------
+    sources : list of str or NEXRADLevel3File
+        Filenames of the files, for example from Catalog.query, or files
+        which have already been read, in time order.
+    scaled : bool
+        True to store the scaled data as float32 in the 'data' cube, False
+        to store the raw data as uint8 in the 'raw_data' cube together
+        with the lookup tables which scale them.
+    fill_value : float
+        Value of masked and padded gates in the 'data' cube.
+    shape : tuple of int, optional
+        Number of radials and bins of the cube, by default those of the
+        first file.
+
+    Returns
+    -------
+    cube : dict
+        'data' (float32, time x azimuth x range) when scaled, otherwise
+        'raw_data' (uint8, time x azimuth x range, padded with 0),
+        'data_lut' (float32, time x 256) and 'mask_lut' (bool, time x 256).
+        'azimuth' (float32, time x azimuth) and 'range' (float32, time x
+        range) are the coordinates of each file, NaN where padded.  'time'
+        (datetime64[s]) and 'elevation' (float32) are the volume start
+        times and elevation angles.  'msg_code' is the message code of the
+        product.  'filenames' lists the files stacked and 'errors' maps the
+        files which could not be read, or which are of a different site or
+        product than the first file, to the exception raised.
+
+    """
+    sources = list(sources)
+    ntimes = len(sources)
+    stacked = []
+    errors = {}
+    cube = None
+    for source in sources:
+        try:
+            nfile = _open(source)
+            if cube is None:
+                msg_code = nfile.msg_header['code']
+                location = nfile.get_location()[:2]
+                nradials, nbins = shape or nfile.raw_data.shape
+                cube = {
+                    'azimuth': np.full((ntimes, nradials), np.nan, 'float32'),
+                    'range': np.full((ntimes, nbins), np.nan, 'float32'),
+                    'time': np.zeros((ntimes, ), 'datetime64[s]'),
+                    'elevation': np.zeros((ntimes, ), 'float32'),
+                }
+                if scaled:
+                    cube['data'] = np.full(
+                        (ntimes, nradials, nbins), fill_value, 'float32')
+                else:
+                    cube['raw_data'] = np.zeros(
+                        (ntimes, nradials, nbins), 'uint8')
+                    cube['data_lut'] = np.zeros((ntimes, 256), 'float32')
+                    cube['mask_lut'] = np.ones((ntimes, 256), 'bool')
+            if nfile.msg_header['code'] != msg_code:
+                raise ValueError('message code %i differs from %i' % (
+                    nfile.msg_header['code'], msg_code))
+            if nfile.get_location()[:2] != location:
+                raise ValueError('radar location differs from first file')
+        except Exception as error:
+            errors[source] = error
+            continue
+
+        nradials, nbins = nfile.raw_data.shape
+        if (nradials > cube['azimuth'].shape[1] or
+                nbins > cube['range'].shape[1]):
+            _grow(cube, nradials, nbins, fill_value)
+        i = len(stacked)
+        window = (i, slice(0, nradials), slice(0, nbins))
+        if scaled:
+            nfile.get_data(out=cube['data'][window], fill_value=fill_value,
+                           masked=False)
+        else:
+            cube['raw_data'][window] = nfile.raw_data
+            cube['data_lut'][i], cube['mask_lut'][i] = _data_lut(
+                msg_code, nfile.prod_descr['threshold_data'])
+        cube['azimuth'][i, :nradials] = nfile.get_azimuth()
+        cube['range'][i, :nbins] = nfile.get_range()
+        cube['time'][i] = nfile.get_volume_start_datetime()
+        cube['elevation'][i] = nfile.get_elevation()
+        stacked.append(source)
+
+    if cube is None:
+        raise ValueError('none of the files could be read')
+    # drop the slices of files which were not stacked, without copying
+    for key in cube:
+        cube[key] = cube[key][:len(stacked)]
+    cube['msg_code'] = msg_code
+    cube['filenames'] = stacked
+    cube['errors'] = errors
+    return cube
+
+
+def _open(source):
+    """ Return a NEXRADLevel3File for a filename or file. """
+    if isinstance(source, NEXRADLevel3File):
+        return source
+    return NEXRADLevel3File(source)
+
+
+def _grow(cube, nradials, nbins, fill_value):
+    """ Enlarge the arrays of a cube to hold nradials and nbins. """
+    ntimes, old_nradials = cube['azimuth'].shape
+    old_nbins = cube['range'].shape[1]
+    nradials = max(nradials, old_nradials)
+    nbins = max(nbins, old_nbins)
+    for key, shape, fill in [
+            ('azimuth', (ntimes, nradials), np.nan),
+            ('range', (ntimes, nbins), np.nan),
+            ('data', (ntimes, nradials, nbins), fill_value),
+            ('raw_data', (ntimes, nradials, nbins), 0)]:
+        if key not in cube:
+            continue
+        array = np.full(shape, fill, cube[key].dtype)
+        array[tuple(slice(0, i) for i in cube[key].shape)] = cube[key]
+        cube[key] = array
@@ -0,0 +1,425 @@
+"""
+nexrad_level3_encode
+====================
+
+Writing NEXRAD Level 3 radial products and generating synthetic products
+for load testing.
+
+.. autosummary::
+    :toctree: generated/
+
+    encode_product
+    encode_file
+    generate_products
+    write_products
+    _is_compressed
+    _copy_record
+    _run_length_encode
+    _pack_radials
+    _synthetic_raw_data
+
+"""
+
+import bz2
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from nexrad_level3 import (NEXRADLevel3File, AF1F, SUPPORTED_PACKET_CODES,
+                           RADIAL_HEADER_DTYPE, SymbologyHeader, _data_lut)
+
+# halfword offset of the symbology block, the message header and product
+# description blocks.
+_SYMBOLOGY_OFFSET = 60
+
+# longest run of a byte in an AF1F run length encoded radial
+_MAX_RUN = 15
+
+# elevation angles, in tenths of degrees, of the synthetic products
+_ELEVATIONS = (5, 9, 13, 18, 24, 31, 40, 51, 64, 80, 100, 125, 156, 195)
+
+
+def encode_product(text_header, msg_header, prod_descr, packet_header,
+                   radial_headers, raw_data, compress=False):
+    """
+    Encode a NEXRAD Level 3 radial product.
+
+    The header records are copied and the fields describing the layout of
+    the product (lengths, offsets, number of blocks, radials and bins) are
+    set from the data, the other fields are written as given.  The
+    symbology block contains a single layer with a packet code 16 or AF1F
+    packet, as given by the packet code of packet_header.  Packet code 16
+    radials are padded to an even number of bytes and AF1F radials are run
+    length encoded.
+
+    Parameters
+    ----------
+    text_header : bytes
+        Text header written before the message header.
+    msg_header, prod_descr, packet_header : MessageHeader,
+            ProductDescription, RadialPacketHeader
+        Header records of the product.
+    radial_headers : structured array
+        Radial headers, only the angle_start and angle_delta fields are
+        used.
+    raw_data : array
+        Raw data of shape (nradials, nbins), values must be less than 16 for
+        AF1F packets.
+    compress : bool
+        True to compress the symbology block with bzip2.  For packet code 16
+        products the compression method and uncompressed size in halfwords
+        51 to 53 of the product description are also set.
+
+    Returns
+    -------
+    product : bytes
+        The encoded product, read by NEXRADLevel3File.
+
+    """
+    raw_data = np.asarray(raw_data)
+    if raw_data.ndim != 2 or len(radial_headers) != raw_data.shape[0]:
+        raise ValueError('raw_data must have shape (nradials, nbins)')
+    nradials, width = raw_data.shape
+    packet_header = _copy_record(packet_header)
+    packet_code = packet_header['packet_code']
+    if packet_code not in SUPPORTED_PACKET_CODES:
+        raise ValueError('unsupported packet code: %i' % (packet_code))
+    if not packet_header['nbins'] <= width <= packet_header['nbins'] + 1:
+        # the packet nbins may be one less than the padded radials
+        packet_header['nbins'] = width
+    packet_header['nradials'] = nradials
+
+    if packet_code == AF1F:
+        if raw_data.size and raw_data.max() > _MAX_RUN:
+            raise ValueError('AF1F data values must be less than 16')
+        body, counts = _run_length_encode(raw_data)
+        nbytes = counts // 2    # halfwords
+    else:
+        body = np.zeros((nradials, width + width % 2), dtype='uint8')
+        body[:, :width] = raw_data
+        counts = np.full((nradials, ), body.shape[1], dtype='intp')
+        body = body.ravel()
+        nbytes = counts
+    packets = _pack_radials(radial_headers, nbytes, body, counts)
+
+    layer_length = packet_header.size + len(packets)
+    symbology_header = SymbologyHeader.unpack_from(struct.pack(
+        '>hhihhi', -1, 1, 16 + layer_length, 1, -1, layer_length))
+    block = symbology_header.pack() + packet_header.pack() + packets
+
+    prod_descr = _copy_record(prod_descr)
+    prod_descr['offet_symbology'] = _SYMBOLOGY_OFFSET
+    prod_descr['offset_graphic'] = 0
+    prod_descr['offset_tabular'] = 0
+    if packet_code == 16:
+        hw47_53 = bytearray(prod_descr['halfwords_47_53'])
+        hw47_53[8:14] = struct.pack(
+            '>hi', int(compress), len(block) if compress else 0)
+        prod_descr['halfwords_47_53'] = bytes(hw47_53)
+    if compress:
+        # smallest bzip2 block size holding the block, as in NWS products
+        block = bz2.compress(
+            block, min(max(-(-len(block) // 100000), 1), 9))
+
+    msg_header = _copy_record(msg_header)
+    msg_header['length'] = msg_header.size + prod_descr.size + len(block)
+    msg_header['nblocks'] = 3
+    return b''.join([bytes(text_header), msg_header.pack(),
+                     prod_descr.pack(), block])
+
+
+def encode_file(nfile, compress=None):
+    """
+    Encode the headers and data of a NEXRADLevel3File.
+
+    Parameters
+    ----------
+    nfile : NEXRADLevel3File
+        File to encode.  Files decoded with a range window or gate stride
+        cannot be encoded, files decoded with a sector or radial stride are
+        encoded with the selected radials.
+    compress : bool or None
+        Passed to encode_product, None to compress packet code 16 products
+        whose product description gives a compression method.
+
+    Returns
+    -------
+    product : bytes
+        The encoded product.
+
+    """
+    if nfile._first_gate != 0 or nfile._gate_stride != 1:
+        raise ValueError('files decoded with a range window or gate stride '
+                         'cannot be encoded')
+    if compress is None:
+        compress = _is_compressed(nfile)
+    return encode_product(
+        nfile.text_header, nfile.msg_header, nfile.prod_descr,
+        nfile.packet_header, nfile.radial_headers, nfile.raw_data, compress)
+
+
+def generate_products(templates, count=None, seed=None, compress=None):
+    """
+    Generate synthetic NEXRAD Level 3 products.
+
+    Each product is based on a template chosen at random, whose product
+    code, threshold data, packet code and number of radials and bins are
+    kept.  The site, location, volume start time, elevation angle,
+    azimuths of the radials and data are random.  The data has patches of
+    valid values of the product, separated by gates with no data.
+
+    Parameters
+    ----------
+    templates : list of str, buffers or NEXRADLevel3File
+        Filenames, buffers or files of the template products, for example
+        one file of each product code in SUPPORTED_PRODUCTS.
+    count : int or None
+        Number of products to generate, None to generate products without
+        end.
+    seed : int or None
+        Seed of the random number generator, None for a random seed.
+    compress : bool or None
+        Passed to encode_product, None to compress the products whose
+        template is compressed.
+
+    Yields
+    ------
+    name : str
+        Name of the product in the style of the sample data filenames,
+        for example KBMX_SDUS54_N0QBMX_201501020205.
+    product : bytes
+        The encoded product.
+
+    """
+    templates = [t if isinstance(t, NEXRADLevel3File) else
+                 NEXRADLevel3File(t) for t in templates]
+    if not templates:
+        raise ValueError('at least one template is required')
+    rng = np.random.default_rng(seed)
+    letters = np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', dtype='uint8')
+    first_day = (datetime(2010, 1, 1) - datetime(1970, 1, 1)).days
+    last_day = (datetime(2026, 1, 1) - datetime(1970, 1, 1)).days
+    generated = 0
+    while count is None or generated < count:
+        nfile = templates[rng.integers(len(templates))]
+        site = letters[rng.integers(len(letters), size=3)].tobytes()
+        day = int(rng.integers(first_day, last_day))
+        seconds = int(rng.integers(0, 86400 // 60)) * 60
+        start = datetime.utcfromtimestamp(day * 86400 + seconds)
+
+        wmo_header, awips_id = bytes(nfile.text_header).split(b'\r\r\n')[:2]
+        wmo = wmo_header[:6]
+        awips = awips_id[:3]
+        text_header = b'%s K%s %s\r\r\n%s%s\r\r\n' % (
+            wmo, site, start.strftime('%d%H%M').encode('ascii'), awips,
+            site)
+        name = 'K%s_%s_%s%s_%s' % (
+            site.decode('ascii'), wmo.decode('ascii'),
+            awips.decode('ascii'), site.decode('ascii'),
+            start.strftime('%Y%m%d%H%M'))
+
+        msg_header = _copy_record(nfile.msg_header)
+        msg_header['date'] = day + 1
+        msg_header['time'] = seconds
+        prod_descr = _copy_record(nfile.prod_descr)
+        prod_descr['latitude'] = int(rng.integers(25000, 49000))
+        prod_descr['longitude'] = int(rng.integers(-125000, -67000))
+        prod_descr['height'] = int(rng.integers(0, 5000))
+        prod_descr['sequence_num'] = int(rng.integers(1, 32768))
+        prod_descr['vol_scan_num'] = int(rng.integers(1, 81))
+        prod_descr['vol_scan_date'] = day + 1
+        prod_descr['vol_scan_time'] = seconds
+        prod_descr['product_date'] = day + 1
+        prod_descr['product_time'] = seconds
+        if nfile.prod_descr['elevation_num'] > 0:
+            # products of a single elevation
+            elevation_num = int(rng.integers(len(_ELEVATIONS)))
+            prod_descr['elevation_num'] = elevation_num + 1
+            prod_descr['halfwords_30'] = struct.pack(
+                '>h', _ELEVATIONS[elevation_num])
+
+        # radials of the template spacing starting at a random azimuth
+        nradials, nbins = nfile.raw_data.shape
+        delta = int(np.median(nfile.radial_headers['angle_delta']))
+        radial_headers = np.zeros((nradials, ), dtype=RADIAL_HEADER_DTYPE)
+        radial_headers['angle_start'] = (
+            rng.integers(0, 3600) + np.arange(nradials) * delta +
+            rng.integers(-1, 2, size=nradials)) % 3600
+        radial_headers['angle_delta'] = delta
+
+        packet_code = nfile.packet_header['packet_code']
+        _, mask_lut = _data_lut(nfile.msg_header['code'],
+                                nfile.prod_descr['threshold_data'])
+        levels = _MAX_RUN + 1 if packet_code == AF1F else 256
+        raw_data = _synthetic_raw_data(
+            rng, (nradials, nbins), mask_lut[:levels], packet_code == 16)
+
+        product_compress = compress
+        if product_compress is None:
+            product_compress = _is_compressed(nfile)
+        yield name, encode_product(
+            text_header, msg_header, prod_descr, nfile.packet_header,
+            radial_headers, raw_data, product_compress)
+        generated += 1
+
+
+def write_products(templates, directory, count, seed=None, compress=None):
+    """
+    Write synthetic NEXRAD Level 3 products to a directory.
+
+    Parameters
+    ----------
+    templates : list of str, buffers or NEXRADLevel3File
+        Template products, see generate_products.
+    directory : str
+        Directory in which the products are written, created if it does
+        not exist.
+    count : int
+        Number of products to write.
+    seed : int or None
+        Seed of the random number generator, None for a random seed.
+    compress : bool or None
+        Passed to generate_products.
+
+    Returns
+    -------
+    paths : list of str
+        Paths of the files written, files with the same name as an earlier
+        product are overwritten.
+
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = []
+    for name, product in generate_products(templates, count, seed, compress):
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as fhandle:
+            fhandle.write(product)
+        paths.append(path)
+    return paths
+
+
+def _is_compressed(nfile):
+    """ Return True if the product description gives a compression method. """
+    # halfword 51 of packet code 16 products, the method, 1 for bzip2
+    return (nfile.packet_header['packet_code'] == 16 and
+            nfile.prod_descr['halfwords_47_53'][8:10] != b'\x00\x00')
+
+
+def _copy_record(record):
+    """ Return a copy of a header record. """
+    return type(record).unpack_from(record.pack())
+
+
+def _run_length_encode(raw_data):
+    """
+    Run length encode all radials of an AF1F packet at once.
+
+    Each byte holds a run of up to 15 gates in the upper four bits and the
+    value in the lower four bits.  Radials with an odd number of bytes are
+    padded with an empty run to a whole number of halfwords.
+
+    Returns
+    -------
+    body : array
+        Uint8 array of the encoded bytes of all radials.
+    counts : array
+        Number of bytes of each radial.
+
+    """
+    nradials, nbins = raw_data.shape
+    if nbins == 0:
+        return (np.zeros((0, ), dtype='uint8'),
+                np.zeros((nradials, ), dtype='intp'))
+    flat = raw_data.ravel()
+
+    # runs of equal values, every radial starts a new run
+    change = np.empty(flat.shape, dtype=bool)
+    change[0] = True
+    np.not_equal(flat[1:], flat[:-1], out=change[1:])
+    change[::nbins] = True
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, flat.size))
+
+    # split runs longer than _MAX_RUN into pieces
+    npieces = (lengths + _MAX_RUN - 1) // _MAX_RUN
+    first_pieces = np.cumsum(npieces) - npieces
+    piece = np.arange(first_pieces[-1] + npieces[-1]) - np.repeat(
+        first_pieces, npieces)
+    runs = np.minimum(np.repeat(lengths, npieces) - piece * _MAX_RUN,
+                      _MAX_RUN)
+    body = np.left_shift(runs, 4).astype('uint8')
+    body |= np.repeat(flat[starts], npieces).astype('uint8')
+    counts = np.bincount(np.repeat(starts // nbins, npieces),
+                         minlength=nradials)
+
+    # pad radials with an odd number of bytes
+    odd = counts % 2 == 1
+    body = np.insert(body, np.cumsum(counts)[odd], 0)
+    counts += odd
+    return body, counts
+
+
+def _pack_radials(radial_headers, nbytes, body, counts):
+    """
+    Return the radials of a packet, each a radial header and its bytes.
+
+    The radial headers have the nbytes and the angle_start and angle_delta
+    of radial_headers, the bytes of the radials are counts bytes of body.
+
+    """
+    sizes = counts + 6
+    ends = np.cumsum(sizes)
+    out = np.zeros((ends[-1] if len(ends) else 0, ), dtype='uint8')
+    headers = np.zeros((len(counts), ), dtype=RADIAL_HEADER_DTYPE)
+    headers['nbytes'] = nbytes
+    headers['angle_start'] = radial_headers['angle_start']
+    headers['angle_delta'] = radial_headers['angle_delta']
+    starts = ends - sizes
+    out[starts[:, np.newaxis] + np.arange(6)] = (
+        headers.view('uint8').reshape(-1, 6))
+    cumcounts = np.cumsum(counts)
+    offsets = np.repeat(starts + 6 - (cumcounts - counts), counts)
+    out[offsets + np.arange(len(body))] = body
+    return out.tobytes()
+
+
+def _synthetic_raw_data(rng, shape, mask_lut, noise):
+    """
+    Return synthetic raw data with patches of valid values.
+
+    Parameters
+    ----------
+    rng : Generator
+        Random number generator.
+    shape : tuple of int
+        Shape of the data, (nradials, nbins).
+    mask_lut : array
+        Boolean array, True for raw values which are masked, the data only
+        contains values less than its length.
+    noise : bool
+        True to vary the values from gate to gate, as in digital products,
+        False for values constant in each patch.
+
+    """
+    nradials, nbins = shape
+    valid = np.flatnonzero(~mask_lut)
+    masked = np.flatnonzero(mask_lut)
+    if len(valid) == 0:
+        valid = np.arange(len(mask_lut))
+    nodata = masked[0] if len(masked) else valid[0]
+
+    # patches are cells of 8 radials by 16 gates
+    coarse = rng.random((-(-nradials // 8), -(-nbins // 16)))
+    field = np.repeat(np.repeat(coarse, 8, axis=0), 16, axis=1)
+    field = field[:nradials, :nbins]
+    coverage = rng.uniform(0.1, 0.6)
+    level = field / coverage * len(valid)
+    if noise:
+        level += rng.integers(-2, 3, size=shape)
+    level = np.clip(level, 0, len(valid) - 1).astype('intp')
+    raw_data = valid[level].astype('uint8')
+    raw_data[field >= coverage] = nodata
+    return raw_data
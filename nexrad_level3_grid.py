@@ -0,0 +1,343 @@
+"""
+nexrad_level3_grid
+==================
+
+Gridding NEXRAD Level 3 radial data onto Cartesian grids using cached
+index maps.
+
+.. autosummary::
+    :toctree: generated/
+    :template: dev_template.rst
+
+    Gridder
+
+.. autosummary::
+    :toctree: generated/
+
+    geometry_key
+    _sweep_geometry
+    _gate_spacing
+    _containing_radial
+    _nearest_index_map
+    _bilinear_index_map
+
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from nexrad_level3 import PRODUCT_RANGE_RESOLUTION, _data_lut
+
+GRID_METHODS = ('nearest', 'bilinear')
+
+# radials cover azimuths up to the start of the next radial when it is at
+# most this many azimuth deltas away, enough for jitter in the start angles
+# and a single missing radial in complete sweeps, otherwise up to the start
+# plus the delta, for example at the edges of a sector.
+AZIMUTH_GAP_TOLERANCE = 2.5
+
+
+class Gridder(object):
+    """
+    Grid NEXRAD Level 3 files onto a Cartesian grid centered on the radar.
+
+    For each radar geometry, see geometry_key, an index map from grid
+    points to gates is computed once and cached, gridding a file with a
+    known geometry is then a gather with no trigonometry.  Index maps are
+    kept in a least recently used in-memory cache and, optionally, in a
+    directory shared between processes and runs.
+
+    Gate ranges are treated as distances along the ground, the grid is a
+    flat plane.
+
+    Parameters
+    ----------
+    x, y : array
+        Distances east and north of the radar, in meters, of the grid
+        points.  Either 1D arrays of the grid columns and rows or 2D arrays
+        with the same shape giving the location of each grid point.
+    method : 'nearest' or 'bilinear'
+        'nearest' uses the gate containing each grid point, 'bilinear'
+        interpolates between the four surrounding gate centers, ignoring
+        masked gates.
+    cache_size : int
+        Maximum number of index maps kept in memory.
+    cache_dir : str or None
+        Directory in which index maps are stored, None to only cache them
+        in memory.
+    cache_dir_size : int
+        Maximum number of index maps stored in cache_dir, the least
+        recently used are removed.
+
+    Attributes
+    ----------
+    shape : tuple of int
+        Shape of the grid.
+    azimuth, range : array
+        Azimuth angle in degrees and distance in meters from the radar of
+        the grid points, float32 arrays with shape shape.
+
+    """
+
+    def __init__(self, x, y, method='nearest', cache_size=16, cache_dir=None,
+                 cache_dir_size=256):
+        """ initalize the object. """
+        if method not in GRID_METHODS:
+            raise ValueError('unknown method: %s' % (method))
+        x = np.asarray(x, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        if x.ndim == 1 and y.ndim == 1:
+            x, y = np.meshgrid(x, y)
+        if x.shape != y.shape:
+            raise ValueError('x and y must have the same shape')
+        self.shape = x.shape
+        self.method = method
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self.cache_dir_size = cache_dir_size
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self._cache = OrderedDict()
+
+        # polar coordinates of the grid points, the only trigonometry
+        self.azimuth = (np.degrees(np.arctan2(x, y)) % 360.).astype('float32')
+        self.range = np.hypot(x, y).astype('float32')
+        self._grid_hash = hashlib.sha1(
+            method.encode('ascii') + x.tobytes() + y.tobytes() +
+            str(x.shape).encode('ascii')).hexdigest()
+
+    def index_map(self, nfile):
+        """
+        Return the index map of the geometry of a file.
+
+        Parameters
+        ----------
+        nfile : NEXRADLevel3File
+            File whose geometry is used.
+
+        Returns
+        -------
+        index_map : dict
+            'radial' and 'gate' (int16) are the indices of the gates used
+            for each grid point with shape (k, ) + shape where k is 1 for
+            nearest and 4 for bilinear.  For bilinear 'weight' (float32)
+            are the weights of the gates.  'outside' (bool) is True for grid
+            points outside the sweep.
+
+        """
+        key = hashlib.sha1(
+            (self._grid_hash + repr(geometry_key(nfile))).encode('ascii')
+        ).hexdigest()
+        index_map = self._cache.pop(key, None)
+        if index_map is None:
+            index_map = self._load(key)
+        if index_map is None:
+            if self.method == 'nearest':
+                func = _nearest_index_map
+            else:
+                func = _bilinear_index_map
+            index_map = func(self.azimuth.ravel(), self.range.ravel(),
+                             *_sweep_geometry(nfile))
+            index_map = dict(
+                (k, v.reshape(v.shape[:-1] + self.shape))
+                for k, v in index_map.items())
+            for value in index_map.values():
+                value.flags.writeable = False
+            self._save(key, index_map)
+        self._cache[key] = index_map
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return index_map
+
+    def grid(self, nfile, fill_value=np.nan):
+        """
+        Return the field data of a file on the grid.
+
+        Parameters
+        ----------
+        nfile : NEXRADLevel3File
+            File to grid.
+        fill_value : float
+            Value of grid points outside the sweep or at masked gates.
+
+        Returns
+        -------
+        data : array
+            Float32 array of the gridded data.
+
+        """
+        index_map = self.index_map(nfile)
+        radial = index_map['radial']
+        gate = index_map['gate']
+        if radial.shape[0] == 1:
+            # gather the raw data then scale it through the lookup table
+            data_lut, mask_lut = _data_lut(
+                nfile.msg_header['code'], nfile.prod_descr['threshold_data'])
+            lut = np.where(mask_lut, fill_value, data_lut).astype('float32')
+            data = lut.take(nfile.raw_data[radial[0], gate[0]])
+        else:
+            sweep = nfile.get_data(masked=False, fill_value=np.nan)
+            values = sweep[radial, gate]
+            valid = ~np.isnan(values)
+            weight = np.where(valid, index_map['weight'], 0)
+            total = weight.sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                data = (np.where(valid, values, 0) * weight).sum(axis=0)
+                data /= total
+            data[total == 0] = fill_value
+        data[index_map['outside']] = fill_value
+        return data
+
+    def _load(self, key):
+        """ Return an index map from the cache directory or None. """
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, key + '.npz')
+        try:
+            with np.load(path) as archive:
+                index_map = dict((k, archive[k]) for k in archive.files)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        for value in index_map.values():
+            value.flags.writeable = False
+        return index_map
+
+    def _save(self, key, index_map):
+        """ Store an index map in the cache directory. """
+        if self.cache_dir is None:
+            return
+        path = os.path.join(self.cache_dir, key + '.npz')
+        tmp_path = os.path.join(
+            self.cache_dir, '.%s.%i.npz' % (key, os.getpid()))
+        np.savez(tmp_path, **index_map)
+        os.replace(tmp_path, path)
+
+        entries = [entry for entry in os.scandir(self.cache_dir)
+                   if entry.name.endswith('.npz') and
+                   not entry.name.startswith('.')]
+        if len(entries) > self.cache_dir_size:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.cache_dir_size]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+def geometry_key(nfile):
+    """
+    Return a hashable key of the radar geometry of a file.
+
+    Files with equal keys have gates at the same locations, the key
+    contains the first gate range, number of gates, gate spacing, number of
+    radials and the radial start and delta angles.
+
+    """
+    radial_headers = nfile.radial_headers
+    first, spacing, nbins = _gate_spacing(nfile)
+    return (
+        first,
+        nbins,
+        spacing,
+        len(radial_headers),
+        hashlib.sha1(
+            np.ascontiguousarray(radial_headers['angle_start']).tobytes() +
+            np.ascontiguousarray(radial_headers['angle_delta']).tobytes()
+        ).hexdigest(),
+    )
+
+
+def _sweep_geometry(nfile):
+    """ Return the radial and gate geometry of a file. """
+    first, spacing, nbins = _gate_spacing(nfile)
+    return (nfile.get_azimuth().astype('float64'),
+            nfile.get_azimuth_delta().astype('float64'),
+            first, spacing, nbins)
+
+
+def _gate_spacing(nfile):
+    """ Return the range of the first gate, gate spacing and gate count. """
+    rng = nfile.get_range()
+    spacing = (nfile.packet_header['range_scale'] *
+               PRODUCT_RANGE_RESOLUTION[nfile.msg_header['code']])
+    if len(rng) > 1:
+        spacing = float(rng[1] - rng[0])
+    first = float(rng[0]) if len(rng) else 0.
+    return first, float(spacing), len(rng)
+
+
+def _containing_radial(azimuth, starts, deltas):
+    """
+    Return the radial containing each azimuth and if it covers the azimuth.
+
+    The radial is the one with the closest start angle before the azimuth,
+    see AZIMUTH_GAP_TOLERANCE for the azimuths it covers.
+
+    """
+    order = np.argsort(starts, kind='stable')
+    sorted_starts = starts[order]
+    gaps = (np.roll(sorted_starts, -1) - sorted_starts) % 360.
+    gaps[gaps == 0] = 360.
+    widths = np.where(gaps <= deltas[order] * AZIMUTH_GAP_TOLERANCE, gaps,
+                      deltas[order])
+    # the last radial also covers points before the first start angle
+    pos = np.searchsorted(sorted_starts, azimuth, side='right') - 1
+    radial = order[pos]
+    covered = (azimuth - starts[radial]) % 360. < widths[pos]
+    return radial, covered
+
+
+def _nearest_index_map(azimuth, rng, starts, deltas, first_bin, spacing,
+                       nbins):
+    """ Return the index map of the gates containing the grid points. """
+    radial, covered = _containing_radial(azimuth, starts, deltas)
+    gate = np.floor((rng - first_bin) / spacing)
+    outside = (gate < 0) | (gate >= nbins) | ~covered
+    gate[outside] = 0
+    return {
+        'radial': radial.astype('int16')[np.newaxis],
+        'gate': gate.astype('int16')[np.newaxis],
+        'outside': outside,
+    }
+
+
+def _bilinear_index_map(azimuth, rng, starts, deltas, first_bin, spacing,
+                        nbins):
+    """ Return the index map interpolating between gate centers. """
+    nradials = len(starts)
+    centers = (starts + deltas / 2.) % 360.
+    order = np.argsort(centers, kind='stable')
+    centers = centers[order]
+    pos = np.searchsorted(centers, azimuth, side='right') - 1
+    lo = pos % nradials
+    hi = (pos + 1) % nradials
+    span = (centers[hi] - centers[lo]) % 360.
+    offset = (azimuth - centers[lo]) % 360.
+    waz = np.where(span > 0, offset / np.where(span > 0, span, 1), 0)
+    # do not interpolate across gaps, such as the edges of a sector, use
+    # the nearest of the two radials
+    gap = span > (deltas[order[lo]] + deltas[order[hi]]) / 2. * (
+        AZIMUTH_GAP_TOLERANCE)
+    waz = np.where(gap, np.round(waz), waz)
+
+    position = (rng - first_bin) / spacing - 0.5
+    _, covered = _containing_radial(azimuth, starts, deltas)
+    outside = (position < -0.5) | (position >= nbins - 0.5) | ~covered
+    g0 = np.floor(position)
+    wgate = position - g0
+    g1 = np.clip(g0 + 1, 0, nbins - 1).astype('int16')
+    g0 = np.clip(g0, 0, nbins - 1).astype('int16')
+
+    radial = np.array([order[lo], order[lo], order[hi], order[hi]])
+    return {
+        'radial': radial.astype('int16'),
+        'gate': np.array([g0, g1, g0, g1]),
+        'weight': np.array([(1 - waz) * (1 - wgate), (1 - waz) * wgate,
+                            waz * (1 - wgate), waz * wgate],
+                           dtype='float32'),
+        'outside': outside,
+    }
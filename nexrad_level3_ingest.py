@@ -0,0 +1,319 @@
+"""
+nexrad_level3_ingest
+====================
+
+Asyncio service which watches directories and decodes new NEXRAD Level 3
+files as they arrive.
+
+.. autosummary::
+    :toctree: generated/
+    :template: dev_template.rst
+
+    IngestService
+
+.. autosummary::
+    :toctree: generated/
+
+    _decode
+    _DirectoryPoller
+
+"""
+
+import asyncio
+import inspect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from nexrad_level3 import NEXRADLevel3File
+from nexrad_level3_scan import _parse_text_header
+
+
+class IngestService(object):
+    """
+    Watch directories and decode new NEXRAD Level 3 files.
+
+    Directories are polled every interval seconds.  A file is queued once
+    its size and modification time are unchanged between two polls, so
+    files still being written are not read.  Queued files are read, and
+    their data scaled, on an executor by decoder tasks.  When the queue is
+    full the watcher waits, so a backlog does not grow without bound.
+
+    Polls only list the directories whose modification time changed and
+    only stat new files and files not yet queued.  Files rewritten in place
+    in an unchanged directory are found by a full poll every
+    full_poll_interval seconds.  Directories which cannot be listed, for
+    example because they were removed, are recorded in errors and polled
+    again.
+
+    Decoded files update the latest table and are passed to the
+    callbacks.
+
+    Parameters
+    ----------
+    directories : str or list of str
+        Directories to watch, including sub-directories.
+    callbacks : list of callables
+        Called with the path and the NEXRADLevel3File of each decoded file,
+        coroutine functions are awaited.
+    workers : int
+        Number of files decoded concurrently.
+    queue_size : int
+        Maximum number of files waiting to be decoded.
+    interval : float
+        Seconds between polls of the directories.
+    full_poll_interval : float
+        Seconds between polls which stat every file.
+    ingest_existing : bool
+        True to also decode the files present when the service starts.
+    executor : Executor or None
+        Executor decoding the files, None for a ThreadPoolExecutor with
+        workers threads.
+
+    Attributes
+    ----------
+    latest : dict
+        Latest decoded file, by volume start time, for each (site, message
+        code).
+    errors : dict
+        Maps the paths of files which could not be decoded, or for which a
+        callback failed, and of directories which could not be polled, to
+        the exception raised.
+    decoded : int
+        Number of files decoded.
+
+    """
+
+    def __init__(self, directories, callbacks=(), workers=4, queue_size=256,
+                 interval=0.25, ingest_existing=False, executor=None,
+                 full_poll_interval=60.):
+        """ initalize the object. """
+        if isinstance(directories, str):
+            directories = [directories]
+        self.directories = list(directories)
+        self.callbacks = list(callbacks)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.interval = interval
+        self.full_poll_interval = full_poll_interval
+        self.ingest_existing = ingest_existing
+        self.executor = executor
+        self.latest = {}
+        self.errors = {}
+        self.decoded = 0
+        self._stopping = None
+
+    def get_latest(self, site, code):
+        """ Return the latest file of a site and message code or None. """
+        return self.latest.get((site, code))
+
+    def stop(self):
+        """
+        Stop a running service.
+
+        The directories are no longer polled, the files already queued are
+        decoded and passed to the callbacks before run returns.
+
+        """
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self):
+        """ Run the service until stop is called. """
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        executor = self.executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+        # polls run on their own thread so they do not wait for decoders
+        poll_executor = ThreadPoolExecutor(max_workers=1)
+        tasks = [loop.create_task(self._decoder(queue, executor))
+                 for _ in range(self.workers)]
+        watcher = loop.create_task(self._watch(queue, poll_executor))
+        stopping = loop.create_task(self._stopping.wait())
+        try:
+            await asyncio.wait([watcher, stopping],
+                               return_when=asyncio.FIRST_COMPLETED)
+            if watcher.done():
+                watcher.result()    # raise the exception which stopped it
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+            await queue.join()
+        finally:
+            for task in [watcher, stopping] + tasks:
+                task.cancel()
+            await asyncio.gather(watcher, stopping, *tasks,
+                                 return_exceptions=True)
+            poll_executor.shutdown(wait=False)
+            if self.executor is None:
+                executor.shutdown(wait=False)
+
+    async def _watch(self, queue, executor):
+        """ Poll the directories and queue new and modified files. """
+        loop = asyncio.get_running_loop()
+        poller = _DirectoryPoller(self.directories)
+        queued = None
+        previous = {}
+        failed = {}
+        last_full_poll = time.monotonic()
+        while True:
+            full = (time.monotonic() - last_full_poll >=
+                    self.full_poll_interval)
+            if full:
+                last_full_poll = time.monotonic()
+            pending = set(
+                path for path, stat in previous.items()
+                if queued is not None and queued.get(path) != stat)
+            current, errors = await loop.run_in_executor(
+                executor, poller.poll, pending, full)
+            for directory in failed:
+                if directory not in errors:
+                    self.errors.pop(directory, None)
+            self.errors.update(errors)
+            failed = errors
+            if queued is None:
+                # first poll, existing files are queued if requested
+                queued = {} if self.ingest_existing else current
+                previous = current
+            for path, stat in current.items():
+                if queued.get(path) != stat and previous.get(path) == stat:
+                    queued[path] = stat
+                    await queue.put(path)
+            # forget files which were removed, files in directories which
+            # could not be polled are kept
+            unpolled = tuple([os.path.join(d, '') for d in failed])
+            queued = dict(
+                (path, stat) for path, stat in queued.items()
+                if path in current or path.startswith(unpolled))
+            previous = current
+            await asyncio.sleep(self.interval)
+
+    async def _decoder(self, queue, executor):
+        """ Decode queued files, update latest and run the callbacks. """
+        loop = asyncio.get_running_loop()
+        while True:
+            path = await queue.get()
+            try:
+                try:
+                    nfile = await loop.run_in_executor(executor, _decode, path)
+                except Exception as error:
+                    self.errors[path] = error
+                    continue
+                self.errors.pop(path, None)
+                self.decoded += 1
+                _, site = _parse_text_header(nfile.text_header)
+                key = (site, nfile.msg_header['code'])
+                latest = self.latest.get(key)
+                if (latest is None or
+                        latest.get_volume_start_datetime() <=
+                        nfile.get_volume_start_datetime()):
+                    self.latest[key] = nfile
+                for callback in self.callbacks:
+                    try:
+                        result = callback(path, nfile)
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as error:
+                        self.errors[path] = error
+            finally:
+                queue.task_done()
+
+
+def _decode(path):
+    """ Read a file and cache its scaled data. """
+    nfile = NEXRADLevel3File(path)
+    nfile.get_data(copy=False)
+    return nfile
+
+
+class _DirectoryPoller(object):
+    """
+    Poll the (size, mtime_ns) of the files in directory trees.
+
+    Directories are only listed again when their modification time changed,
+    and only the new files in listed directories and the pending files are
+    stat-ed, the stats of other files are those of the previous poll.
+
+    Parameters
+    ----------
+    directories : list of str
+        Directories to poll, including sub-directories.
+
+    """
+
+    def __init__(self, directories):
+        """ initalize the object. """
+        self.directories = list(directories)
+        # directory -> (mtime_ns, sub-directories, stats of the files)
+        self._listings = {}
+
+    def poll(self, pending=frozenset(), full=False):
+        """
+        Poll the directories.
+
+        Parameters
+        ----------
+        pending : set of str
+            Paths of files to stat even if their directory is unchanged.
+        full : bool
+            True to list every directory and stat every file.
+
+        Returns
+        -------
+        stats : dict
+            Maps the path of each file to its (size, mtime_ns).
+        errors : dict
+            Maps the directories which could not be polled to the exception
+            raised.
+
+        """
+        stats = {}
+        errors = {}
+        listings = {}
+        stack = list(self.directories)
+        while stack:
+            directory = stack.pop()
+            previous = None if full else self._listings.get(directory)
+            try:
+                # stat before listing so later changes are seen next poll
+                mtime_ns = os.stat(directory).st_mtime_ns
+                if previous is None or previous[0] != mtime_ns:
+                    previous = self._list(directory, mtime_ns, previous)
+            except OSError as error:
+                errors[directory] = error
+                continue
+            listings[directory] = previous
+            _, subdirectories, files = previous
+            stack.extend(subdirectories)
+            for path in pending.intersection(files):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    del files[path]
+                    continue
+                files[path] = (stat.st_size, stat.st_mtime_ns)
+            stats.update(files)
+        self._listings = listings
+        return stats, errors
+
+    @staticmethod
+    def _list(directory, mtime_ns, previous):
+        """ List a directory, reusing the stats of a previous listing. """
+        known = {} if previous is None else previous[2]
+        subdirectories = []
+        files = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        stat = known.get(entry.path)
+                        if stat is None:
+                            stat = entry.stat()
+                            stat = (stat.st_size, stat.st_mtime_ns)
+                        files[entry.path] = stat
+                except OSError:
+                    continue    # removed while listing
+        return mtime_ns, subdirectories, files
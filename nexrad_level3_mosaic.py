@@ -0,0 +1,192 @@
+"""
+nexrad_level3_mosaic
+====================
+
+Compositing NEXRAD Level 3 files from many radars onto a common
+latitude/longitude grid.
+
+.. autosummary::
+    :toctree: generated/
+    :template: dev_template.rst
+
+    Mosaic
+
+.. autosummary::
+    :toctree: generated/
+
+    _open
+    _geographic_to_cartesian
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from nexrad_level3 import NEXRADLevel3File, EARTH_RADIUS
+from nexrad_level3_grid import Gridder, _gate_spacing
+
+MOSAIC_RULES = ('max', 'nearest', 'latest')
+
+
+class Mosaic(object):
+    """
+    Composite NEXRAD Level 3 files from many radars onto a lat/lon grid.
+
+    The grid points within range of each radar are mapped to the radar's
+    gates by a Gridder, created on first use of a radar location and kept
+    for later composites, so compositing a radar seen before is a gather
+    into its window of the grid.
+
+    Parameters
+    ----------
+    latitude, longitude : array
+        Increasing latitudes and longitudes of the grid rows and columns
+        in degrees.
+    method : 'nearest' or 'bilinear'
+        Gridding method, see Gridder.
+    cache_dir : str or None
+        Directory in which the index maps of the Gridders are stored.
+    cache_dir_size : int
+        Maximum number of index maps stored in cache_dir.
+
+    Attributes
+    ----------
+    shape : tuple of int
+        Shape of the grid, (nlatitude, nlongitude).
+
+    """
+
+    def __init__(self, latitude, longitude, method='nearest', cache_dir=None,
+                 cache_dir_size=1024):
+        """ initalize the object. """
+        self.latitude = np.asarray(latitude, dtype='float64')
+        self.longitude = np.asarray(longitude, dtype='float64')
+        self.shape = (len(self.latitude), len(self.longitude))
+        self.method = method
+        self.cache_dir = cache_dir
+        self.cache_dir_size = cache_dir_size
+        self._gridders = {}
+
+    def _gridder(self, nfile):
+        """ Return the window of the grid and Gridder of a file. """
+        latitude, longitude, _ = nfile.get_location()
+        first, spacing, nbins = _gate_spacing(nfile)
+        max_range = first + nbins * spacing
+        key = (latitude, longitude, max_range)
+        if key not in self._gridders:
+            dlat = np.degrees(max_range / EARTH_RADIUS)
+            dlon = dlat / np.cos(np.radians(min(abs(latitude) + dlat, 89.)))
+            rows = slice(*np.searchsorted(
+                self.latitude, [latitude - dlat, latitude + dlat]))
+            cols = slice(*np.searchsorted(
+                self.longitude, [longitude - dlon, longitude + dlon]))
+            lon, lat = np.meshgrid(self.longitude[cols], self.latitude[rows])
+            x, y = _geographic_to_cartesian(lat, lon, latitude, longitude)
+            gridder = Gridder(
+                x, y, self.method, cache_size=2, cache_dir=self.cache_dir,
+                cache_dir_size=self.cache_dir_size)
+            self._gridders[key] = (rows, cols), gridder
+        return self._gridders[key]
+
+    def composite(self, sources, rule='max', workers=None):
+        """
+        Composite many NEXRAD Level 3 files.
+
+        Files are read by a pool of threads and gridded one at a time
+        into the composite.
+
+        Parameters
+        ----------
+        sources : list of str or NEXRADLevel3File
+            Filenames of the files or files which have already been read.
+        rule : 'max', 'nearest' or 'latest'
+            How values of grid points covered by more than one radar are
+            combined.  'max' uses the largest value, 'nearest' the value of
+            the radar closest to the grid point and 'latest' the value with
+            the latest volume start time, later files in sources win ties.
+        workers : int or None
+            Number of threads reading files, None for the
+            ThreadPoolExecutor default.
+
+        Returns
+        -------
+        mosaic : dict
+            'data' is a float32 array with the composite, NaN where no
+            radar has valid data.  'filenames' lists the files used and
+            'errors' maps the files which could not be read to the
+            exception raised.
+
+        """
+        if rule not in MOSAIC_RULES:
+            raise ValueError('unknown rule: %s' % (rule))
+        sources = list(sources)
+        data = np.full(self.shape, np.nan, dtype='float32')
+        if rule == 'nearest':
+            best = np.full(self.shape, np.inf, dtype='float32')
+        elif rule == 'latest':
+            best = np.full(self.shape, np.datetime64('NaT'), 'datetime64[s]')
+        used = []
+        errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for source, nfile in zip(sources, executor.map(_open, sources)):
+                if isinstance(nfile, Exception):
+                    errors[source] = nfile
+                    continue
+                try:
+                    window, gridder = self._gridder(nfile)
+                    values = gridder.grid(nfile)
+                except Exception as error:
+                    errors[source] = error
+                    continue
+                used.append(source)
+                target = data[window]
+                valid = ~np.isnan(values)
+                if rule == 'max':
+                    np.fmax(target, values, out=target)
+                    continue
+                if rule == 'nearest':
+                    value = gridder.range
+                    update = valid & (value < best[window])
+                else:
+                    value = np.datetime64(nfile.get_volume_start_datetime(),
+                                          's')
+                    current = best[window]
+                    update = valid & ((current <= value) | np.isnat(current))
+                    value = np.broadcast_to(value, update.shape)
+                target[update] = values[update]
+                best[window][update] = value[update]
+        return {'data': data, 'filenames': used, 'errors': errors}
+
+
+def _open(source):
+    """ Return a NEXRADLevel3File or the exception raised opening it. """
+    if isinstance(source, NEXRADLevel3File):
+        return source
+    try:
+        return NEXRADLevel3File(source)
+    except Exception as error:
+        return error
+
+
+def _geographic_to_cartesian(lat, lon, lat_0, lon_0):
+    """
+    Return the azimuthal equidistant x and y in meters of points.
+
+    The inverse of the projection used by NEXRADLevel3File
+    get_gate_coordinates.
+
+    """
+    lat = np.radians(lat)
+    lat_0 = np.radians(lat_0)
+    dlon = np.radians(lon - lon_0)
+    cos_c = (np.sin(lat_0) * np.sin(lat) +
+             np.cos(lat_0) * np.cos(lat) * np.cos(dlon))
+    c = np.arccos(np.clip(cos_c, -1, 1))
+    sin_c = np.sin(c)
+    k = np.ones_like(c)
+    np.divide(c, sin_c, out=k, where=sin_c != 0)
+    x = EARTH_RADIUS * k * np.cos(lat) * np.sin(dlon)
+    y = EARTH_RADIUS * k * (np.cos(lat_0) * np.sin(lat) -
+                            np.sin(lat_0) * np.cos(lat) * np.cos(dlon))
+    return x, y
@@ -0,0 +1,236 @@
+"""
+nexrad_level3_netcdf
+====================
+
+Writing NEXRAD Level 3 files as NetCDF files.
+
+The layout of the NetCDF files follows the radial datasets written by the
+Unidata netCDF Java library.
+
+.. autosummary::
+    :toctree: generated/
+
+    write_netcdf
+    convert_file
+    convert_many
+    _convert_file
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import netCDF4
+
+from nexrad_level3 import NEXRADLevel3File, FEET_TO_METERS
+
+# names of the field variables, the names used by the netCDF Java library.
+FIELD_NAMES = {
+    19: 'BaseReflectivity',
+    20: 'BaseReflectivity248',
+    25: 'RadialVelocity',
+    27: 'RadialVelocity',
+    28: 'SpectrumWidth',
+    30: 'SpectrumWidth',
+    32: 'DigitalHybridReflectivity',
+    34: 'error',    # clutter filter control, named so by netCDF Java
+    56: 'StormMeanVelocity',
+    78: 'Precip1hr',
+    79: 'Precip3hr',
+    80: 'PrecipAccum',
+    94: 'BaseReflectivityDR',
+    99: 'BaseVelocityDV',
+    134: 'DigitalIntegLiquid',
+    135: 'EnhancedEchoTop',
+    138: 'DigitalPrecip',
+    159: 'DifferentialReflectivity',
+    161: 'CorrelationCoefficient',
+    163: 'DifferentialPhase',
+    165: 'HydrometeorClassification',
+    169: 'OneHourAccumulation',
+    170: 'DigitalAccumulationArray',
+    171: 'StormTotalAccumulation',
+    172: 'DigitalStormTotalAccumulation',
+    173: 'Accumulation3Hour',
+    174: 'Digital1HourDifferenceAccumulation',
+    175: 'DigitalTotalDifferenceAccumulation',
+    177: 'HypridHydrometeorClassification',
+    181: 'BaseReflectivity',
+    182: 'RadialVelocity',
+    186: 'BaseReflectivity',
+}
+
+
+def write_netcdf(nfile, filename, format='NETCDF4', zlib=False, complevel=4,
+                 shuffle=True, chunksizes=None):
+    """
+    Write a NEXRAD Level 3 file to a NetCDF file.
+
+    The file contains the elevation, azimuth, gate, latitude, longitude,
+    altitude and rays_time coordinate variables, the raw field data in a
+    variable named field + '_RAW' and the scaled field data, with NaN for
+    masked gates, in a variable named field, where field is the name in
+    FIELD_NAMES.
+
+    Parameters
+    ----------
+    nfile : NEXRADLevel3File
+        File to write.
+    filename : str
+        Filename of the NetCDF file to create.
+    format : str
+        NetCDF format, compression and chunking require NETCDF4 or
+        NETCDF4_CLASSIC.
+    zlib : bool
+        True to compress the field variables.
+    complevel : int
+        Compression level, 1 to 9.
+    shuffle : bool
+        True to apply the HDF5 shuffle filter before compressing.
+    chunksizes : tuple of int or None
+        Chunk sizes of the (azimuth, gate) field variables, None for the
+        library default.
+
+    """
+    msg_code = nfile.msg_header['code']
+    field = FIELD_NAMES.get(msg_code, 'field')
+    raw_data = nfile.raw_data
+    nradials, nbins = raw_data.shape
+    latitude, longitude, height = nfile.get_location()
+    start = nfile.get_volume_start_datetime().isoformat() + 'Z'
+    netcdf4 = format.startswith('NETCDF4')
+    field_kwargs = {}
+    if netcdf4:
+        field_kwargs = {'zlib': zlib, 'complevel': complevel,
+                        'shuffle': shuffle, 'chunksizes': chunksizes}
+
+    dset = netCDF4.Dataset(filename, 'w', format=format)
+    try:
+        dset.set_auto_maskandscale(False)
+        dset.title = 'Nexrad Level 3 Data'
+        dset.keywords = 'WSR-88D; NIDS'
+        dset.format = 'Level3/NIDS'
+        dset.cdm_data_type = 'RADIAL'
+        dset.isRadial = 1
+        dset.RadarLatitude = latitude
+        dset.RadarLongitude = longitude
+        dset.RadarAltitude = height * FEET_TO_METERS
+        dset.ProductCode = msg_code
+        dset.OperationalMode = nfile.prod_descr['operational_mode']
+        dset.VolumeCoveragePatternName = nfile.prod_descr['vcp']
+        dset.SequenceNumber = nfile.prod_descr['sequence_num']
+        dset.VolumeScanNumber = nfile.prod_descr['vol_scan_num']
+        dset.ElevationNumber = nfile.prod_descr['elevation_num']
+        dset.time_coverage_start = start
+        dset.time_coverage_end = start
+
+        dset.createDimension('azimuth', nradials)
+        dset.createDimension('gate', nbins)
+
+        def coordinate(name, dims, value, units, long_name, dtype='f4'):
+            var = dset.createVariable(name, dtype, dims)
+            var.units = units
+            var.long_name = long_name
+            var[:] = value
+
+        coordinate('elevation', ('azimuth', ), nfile.get_elevation(),
+                   'degrees', 'elevation angle in degrees')
+        coordinate('azimuth', ('azimuth', ), nfile.get_azimuth(),
+                   'degrees', 'azimuth angle in degrees: 0 = true north')
+        coordinate('gate', ('gate', ), nfile.get_range(),
+                   'meters', 'Radial distance to the start of gate')
+        coordinate('latitude', ('azimuth', ), latitude,
+                   'degrees', 'Latitude of the instrument')
+        coordinate('longitude', ('azimuth', ), longitude,
+                   'degrees', 'Longitude of the instrument')
+        coordinate('altitude', ('azimuth', ), height * FEET_TO_METERS,
+                   'meters', 'Altitude in meters (asl) of the instrument')
+        coordinate('rays_time', ('azimuth', ),
+                   netCDF4.date2num(nfile.get_volume_start_datetime(),
+                                    'milliseconds since 1970-01-01 00:00'),
+                   'milliseconds since 1970-01-01 00:00 UTC', 'rays time',
+                   dtype='f8')
+
+        coordinates = 'elevation azimuth gate rays_time latitude longitude'
+        if netcdf4:
+            var = dset.createVariable(field + '_RAW', 'u1',
+                                      ('azimuth', 'gate'), **field_kwargs)
+            var[:] = raw_data
+        else:
+            var = dset.createVariable(field + '_RAW', 'i1',
+                                      ('azimuth', 'gate'), **field_kwargs)
+            var._Unsigned = 'true'
+            var[:] = np.asarray(raw_data).view('i1')
+        var.coordinates = coordinates
+
+        var = dset.createVariable(field, 'f4', ('azimuth', 'gate'),
+                                  fill_value=np.nan, **field_kwargs)
+        var.coordinates = coordinates
+        var[:] = nfile.get_data(masked=False, fill_value=np.nan)
+    finally:
+        dset.close()
+
+
+def convert_file(infile, outfile, **kwargs):
+    """
+    Convert a NEXRAD Level 3 file to a NetCDF file.
+
+    Parameters
+    ----------
+    infile : str
+        Filename of the NEXRAD Level 3 file.
+    outfile : str
+        Filename of the NetCDF file to create.
+    kwargs :
+        Additional arguments passed to write_netcdf.
+
+    """
+    write_netcdf(NEXRADLevel3File(infile), outfile, **kwargs)
+
+
+def convert_many(infiles, outfiles=None, workers=1, **kwargs):
+    """
+    Convert many NEXRAD Level 3 files to NetCDF files.
+
+    Parameters
+    ----------
+    infiles : list of str
+        Filenames of the NEXRAD Level 3 files.
+    outfiles : list of str or None
+        Filenames of the NetCDF files to create, None appends '.nc' to the
+        input filenames.
+    workers : int or None
+        Number of worker processes, 1, the default, converts the files in
+        the calling process and None uses one process per CPU.
+    kwargs :
+        Additional arguments passed to write_netcdf.
+
+    Returns
+    -------
+    errors : dict
+        Maps the filenames of files which could not be converted to the
+        exception raised.
+
+    """
+    infiles = list(infiles)
+    if outfiles is None:
+        outfiles = [infile + '.nc' for infile in infiles]
+    args = [(infile, outfile, kwargs)
+            for infile, outfile in zip(infiles, outfiles)]
+    if workers == 1:
+        results = [_convert_file(arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_convert_file, args))
+    return dict((infile, error) for infile, error in zip(infiles, results)
+                if error is not None)
+
+
+def _convert_file(args):
+    """ Convert a file, return the exception raised or None. """
+    infile, outfile, kwargs = args
+    try:
+        convert_file(infile, outfile, **kwargs)
+    except Exception as error:
+        return error
+    return None
@@ -0,0 +1,205 @@
+"""
+nexrad_level3_scan
+==================
+
+Inventory of the NEXRAD Level 3 files in directory trees.
+
+.. autosummary::
+    :toctree: generated/
+
+    scan
+    _iter_paths
+    _batches
+    _map_bounded
+    _read_entries
+    _read_entry
+    _parse_text_header
+
+"""
+
+import collections
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from nexrad_level3 import (MessageHeader, ProductDescription,
+                           HEADERS_READ_SIZE, _text_header_size)
+
+# number of bytes read from the start of each file, the text header,
+# message header, product description and the bzip2 signature.
+PREFIX_SIZE = HEADERS_READ_SIZE
+
+# number of files read by a thread in one task
+_BATCH_SIZE = 256
+
+# maximum number of batches submitted to the threads and not yet collected
+_MAX_PENDING = 64
+
+# columns of the inventory returned by scan
+INVENTORY_COLUMNS = ('path', 'wmo_header', 'site', 'product_code',
+                     'volume_start', 'elevation', 'vcp', 'compressed', 'size')
+
+
+def scan(paths, workers=None, followlinks=False):
+    """
+    Create an inventory of NEXRAD Level 3 files.
+
+    Only the first PREFIX_SIZE bytes of each file are read, files are read
+    by a pool of threads.
+
+    Parameters
+    ----------
+    paths : str or list of str
+        Files or directories to scan, directories are scanned recursively.
+    workers : int or None
+        Number of threads reading files, None for the ThreadPoolExecutor
+        default.
+    followlinks : bool
+        True to scan directories pointed to by symbolic links.
+
+    Returns
+    -------
+    inventory : dict
+        Columns of the inventory, one element for each NEXRAD Level 3 file
+        found.  'path', 'wmo_header' and 'site' are lists of str,
+        'product_code', 'vcp' (int16), 'volume_start' (datetime64[s]),
+        'elevation' (float32), 'compressed' (bool) and 'size' (int64) are
+        arrays.  The 'errors' key maps the paths of files which are not
+        NEXRAD Level 3 files or could not be read, and of directories which
+        could not be scanned, to the exception raised.
+
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    columns = dict((column, []) for column in INVENTORY_COLUMNS)
+    errors = {}
+    batches = _batches(_iter_paths(paths, followlinks, errors), _BATCH_SIZE)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entries in _map_bounded(executor, _read_entries, batches,
+                                    _MAX_PENDING):
+            for path, entry in entries:
+                if isinstance(entry, Exception):
+                    errors[path] = entry
+                    continue
+                for column, value in zip(INVENTORY_COLUMNS, entry):
+                    columns[column].append(value)
+
+    inventory = {
+        'path': columns['path'],
+        'wmo_header': columns['wmo_header'],
+        'site': columns['site'],
+        'product_code': np.array(columns['product_code'], dtype='int16'),
+        'volume_start': np.array(columns['volume_start'],
+                                 dtype='int64').astype('datetime64[s]'),
+        'elevation': np.array(columns['elevation'], dtype='float32'),
+        'vcp': np.array(columns['vcp'], dtype='int16'),
+        'compressed': np.array(columns['compressed'], dtype='bool'),
+        'size': np.array(columns['size'], dtype='int64'),
+        'errors': errors,
+    }
+    return inventory
+
+
+def _iter_paths(paths, followlinks, errors=None):
+    """
+    Yield the paths of all files in a list of files and directories.
+
+    Directories which cannot be scanned, for example because they were
+    removed or are not readable, are skipped.  The exception raised is
+    recorded by directory in errors when provided.
+
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            files = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=followlinks):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry.path)
+            except OSError as error:
+                if errors is not None:
+                    errors[directory] = error
+            for filename in files:
+                yield filename
+
+
+def _batches(iterable, size):
+    """ Yield lists of up to size items from an iterable. """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _map_bounded(executor, func, iterable, size):
+    """
+    Yield func(item) for each item of an iterable, in order.
+
+    Unlike Executor.map, at most size items are submitted to the executor
+    and not yet yielded, so the iterable is consumed as results are
+    collected.
+
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= size:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _read_entries(paths):
+    """ Return a list of (path, entry) for a list of paths. """
+    entries = []
+    for path in paths:
+        try:
+            entries.append((path, _read_entry(path)))
+        except (OSError, ValueError, struct.error) as error:
+            entries.append((path, error))
+    return entries
+
+
+def _read_entry(path):
+    """ Return the inventory entry of a file as a tuple. """
+    with open(path, 'rb') as fhandle:
+        buf = fhandle.read(PREFIX_SIZE)
+        size = os.fstat(fhandle.fileno()).st_size
+    bpos = _text_header_size(buf)
+    if len(buf) < bpos + 120:
+        raise ValueError('file too short to be a NEXRAD Level 3 file')
+    msg_header = MessageHeader.unpack_from(buf, bpos)
+    prod_descr = ProductDescription.unpack_from(buf, bpos + 18)
+    if prod_descr['divider'] != -1:
+        raise ValueError('not a NEXRAD Level 3 file')
+
+    wmo_header, site = _parse_text_header(buf[:bpos])
+    volume_start = ((prod_descr['vol_scan_date'] - 1) * 86400 +
+                    prod_descr['vol_scan_time'])
+    elevation = struct.unpack('>h', prod_descr['halfwords_30'])[0] * 0.1
+    compressed = buf[bpos + 120:bpos + 122] == b'BZ'
+    return (path, wmo_header, site, msg_header['code'], volume_start,
+            elevation, prod_descr['vcp'], compressed, size)
+
+
+def _parse_text_header(text_header):
+    """ Return the WMO header and site from a text header. """
+    # Format of Text header is SDUSXX KYYYY DDHHMM\r\r\nAAABBB\r\r\n
+    lines = text_header.decode('ascii', 'replace').split('\r\r\n')
+    wmo_header = lines[0]
+    site = lines[1][3:] if len(lines) > 1 else ''
+    return wmo_header, site
@@ -0,0 +1,409 @@
+"""
+nexrad_level3_shm
+=================
+
+Handing decoded NEXRAD Level 3 sweeps between processes in shared memory.
+
+.. autosummary::
+    :toctree: generated/
+    :template: dev_template.rst
+
+    SweepHandle
+    SharedSweep
+    SharedSweepRegistry
+
+.. autosummary::
+    :toctree: generated/
+
+    share_sweep
+    decode_shared
+    decode_many
+    _decode_shared
+    _unlink
+
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from nexrad_level3 import NEXRADLevel3File, _data_lut
+from nexrad_level3_store import _pack_header, _make_file
+
+# alignment in bytes of the arrays in a shared memory block
+_ALIGNMENT = 64
+
+
+class SweepHandle(object):
+    """
+    Handle of a decoded sweep in a shared memory block.
+
+    Handles are small and are pickled between processes in place of the
+    arrays of the sweep, the arrays are accessed by attaching to the
+    block.
+
+    Attributes
+    ----------
+    name : str
+        Name of the shared memory block.
+    size : int
+        Size of the block in bytes.
+    header : bytes
+        Text header and packed header records, see
+        nexrad_level3_store._pack_header.
+    gates : tuple of int
+        First gate and gate stride of the decoded gates.
+    arrays : dict
+        Maps the names of the arrays in the block, 'radial_headers',
+        'raw_data' and, when scaled, 'data' and 'mask' to their offset,
+        shape and dtype.
+
+    """
+
+    def __init__(self, name, size, header, gates, arrays):
+        """ initalize the object. """
+        self.name = name
+        self.size = size
+        self.header = header
+        self.gates = gates
+        self.arrays = arrays
+
+    def __repr__(self):
+        return '%s(name=%r, size=%i, arrays=%r)' % (
+            type(self).__name__, self.name, self.size, sorted(self.arrays))
+
+    def attach(self):
+        """ Attach to the block, return a SharedSweep. """
+        return SharedSweep(self)
+
+
+class SharedSweep(object):
+    """
+    A decoded sweep attached from a shared memory block.
+
+    The arrays of the file are read-only views into the block, so no data
+    is copied.  The block stays mapped until close is called and the
+    arrays are no longer referenced, even if its owner unlinks it.
+
+    Processes attaching to a block should be started by multiprocessing
+    from the process owning it so they share its resource tracker, which
+    otherwise unlinks the block when the process exits.
+
+    Parameters
+    ----------
+    handle : SweepHandle
+        Handle of the sweep.
+
+    Attributes
+    ----------
+    handle : SweepHandle
+        Handle of the sweep.
+    nfile : NEXRADLevel3File
+        File with the headers, radial headers and raw data of the sweep.
+        When the sweep was scaled, get_data returns a copy of the scaled
+        data from the block and get_data(copy=False) the data in the block.
+
+    """
+
+    def __init__(self, handle):
+        """ initalize the object. """
+        self.handle = handle
+        self._shm = shared_memory.SharedMemory(handle.name)
+        arrays = {}
+        for name, (offset, shape, dtype) in handle.arrays.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf,
+                               offset=offset)
+            array.flags.writeable = False
+            arrays[name] = array
+        self.nfile = _make_file(
+            np.frombuffer(handle.header, dtype='uint8'),
+            arrays['radial_headers'], arrays['raw_data'], handle.gates)
+        if 'data' in arrays:
+            self.nfile._cache['data'] = (
+                arrays['data'], arrays.get('mask', np.ma.nomask))
+
+    def close(self):
+        """
+        Detach from the block.
+
+        The block is unmapped once the arrays of the file are no longer
+        referenced.
+
+        """
+        self.nfile = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass    # arrays still referenced, unmapped when collected
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SharedSweepRegistry(object):
+    """
+    Reference counts of shared memory sweeps.
+
+    The registry owns the blocks registered with it and unlinks a block
+    when its reference count drops to zero.  Counts are kept in the
+    process owning the registry, consumers in other processes attach to
+    the blocks using the handles and report back to the owner, which
+    releases them.
+
+    Remaining blocks are unlinked when the registry is closed or used as a
+    context manager.
+
+    """
+
+    def __init__(self):
+        """ initalize the object. """
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def register(self, handle, count=1):
+        """ Take ownership of the block of a handle with count references. """
+        with self._lock:
+            if handle.name in self._refs:
+                raise ValueError('already registered: %s' % (handle.name))
+            self._refs[handle.name] = count
+        return handle
+
+    def acquire(self, handle, count=1):
+        """ Add count references to a registered block. """
+        with self._lock:
+            if handle.name not in self._refs:
+                raise KeyError(handle.name)
+            self._refs[handle.name] += count
+
+    def release(self, handle, count=1):
+        """
+        Remove count references to a registered block.
+
+        The block is unlinked when no references remain.
+
+        Returns
+        -------
+        refcount : int
+            Number of references remaining.
+
+        """
+        with self._lock:
+            if handle.name not in self._refs:
+                raise KeyError(handle.name)
+            refcount = self._refs[handle.name] - count
+            if refcount > 0:
+                self._refs[handle.name] = refcount
+                return refcount
+            del self._refs[handle.name]
+        _unlink(handle.name)
+        return 0
+
+    def refcount(self, handle):
+        """ Return the number of references to a block, 0 if unknown. """
+        return self._refs.get(handle.name, 0)
+
+    def close(self):
+        """ Unlink all registered blocks. """
+        with self._lock:
+            names = list(self._refs)
+            self._refs.clear()
+        for name in names:
+            _unlink(name)
+
+    def __contains__(self, handle):
+        return handle.name in self._refs
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def share_sweep(nfile, scaled=True):
+    """
+    Copy a decoded sweep into a new shared memory block.
+
+    The radial headers and raw data decoded by NEXRADLevel3File are copied
+    into the block, only the scaled data is written directly into it.
+
+    Parameters
+    ----------
+    nfile : NEXRADLevel3File
+        File to share.
+    scaled : bool
+        True to also scale the data, as returned by get_data, directly into
+        the block so processes attaching to it do not scale the data.
+
+    Returns
+    -------
+    handle : SweepHandle
+        Handle of the block, the caller owns the block and must unlink it,
+        for example by registering the handle with a SharedSweepRegistry.
+
+    """
+    raw_data = nfile.raw_data
+    specs = [('radial_headers', nfile.radial_headers.shape,
+              nfile.radial_headers.dtype),
+             ('raw_data', raw_data.shape, raw_data.dtype)]
+    if scaled:
+        specs.append(('data', raw_data.shape, np.dtype('float32')))
+        _, mask_lut = _data_lut(nfile.msg_header['code'],
+                                nfile.prod_descr['threshold_data'])
+        if mask_lut.any():
+            specs.append(('mask', raw_data.shape, np.dtype(bool)))
+    arrays = {}
+    size = 0
+    for name, shape, dtype in specs:
+        size = -(-size // _ALIGNMENT) * _ALIGNMENT
+        arrays[name] = (size, shape, dtype)
+        size += int(np.prod(shape)) * dtype.itemsize
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        views = dict(
+            (name, np.ndarray(shape, dtype=dtype, buffer=shm.buf,
+                              offset=offset))
+            for name, (offset, shape, dtype) in arrays.items())
+        views['radial_headers'][...] = nfile.radial_headers
+        views['raw_data'][...] = raw_data
+        if scaled:
+            data = nfile.get_data(out=views['data'])
+            if 'mask' in views:
+                views['mask'][...] = np.ma.getmaskarray(data)
+            del data
+        del views
+        handle = SweepHandle(
+            shm.name, shm.size, _pack_header(nfile).tobytes(),
+            (nfile._first_gate, nfile._gate_stride), arrays)
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return handle
+
+
+def decode_shared(source, scaled=True, **kwargs):
+    """
+    Decode a NEXRAD Level 3 file into a new shared memory block.
+
+    Parameters
+    ----------
+    source : str, file-like or buffer
+        The file to decode, see NEXRADLevel3File.
+    scaled : bool
+        Passed to share_sweep.
+    kwargs :
+        Additional arguments passed to NEXRADLevel3File, for example a
+        sector or range_window.
+
+    Returns
+    -------
+    handle : SweepHandle
+        Handle of the block, see share_sweep.
+
+    """
+    return share_sweep(NEXRADLevel3File(source, **kwargs), scaled)
+
+
+def decode_many(sources, registry, workers=None, scaled=True, **kwargs):
+    """
+    Decode many NEXRAD Level 3 files into shared memory blocks.
+
+    Files are decoded in worker processes, only the handles of the blocks
+    are returned to the calling process.  Each handle is registered as soon
+    as its file is decoded.  Files whose worker died, breaking the pool, are
+    reported in errors.  When decode_many is interrupted the blocks already
+    created and not registered are unlinked.
+
+    Parameters
+    ----------
+    sources : list of str
+        Filenames of the NEXRAD Level 3 files.
+    registry : SharedSweepRegistry
+        Registry taking ownership of the blocks, each with one reference.
+    workers : int or None
+        Number of worker processes, 1 decodes the files in the calling
+        process and None, the default, uses one process per CPU.
+    scaled : bool
+        Passed to share_sweep.
+    kwargs :
+        Additional arguments passed to NEXRADLevel3File.
+
+    Returns
+    -------
+    handles : dict
+        Maps the filenames to the handles of the decoded sweeps.
+    errors : dict
+        Maps the filenames of files which could not be decoded to the
+        exception raised.
+
+    """
+    handles = {}
+    errors = {}
+
+    def add(source, result):
+        """ Register a handle or record an error. """
+        if isinstance(result, Exception):
+            errors[source] = result
+        else:
+            handles[source] = registry.register(result)
+
+    args = [(source, scaled, kwargs) for source in sources]
+    if workers == 1:
+        for arg in args:
+            add(arg[0], _decode_shared(arg))
+        return handles, errors
+
+    # the workers must share the resource tracker of this process,
+    # their own trackers unlink the blocks when the workers exit.
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict(
+            (executor.submit(_decode_shared, arg), arg[0]) for arg in args)
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as error:  # BrokenProcessPool
+                    result = error
+                add(futures[future], result)
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future in futures:
+                if (future.cancelled() or future.exception() is not None or
+                        futures[future] in handles):
+                    continue
+                result = future.result()
+                if isinstance(result, SweepHandle):
+                    _unlink(result.name)
+            raise
+    return handles, errors
+
+
+def _decode_shared(args):
+    """ Decode a file, return its handle or the exception raised. """
+    source, scaled, kwargs = args
+    try:
+        return decode_shared(source, scaled, **kwargs)
+    except Exception as error:
+        return error
+
+
+def _unlink(name):
+    """ Unlink a shared memory block, ignoring blocks which do not exist. """
+    try:
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    shm.unlink()
+    shm.close()
@@ -0,0 +1,267 @@
+"""
+nexrad_level3_store
+===================
+
+On-disk store of decoded NEXRAD Level 3 sweeps which are memory mapped
+when opened.
+
+.. autosummary::
+    :toctree: generated/
+    :template: dev_template.rst
+
+    SweepStore
+
+.. autosummary::
+    :toctree: generated/
+
+    export_sweep
+    load_sweep
+    _pack_header
+    _make_file
+
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from nexrad_level3 import (NEXRADLevel3File, MessageHeader, ProductDescription,
+                           SymbologyHeader, RadialPacketHeader)
+
+# records stored in the header array of a sweep after the text header, in
+# order.
+_HEADER_RECORDS = (
+    ('msg_header', MessageHeader),
+    ('prod_descr', ProductDescription),
+    ('symbology_header', SymbologyHeader),
+    ('packet_header', RadialPacketHeader),
+)
+
+# arrays stored for each sweep
+SWEEP_ARRAYS = ('header', 'gates', 'radial_headers', 'raw_data')
+
+
+class SweepStore(object):
+    """
+    A directory of decoded NEXRAD Level 3 sweeps.
+
+    Each sweep is stored under a key in a sub-directory written by
+    export_sweep.  Sweeps are written to a temporary directory and renamed
+    into place so readers never see partially written sweeps.  A sweep
+    replacing one with the same key is renamed into place right after the
+    old sweep is renamed away, the old sweep is removed afterwards.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the store, created if it does not exist.
+
+    Attributes
+    ----------
+    directory : str
+        Directory of the store.
+
+    """
+
+    def __init__(self, directory):
+        """ initalize the object. """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        """ Return the path of the sweep stored under key. """
+        if not key or key.startswith('.') or os.sep in key:
+            raise ValueError('invalid key: %r' % (key, ))
+        return os.path.join(self.directory, key)
+
+    def export(self, source, key=None, compress=False):
+        """
+        Decode a NEXRAD Level 3 file and add it to the store.
+
+        Parameters
+        ----------
+        source : str or NEXRADLevel3File
+            Filename of the NEXRAD Level 3 file or a file which has already
+            been read.
+        key : str or None
+            Key of the sweep, None for the base name of the filename.
+            Existing sweeps with the same key are replaced.
+        compress : bool
+            Passed to export_sweep.
+
+        Returns
+        -------
+        key : str
+            Key of the sweep.
+
+        """
+        if key is None:
+            if not isinstance(source, str):
+                raise ValueError('key must be given when source is not a '
+                                 'filename')
+            key = os.path.basename(source)
+        if isinstance(source, str):
+            source = NEXRADLevel3File(source)
+        path = self._path(key)
+        tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        try:
+            export_sweep(source, tmp_path, compress)
+            old_paths = self._rename(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        for old_path in old_paths:
+            shutil.rmtree(old_path, ignore_errors=True)
+        return key
+
+    def _rename(self, tmp_path, path):
+        """
+        Rename a directory to path, moving an existing directory away.
+
+        Returns the list of temporary directories holding the replaced
+        sweeps, the caller removes them.  Concurrent exports of the same
+        key each rename their sweep into place, the last one wins.
+
+        """
+        old_paths = []
+        while True:
+            try:
+                os.rename(tmp_path, path)
+                return old_paths
+            except OSError as error:
+                if error.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+            # an empty directory is replaced by the rename
+            old_path = tempfile.mkdtemp(prefix='.old-', dir=self.directory)
+            old_paths.append(old_path)
+            try:
+                os.rename(path, old_path)
+            except FileNotFoundError:
+                pass    # renamed away by a concurrent export
+
+    def open(self, key, mmap_mode='r'):
+        """ Return the sweep stored under key, see load_sweep. """
+        path = self._path(key)
+        if not os.path.isdir(path):
+            raise KeyError(key)
+        return load_sweep(path, mmap_mode)
+
+    def remove(self, key):
+        """ Remove the sweep stored under key. """
+        path = self._path(key)
+        if not os.path.isdir(path):
+            raise KeyError(key)
+        shutil.rmtree(path)
+
+    def keys(self):
+        """ Return a sorted list of the keys of the stored sweeps. """
+        return sorted([
+            entry.name for entry in os.scandir(self.directory)
+            if entry.is_dir() and not entry.name.startswith('.')])
+
+    def __contains__(self, key):
+        return os.path.isdir(self._path(key))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+
+def export_sweep(nfile, path, compress=False):
+    """
+    Write the decoded data of a NEXRAD Level 3 file to a directory.
+
+    The directory contains the header (the text header and packed header
+    records), the first gate and gate stride of the decoded gates, the
+    radial headers and the raw data, as .npy files or, when compressed, a
+    single sweep.npz file.
+
+    Parameters
+    ----------
+    nfile : NEXRADLevel3File
+        File to write.
+    path : str
+        Directory to write, created if it does not exist.
+    compress : bool
+        True to write the arrays deflated into a .npz archive which is
+        smaller but cannot be memory mapped, False to write .npy files.
+
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    arrays = {
+        'header': _pack_header(nfile),
+        'gates': np.array([nfile._first_gate, nfile._gate_stride]),
+        'radial_headers': np.ascontiguousarray(nfile.radial_headers),
+        'raw_data': np.ascontiguousarray(nfile.raw_data),
+    }
+    if compress:
+        np.savez_compressed(os.path.join(path, 'sweep.npz'), **arrays)
+        return
+    for name in SWEEP_ARRAYS:
+        np.save(os.path.join(path, name + '.npy'), arrays[name])
+
+
+def load_sweep(path, mmap_mode='r'):
+    """
+    Read a sweep written by export_sweep.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the sweep.
+    mmap_mode : str or None
+        Passed to np.load, the default 'r' memory maps the radial headers
+        and raw data read-only so the pages are shared by all processes
+        opening the sweep.  Ignored for compressed sweeps.
+
+    Returns
+    -------
+    nfile : NEXRADLevel3File
+        File with the header records, radial headers and raw data of the
+        sweep.
+
+    """
+    npz_path = os.path.join(path, 'sweep.npz')
+    if os.path.exists(npz_path):
+        with np.load(npz_path) as archive:
+            arrays = dict((name, archive[name]) for name in SWEEP_ARRAYS)
+    else:
+        arrays = dict(
+            (name, np.load(
+                os.path.join(path, name + '.npy'),
+                mmap_mode=None if name in ['header', 'gates'] else mmap_mode))
+            for name in SWEEP_ARRAYS)
+    return _make_file(
+        arrays['header'], arrays['radial_headers'], arrays['raw_data'],
+        arrays['gates'])
+
+
+def _pack_header(nfile):
+    """ Return the text header and header records as a uint8 array. """
+    buf = bytes(nfile.text_header) + b''.join(
+        [getattr(nfile, name).pack() for name, _ in _HEADER_RECORDS])
+    return np.frombuffer(buf, dtype='uint8')
+
+
+def _make_file(header, radial_headers, raw_data, gates):
+    """ Return a NEXRADLevel3File from a header array and data arrays. """
+    nfile = NEXRADLevel3File.__new__(NEXRADLevel3File)
+    nfile.clear_cache()
+    nfile.stats = None
+    nfile._first_gate, nfile._gate_stride = [int(i) for i in gates]
+    buf = header.tobytes()
+    pos = len(buf) - sum([r.size for _, r in _HEADER_RECORDS])
+    nfile.text_header = buf[:pos]
+    for name, record_class in _HEADER_RECORDS:
+        setattr(nfile, name, record_class.unpack_from(buf, pos))
+        pos += record_class.size
+    nfile.radial_headers = radial_headers
+    nfile.raw_data = raw_data
+    return nfile
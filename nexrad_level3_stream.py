@@ -0,0 +1,95 @@
+"""
+nexrad_level3_stream
+====================
+
+Splitting streams of concatenated NEXRAD Level 3 products, such as
+NOAAPort and LDM archive files, into products.
+
+.. autosummary::
+    :toctree: generated/
+
+    split_products
+    read_products
+
+"""
+
+import struct
+
+from nexrad_level3 import NEXRADLevel3File, TEXT_HEADER_RE, _read_buffer
+
+# smallest valid message, the message header and product description
+_MIN_MESSAGE_LENGTH = 120
+
+
+def split_products(source):
+    """
+    Find the NEXRAD Level 3 products in a stream of concatenated products.
+
+    Products are located by their text header (WMO heading and AWIPS
+    identifier) and end after the number of bytes given by the length
+    field of the message header.  Bytes between products, such as the
+    framing added by NOAAPort and LDM, and text headers not followed by a
+    valid message header are skipped.
+
+    Parameters
+    ----------
+    source : str, file-like or buffer
+        Filename, binary file-like object or buffer containing the stream,
+        files are memory mapped.
+
+    Yields
+    ------
+    offset : int
+        Offset of the start of the product in the stream.
+    product : memoryview
+        Product from the start of its text header to the end of the
+        message, a slice of the stream, not a copy.
+
+    """
+    buf = _read_buffer(source)
+    size = len(buf)
+    pos = 0
+    while True:
+        match = TEXT_HEADER_RE.search(buf, pos)
+        if match is None:
+            return
+        start = match.start()
+        msg_start = match.end()
+        if msg_start + _MIN_MESSAGE_LENGTH > size:
+            return
+        length = struct.unpack_from('>i', buf, msg_start + 8)[0]
+        divider = struct.unpack_from('>h', buf, msg_start + 18)[0]
+        end = msg_start + length
+        if (divider != -1 or length < _MIN_MESSAGE_LENGTH or end > size):
+            pos = msg_start
+            continue
+        yield start, buf[start:end]
+        pos = end
+
+
+def read_products(source, lazy=False):
+    """
+    Read the NEXRAD Level 3 products in a stream of concatenated products.
+
+    Parameters
+    ----------
+    source : str, file-like or buffer
+        Filename, binary file-like object or buffer containing the stream.
+    lazy : bool
+        Passed to NEXRADLevel3File.
+
+    Yields
+    ------
+    offset : int
+        Offset of the start of the product in the stream.
+    nfile : NEXRADLevel3File or Exception
+        The product read from the stream without copying it, or the
+        exception raised reading it, for example for unsupported products.
+
+    """
+    for offset, product in split_products(source):
+        try:
+            nfile = NEXRADLevel3File(product, lazy=lazy)
+        except Exception as error:
+            nfile = error
+        yield offset, nfile
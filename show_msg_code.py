@@ -1,27 +1,24 @@
 #! /usr/bin/env python
 """ Print out NEXRAD Level 3 message codes in files. """
 import sys
-import nexrad_level3
+import nexrad_level3_scan
 import numpy as np
 
 
 def main():
     """ main function. """
     if len(sys.argv) == 1:
-        print "Usage: show_msg_code.py file1 [file2 file3 ...]"
-        print "Show the NEXRAD Level 3 message code for one or more files"
+        print("Usage: show_msg_code.py file1 [file2 dir1 ...]")
+        print("Show the NEXRAD Level 3 message code for one or more files")
+        print("or the files in one or more directories")
         sys.exit()
 
-    all_codes = []
-    for f in sys.argv[1:]:
-        if f.endswith('.nc'):   # skip .nc files
-            continue
-        code = nexrad_level3.nexrad_level3_message_code(f)
-        print f, code
-        all_codes.append(code)
+    inventory = nexrad_level3_scan.scan(sys.argv[1:])
+    for path, code in zip(inventory['path'], inventory['product_code']):
+        print(path, code)
 
-    print "Unique codes seen:"
-    print np.unique(all_codes)
+    print("Unique codes seen:")
+    print(np.unique(inventory['product_code']))
 
 if __name__ == "__main__":
     main()
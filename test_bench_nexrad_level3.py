@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import tempfile
+
+import bench_nexrad_level3
+
+
+def test_run():
+    results = bench_nexrad_level3.run(['current_files'], 1)
+    assert sorted(results['results']) == ['19', '94']
+    result = results['results']['94']
+    assert result['file'] == 'current_files/KBMX_SDUS54_N0QBMX_201501020205'
+    assert result['peak_memory'] > 0
+    for stage in bench_nexrad_level3.STAGES:
+        assert result[stage] >= 0
+
+    assert bench_nexrad_level3.compare(results, results, 0.25) == []
+    slower = {'results': {'94': dict(result)}}
+    slower['results']['94']['decode'] += 1.
+    slower['results']['94']['peak_memory'] *= 2
+    regressions = bench_nexrad_level3.compare(slower, results, 0.25)
+    assert [r[:2] for r in regressions] == [('94', 'decode'),
+                                            ('94', 'peak_memory')]
+
+    bench_nexrad_level3.rerun(slower, ['94'], 1)
+    assert slower['results']['94']['decode'] < 1.
+
+
+def test_baseline():
+    # the committed baseline covers one file of each product in sample_data
+    with open(bench_nexrad_level3.BASELINE) as fhandle:
+        baseline = json.load(fhandle)
+    files = bench_nexrad_level3.find_files(['sample_data'])
+    assert sorted(baseline['results']) == sorted([str(c) for c in files])
+    for code, result in baseline['results'].items():
+        assert result['file'] == files[int(code)]
+        assert sorted(result) == sorted(
+            bench_nexrad_level3.STAGES + ('file', 'peak_memory'))
+
+
+def test_time_stages_bbb_indicator():
+    # WMO heading with a BBB indicator, the text header is 34 bytes
+    tmpdir = tempfile.mkdtemp()
+    try:
+        with open('current_files/KBMX_SDUS54_N0QBMX_201501020205',
+                  'rb') as fhandle:
+            product = fhandle.read()
+        path = os.path.join(tmpdir, 'KBMX_SDUS54_N0QBMX_201501020205')
+        with open(path, 'wb') as fhandle:
+            fhandle.write(product[:18] + b' RRA' + product[18:])
+        times = bench_nexrad_level3.time_stages(path, 1)
+        assert sorted(times) == sorted(bench_nexrad_level3.STAGES)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -1,4 +1,8 @@
 
+import bz2
+import io
+import struct
+
 import numpy as np
 import netCDF4
 
@@ -10,6 +14,196 @@ def test_int16_to_float16():
     assert abs(nexrad_level3._int16_to_float16(0x5BB4) - 123.25) <= 0.001
     assert abs(nexrad_level3._int16_to_float16(0) - 0.0) <= 0.001
 
+
+def test_records():
+    buf = struct.pack('>2h2i3h', 94, 16438, 7564, 1000, 320, 0, 3)
+    msg_header = nexrad_level3.MessageHeader.unpack_from(buf)
+    assert not hasattr(msg_header, '__dict__')
+    assert msg_header['code'] == 94
+    assert msg_header.length == 1000
+    assert 'nblocks' in msg_header
+    assert msg_header.keys()[:2] == ['code', 'date']
+    assert msg_header == dict(zip(msg_header.keys(), msg_header.values()))
+    assert msg_header == nexrad_level3._unpack_from_buf(
+        b'xx' + buf, 2, nexrad_level3.MESSAGE_HEADER)
+    assert nexrad_level3._structure_size(nexrad_level3.MESSAGE_HEADER) == 18
+    assert msg_header.pack() == buf
+    msg_header['code'] = 19
+    assert msg_header.code == 19
+
+
+def test_decode_af1f_radials():
+    buf = (struct.pack('>3h2B', 1, 0, 10, 0x31, 0x12) +
+           struct.pack('>3h4B', 2, 10, 10, 0x21, 0x13, 0x10, 0x00))
+    headers, raw_data = nexrad_level3._decode_af1f_radials(buf, 0, 2, 4)
+    assert raw_data.dtype == np.uint8
+    assert np.all(raw_data == [[1, 1, 1, 2], [1, 1, 3, 0]])
+    assert headers.dtype == nexrad_level3.RADIAL_HEADER_DTYPE
+    assert list(headers['angle_start']) == [0, 10]
+
+    # radials which do not expand to nbins are truncated or zero padded
+    _, raw_data = nexrad_level3._decode_af1f_radials(buf, 0, 2, 5)
+    assert np.all(raw_data == [[1, 1, 1, 2, 0], [1, 1, 3, 0, 0]])
+
+    # a long radial followed by a short one with nbins gates in total
+    buf = (struct.pack('>3h2B', 1, 0, 10, 0x51, 0x00) +
+           struct.pack('>3h2B', 1, 10, 10, 0x32, 0x00))
+    _, raw_data = nexrad_level3._decode_af1f_radials(buf, 0, 2, 4)
+    assert np.all(raw_data == [[1, 1, 1, 1], [2, 2, 2, 0]])
+
+
+def _packet_16_symbology_block(radials):
+    """ Return a symbology block with a packet 16 of the given radials. """
+    buf = struct.pack('>2hi2hi', -1, 1, 0, 1, -1, 0)
+    buf += struct.pack('>7h', 16, 0, 3, 0, 0, 1000, len(radials))
+    for i, radial in enumerate(radials):
+        buf += struct.pack('>3h', len(radial), i * 10, 10)
+        buf += struct.pack('>%iB' % len(radial), *radial)
+    return buf
+
+
+def test_packet_16_strided_view():
+    buf = _packet_16_symbology_block([[1, 2, 3], [4, 5, 6]])
+    nfile = nexrad_level3.NEXRADLevel3File.__new__(
+        nexrad_level3.NEXRADLevel3File)
+    nfile._read_symbology_block(buf)
+    assert np.all(nfile.raw_data == [[1, 2, 3], [4, 5, 6]])
+    assert not nfile.raw_data.flags.owndata
+    assert not nfile.radial_headers.flags.owndata
+    assert list(nfile.radial_headers['angle_start']) == [0, 10]
+
+
+def test_packet_16_mismatched_nbytes():
+    buf = _packet_16_symbology_block([[1, 2, 3], [4, 5]])
+    nfile = nexrad_level3.NEXRADLevel3File.__new__(
+        nexrad_level3.NEXRADLevel3File)
+    nfile._read_symbology_block(buf)
+    assert np.all(nfile.raw_data == [[1, 2, 3], [4, 5, 0]])
+    assert list(nfile.radial_headers['nbytes']) == [3, 2]
+
+
+def test_decompress_symbology_block():
+    block = _packet_16_symbology_block([[1, 2, 3], [4, 5, 6]])
+    block = block[:4] + struct.pack('>i', len(block)) + block[8:]
+    compressed = bz2.compress(block + b'graphic block')
+    chunks = [compressed[i:i+7] for i in range(0, len(compressed), 7)]
+    buf2 = nexrad_level3._decompress_symbology_block(chunks)
+    assert isinstance(buf2, bytearray)
+    assert bytes(buf2) == block
+
+    # implausible block lengths of corrupt products are not allocated
+    block = block[:4] + struct.pack('>i', 2**31 - 1) + block[8:]
+    try:
+        nexrad_level3._decompress_symbology_block([bz2.compress(block)])
+        assert False
+    except ValueError:
+        pass
+
+
+def test_get_azimuth_delta():
+    n3file = 'current_files/KBMX_SDUS54_N0RBMX_201501020205'
+    nfile = nexrad_level3.NEXRADLevel3File(n3file)
+    delta = nfile.get_azimuth_delta()
+    assert delta.dtype == np.float32
+    assert delta.shape == nfile.get_azimuth().shape
+    assert np.allclose(delta, 1.0)
+
+
+def test_data_lut():
+    threshold_data = struct.pack('>2h28x', -320, 5)
+    data_lut, mask_lut = nexrad_level3._data_lut(94, threshold_data)
+    assert data_lut.shape == (256, ) and data_lut.dtype == np.float32
+    assert np.all(mask_lut[:2]) and not np.any(mask_lut[2:])
+    assert abs(data_lut[2] - -32.) < 0.001
+    assert abs(data_lut[255] - 94.5) < 0.001
+    # tables are cached and read-only
+    assert nexrad_level3._data_lut(94, threshold_data)[0] is data_lut
+    assert not data_lut.flags.writeable
+
+
+def test_get_data_cached():
+    n3file = 'current_files/KBMX_SDUS54_N0QBMX_201501020205'
+    nfile = nexrad_level3.NEXRADLevel3File(n3file)
+    assert nfile.get_range() is nfile.get_range()
+    assert nfile.get_azimuth() is nfile.get_azimuth()
+    assert not nfile.get_range().flags.writeable
+    data = nfile.get_data(copy=False)
+    assert not data.data.flags.writeable
+    mask = data.mask.copy()
+    data[:] = np.ma.masked     # mask is not shared
+    assert np.all(nfile.get_data(copy=False).mask == mask)
+    assert np.shares_memory(nfile.get_data(copy=False).data, data.data)
+    nfile.clear_cache()
+    assert not np.shares_memory(nfile.get_data(copy=False).data, data.data)
+
+
+def test_get_data_copy():
+    n3file = 'current_files/KBMX_SDUS54_N0QBMX_201501020205'
+    nfile = nexrad_level3.NEXRADLevel3File(n3file)
+    for cached in [False, True]:
+        if cached:
+            shared = nfile.get_data(copy=False)
+        data = nfile.get_data()
+        assert data.data.flags.writeable
+        assert not np.shares_memory(data.data, nfile.get_data().data)
+        expected = data.copy()
+        data[0] = 0
+        assert np.ma.allequal(nfile.get_data(), expected)
+        if cached:
+            assert not np.shares_memory(data.data, shared.data)
+
+
+def test_get_data_out():
+    n3file = 'current_files/KBMX_SDUS54_N0QBMX_201501020205'
+    nfile = nexrad_level3.NEXRADLevel3File(n3file)
+    mdata = nfile.get_data()
+    out = np.empty(nfile.raw_data.shape, dtype='float64')
+    data = nfile.get_data(out=out, masked=False)
+    assert data is out
+    assert np.all(np.isnan(data) == mdata.mask)
+    assert np.allclose(data[~mdata.mask], mdata.compressed())
+    data = nfile.get_data(dtype='float32', fill_value=-9999., masked=False)
+    assert data.dtype == np.float32
+    assert np.all((data == -9999.) == mdata.mask)
+    mdata2 = nfile.get_data(out=out)
+    assert np.shares_memory(mdata2.data, out)
+    assert np.all(mdata2.mask == mdata.mask)
+
+
+def test_lazy():
+    n3file = 'current_files/KBMX_SDUS54_N0QBMX_201501020205'
+    nfile = nexrad_level3.NEXRADLevel3File(n3file)
+    lazy_nfile = nexrad_level3.NEXRADLevel3File(n3file, lazy=True)
+    assert 'raw_data' not in vars(lazy_nfile)
+    assert lazy_nfile.get_location() == nfile.get_location()
+    assert lazy_nfile.get_elevation() == nfile.get_elevation()
+    assert 'raw_data' not in vars(lazy_nfile)
+    assert np.all(lazy_nfile.raw_data == nfile.raw_data)
+    assert lazy_nfile.packet_header == nfile.packet_header
+
+
+def test_buffer_sources():
+    n3file = 'current_files/KBMX_SDUS54_N0QBMX_201501020205'
+    nfile = nexrad_level3.NEXRADLevel3File(n3file)
+    with open(n3file, 'rb') as fhandle:
+        buf = fhandle.read()
+    for source in [buf, bytearray(buf), memoryview(buf), io.BytesIO(buf)]:
+        check_source.description = 'check_source ' + type(source).__name__
+        yield check_source, nfile, source
+
+
+def check_source(nfile, source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    assert nexrad_level3.nexrad_level3_message_code(source) == 94
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    nfile2 = nexrad_level3.NEXRADLevel3File(source)
+    assert nfile2.text_header == nfile.text_header
+    assert nfile2.prod_descr == nfile.prod_descr
+    assert np.all(nfile2.raw_data == nfile.raw_data)
+
+
 def test_message_19_file():
     n3file = 'current_files/KBMX_SDUS54_N0RBMX_201501020205'
     ncfile = 'current_files/KBMX_SDUS54_N0RBMX_201501020205.nc'
@@ -150,3 +344,147 @@ def check_time(nfile, dset):
     assert dt.isoformat() + 'Z' == dset.time_coverage_start
     assert dt.isoformat() + 'Z' == dset.time_coverage_end
 
+
+def test_get_gate_coordinates():
+    filename = 'sample_data/KBMX_SDUS54_N0QBMX_201501020205'
+    nfile = nexrad_level3.NEXRADLevel3File(filename)
+    latitude, longitude, height = nfile.get_location()
+    lat, lon, alt = nfile.get_gate_coordinates()
+    x, y, z = nfile.get_gate_cartesian()
+    for array in [lat, lon, alt, x, y, z]:
+        assert array.shape == nfile.raw_data.shape
+        assert not array.flags.writeable
+
+    # first gate is at range 0, the location of the radar
+    assert nfile.get_range()[0] == 0
+    assert np.allclose(lat[:, 0], latitude)
+    assert np.allclose(lon[:, 0], longitude)
+    assert np.allclose(alt[:, 0], height * 0.3048)
+    assert np.allclose(x[:, 0], 0) and np.allclose(y[:, 0], 0)
+
+    # beam height of the 4/3 earth model
+    rng = nfile.get_range()[-1]
+    radius = 6371000. * 4. / 3.
+    elev = np.radians(nfile.get_elevation())
+    height = np.sqrt(rng ** 2 + radius ** 2 +
+                     2 * rng * radius * np.sin(elev)) - radius
+    assert np.allclose(z[:, -1], height)
+
+    # gates due north and east of the radar
+    azimuth = nfile.get_azimuth()
+    north = np.argmin(np.abs(azimuth - 0))
+    east = np.argmin(np.abs(azimuth - 90))
+    assert lat[north, -1] > latitude and np.isclose(lon[north, -1],
+                                                    longitude)
+    assert lon[east, -1] > longitude and np.isclose(x[east, -1],
+                                                    np.hypot(x, y)[east, -1])
+
+    # coordinates are shared by files with the same geometry
+    nfile2 = nexrad_level3.NEXRADLevel3File(filename)
+    assert nfile2.get_gate_coordinates()[0] is lat
+
+
+def test_gate_coordinates_cache():
+    # the least recently used geometry is evicted
+    location = (33.17, -86.77, 645)
+    azimuth = np.arange(4, dtype='float32')
+    rng = np.arange(3, dtype='float32') * 1000.
+    cache = nexrad_level3._GATE_COORDINATES_CACHE
+    cache.clear()
+    first = nexrad_level3._gate_coordinates(
+        location, 0.5, azimuth, rng, 'cartesian')
+    for i in range(1, nexrad_level3.GATE_COORDINATES_CACHE_SIZE + 1):
+        nexrad_level3._gate_coordinates(
+            location, 0.5 + i, azimuth, rng, 'cartesian')
+        assert nexrad_level3._gate_coordinates(
+            location, 0.5, azimuth, rng, 'cartesian') is first
+    assert len(cache) == nexrad_level3.GATE_COORDINATES_CACHE_SIZE
+    assert [key[1] for key in cache][:2] == [2.5, 3.5]
+    cache.clear()
+
+
+def test_windowed_decode():
+    windows = [
+        {'sector': (30, 120)},
+        {'sector': (350, 10)},
+        {'range_window': (20e3, 60e3)},
+        {'stride': 3},
+        {'sector': (200, 300), 'range_window': (5e3, 80e3), 'stride': (2, 4)},
+    ]
+    for product in ['N0Q', 'N0R']:
+        filename = 'sample_data/KBMX_SDUS54_%sBMX_201501020205' % (product)
+        nfile = nexrad_level3.NEXRADLevel3File(filename)
+        for kwargs in windows:
+            check_window.description = 'check_window %s %s' % (
+                product, sorted(kwargs.items()))
+            yield check_window, nfile, filename, kwargs
+
+
+def check_window(nfile, filename, kwargs):
+    wfile = nexrad_level3.NEXRADLevel3File(filename, **kwargs)
+    stride = kwargs.get('stride', 1)
+    if isinstance(stride, int):
+        stride = (stride, stride)
+    radial_stride, gate_stride = stride
+    azimuth = nfile.radial_headers['angle_start'] * 0.1
+    radials = np.ones(len(azimuth), dtype=bool)
+    if 'sector' in kwargs:
+        start, stop = kwargs['sector']
+        if start <= stop:
+            radials = (azimuth >= start) & (azimuth < stop)
+        else:
+            radials = (azimuth >= start) | (azimuth < stop)
+    radials = np.flatnonzero(radials)[::radial_stride]
+    rng = nfile.get_range()
+    spacing = rng[1] - rng[0]
+    gates = np.ones(len(rng), dtype=bool)
+    if 'range_window' in kwargs:
+        low, high = kwargs['range_window']
+        gates = (rng + spacing > low) & (rng < high)
+    gates = np.flatnonzero(gates)[::gate_stride]
+
+    assert np.all(wfile.raw_data == nfile.raw_data[radials][:, gates])
+    assert np.all(wfile.get_azimuth() == nfile.get_azimuth()[radials])
+    assert np.allclose(wfile.get_range(), rng[gates])
+    data = nfile.get_data()[radials][:, gates]
+    assert np.ma.allequal(wfile.get_data(), data)
+    assert np.all(wfile.get_data().mask == data.mask)
+
+
+def test_stats():
+    filename = 'sample_data/KBMX_SDUS54_N0QBMX_201501020205'
+    nexrad_level3.STATS.reset()
+    nfile = nexrad_level3.NEXRADLevel3File(filename)
+    assert nfile.stats is None
+
+    nfile = nexrad_level3.NEXRADLevel3File(filename, stats=True)
+    nfile.get_data()
+    for stage in ['read', 'decompress', 'decode', 'scale']:
+        assert nfile.stats[stage] > 0
+    assert nfile.stats['compressed_bytes'] < nfile.stats['decompressed_bytes']
+    assert nfile.stats['nradials'] == 360
+    assert nfile.stats['packet_code'] == 16
+
+    stats = nexrad_level3.STATS.as_dict()
+    assert list(stats) == [94]
+    assert stats[94]['files'] == 1
+    assert stats[94]['nradials'] == 360
+    assert stats[94]['stages']['decode']['count'] == 1
+    assert stats[94]['stages']['decode']['buckets'][-1] == (float('inf'), 1)
+    text = nexrad_level3.STATS.to_prometheus()
+    assert 'nexrad_level3_files_total{code="94"} 1\n' in text
+    assert ('nexrad_level3_stage_seconds_count{code="94",stage="scale"} 1\n'
+            in text)
+    nexrad_level3.STATS.reset()
+    assert nexrad_level3.STATS.as_dict() == {}
+
+
+def test_stats_aggregator():
+    aggregator = nexrad_level3.StatsAggregator(buckets=[0.1, 1])
+    aggregator.observe(19, 'decode', 0.05)
+    aggregator.observe(19, 'decode', 0.1)
+    aggregator.observe(19, 'decode', 5)
+    stages = aggregator.as_dict()[19]['stages']
+    assert stages['decode']['count'] == 3
+    assert stages['decode']['buckets'] == [(0.1, 2), (1, 2),
+                                           (float('inf'), 3)]
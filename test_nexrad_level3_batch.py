@@ -0,0 +1,46 @@
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_batch
+
+FILES = [
+    'sample_data/KBMX_SDUS54_N0QBMX_201501020205',
+    'sample_data/KBMX_SDUS54_NCRBMX_201501020205',   # not supported
+    'sample_data/KBMX_SDUS24_N1QBMX_201501020205',
+]
+
+
+def test_read_many():
+    results = nexrad_level3_batch.read_many(FILES, workers=2)
+    assert len(results) == 3
+    assert isinstance(results[0], nexrad_level3.NEXRADLevel3File)
+    assert isinstance(results[1], NotImplementedError)
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[2])
+    assert np.all(results[2].raw_data == nfile.raw_data)
+
+
+def test_read_many_fields():
+    results = nexrad_level3_batch.read_many(
+        FILES, workers=1, fields=['azimuth', 'elevation'])
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[0])
+    assert sorted(results[0].keys()) == ['azimuth', 'elevation']
+    assert np.all(results[0]['azimuth'] == nfile.get_azimuth())
+    assert results[2]['elevation'] == 1.5
+
+
+def test_read_many_stack():
+    stacked = nexrad_level3_batch.read_many(
+        FILES, workers=2, fields=['raw_data', 'range', 'time'], stack=True)
+    assert stacked['filenames'] == [FILES[0], FILES[2]]
+    assert list(stacked['errors']) == [FILES[1]]
+    assert stacked['raw_data'].shape == (2, 360, 460)
+    assert stacked['range'].shape == (2, 460)
+
+    # second file has fewer bins and is padded
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[2])
+    nbins = nfile.raw_data.shape[1]
+    assert np.all(stacked['raw_data'][1, :, :nbins] == nfile.raw_data)
+    assert np.all(stacked['raw_data'][1, :, nbins:] == 0)
+    assert np.all(np.isnan(stacked['range'][1, nbins:]))
+    assert stacked['time'][1] == np.datetime64(
+        nfile.get_volume_start_datetime())
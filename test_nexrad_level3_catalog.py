@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import nexrad_level3
+import nexrad_level3_catalog
+
+N0Q = 'KBMX_SDUS54_N0QBMX_201501020205'
+N0R = 'KBMX_SDUS54_N0RBMX_201501020205'
+
+
+def test_catalog():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        check_catalog(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def check_catalog(tmpdir):
+    for name in [N0Q, N0R, N0R + '.nc']:
+        shutil.copy(os.path.join('current_files', name), tmpdir)
+    database = os.path.join(tmpdir, 'catalog.db')
+    catalog = nexrad_level3_catalog.Catalog(database)
+    counts = catalog.update(tmpdir)
+    # the .nc file is recorded but is not a product
+    assert counts['added'] == 3
+    assert len(catalog) == 2
+
+    n0q = os.path.join(tmpdir, N0Q)
+    n0r = os.path.join(tmpdir, N0R)
+    assert catalog.query(site='BMX') == sorted([n0q, n0r])
+    assert catalog.query(code=94) == [n0q]
+    assert catalog.query(code=94, elevation=1.5) == []
+    start = datetime(2015, 1, 2, 2, 5)
+    end = datetime(2015, 1, 2, 2, 6)
+    assert catalog.query(site='BMX', code=94, start=start, end=end,
+                         elevation=0.5) == [n0q]
+    assert catalog.query(start=end) == []
+
+    nfile, = catalog.open(code=19)
+    assert nfile.msg_header['code'] == 19
+    row = catalog.get_row(n0q)
+    assert row['msg_code'] == 94
+    assert row['compressed'] == 1
+    assert row['prod_threshold_data'] == (
+        nexrad_level3.NEXRADLevel3File(n0q).prod_descr['threshold_data'])
+    catalog.close()
+
+    # updates are incremental and remove deleted files
+    os.remove(n0r)
+    os.utime(n0q, (0, 0))
+    catalog = nexrad_level3_catalog.Catalog(database)
+    counts = catalog.update(tmpdir)
+    assert counts['updated'] == 1
+    assert counts['unchanged'] == 1
+    assert counts['removed'] == 1
+    assert catalog.query() == [n0q]
+    catalog.close()
+
+
+def test_catalog_bbb_indicator():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # WMO heading with a BBB indicator, the text header is 34 bytes
+        with open(os.path.join('current_files', N0Q), 'rb') as fhandle:
+            product = fhandle.read()
+        path = os.path.join(tmpdir, N0Q)
+        with open(path, 'wb') as fhandle:
+            fhandle.write(product[:18] + b' RRA' + product[18:])
+        catalog = nexrad_level3_catalog.Catalog(
+            os.path.join(tmpdir, 'catalog.db'))
+        catalog.update(tmpdir)
+        assert catalog.query(site='BMX', code=94) == [path]
+        row = catalog.get_row(path)
+        assert row['compressed'] == 1
+        assert row['symbology_offset'] == 154
+        catalog.close()
+    finally:
+        shutil.rmtree(tmpdir)
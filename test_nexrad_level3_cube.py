@@ -0,0 +1,58 @@
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_cube
+
+FILES = ['sample_data/KBMX_SDUS24_N3QBMX_201501020205',
+         'sample_data/KBMX_SDUS24_N2QBMX_201501020205',
+         'sample_data/KOKX_SDUS51_N0QOKX_201108280702',
+         'sample_data/KBMX_SDUS54_N0RBMX_201501020205',
+         'sample_data/KBMX_SDUS54_N0QBMX_201501020205']
+STACKED = [FILES[0], FILES[1], FILES[4]]
+
+
+def test_build_cube():
+    cube = nexrad_level3_cube.build_cube(FILES)
+    assert cube['filenames'] == STACKED
+    assert sorted(cube['errors']) == sorted([FILES[2], FILES[3]])
+    assert cube['msg_code'] == 94
+    assert cube['data'].shape == (3, 360, 460)
+    assert cube['azimuth'].shape == (3, 360)
+    assert cube['range'].shape == (3, 460)
+    for i, filename in enumerate(STACKED):
+        nfile = nexrad_level3.NEXRADLevel3File(filename)
+        nbins = nfile.raw_data.shape[1]
+        data = nfile.get_data().filled(np.nan)
+        assert np.array_equal(cube['data'][i, :, :nbins], data,
+                              equal_nan=True)
+        assert np.all(np.isnan(cube['data'][i, :, nbins:]))
+        assert np.all(cube['range'][i, :nbins] == nfile.get_range())
+        assert np.all(np.isnan(cube['range'][i, nbins:]))
+        assert np.all(cube['azimuth'][i] == nfile.get_azimuth())
+        assert cube['time'][i] == np.datetime64(
+            nfile.get_volume_start_datetime())
+        assert cube['elevation'][i] == np.float32(nfile.get_elevation())
+
+
+def test_build_cube_raw():
+    nfiles = [nexrad_level3.NEXRADLevel3File(f) for f in STACKED]
+    cube = nexrad_level3_cube.build_cube(
+        nfiles, scaled=False, shape=(360, 460))
+    assert cube['raw_data'].shape == (3, 360, 460)
+    assert cube['raw_data'].dtype == np.uint8
+    for i, nfile in enumerate(nfiles):
+        nbins = nfile.raw_data.shape[1]
+        raw_data = cube['raw_data'][i, :, :nbins]
+        assert np.all(raw_data == nfile.raw_data)
+        data = np.ma.array(cube['data_lut'][i][raw_data],
+                           mask=cube['mask_lut'][i][raw_data])
+        assert np.ma.allequal(data, nfile.get_data())
+
+
+def test_build_cube_no_files():
+    try:
+        nexrad_level3_cube.build_cube([FILES[3] + '.missing'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('ValueError not raised')
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_encode
+
+FILES = ['sample_data/KBMX_SDUS54_N0QBMX_201501020205',
+         'sample_data/KBMX_SDUS54_N0RBMX_201501020205',
+         'sample_data/KBMX_SDUS34_N1PBMX_201501020205']
+
+
+def test_encode_file():
+    for filename in FILES[:2]:
+        check_encode_identical.description = (
+            'check_encode_identical ' + os.path.basename(filename))
+        yield check_encode_identical, filename
+
+
+def check_encode_identical(filename):
+    with open(filename, 'rb') as fhandle:
+        buf = fhandle.read()
+    nfile = nexrad_level3.NEXRADLevel3File(filename)
+    assert nexrad_level3_encode.encode_file(nfile) == buf
+
+
+def test_encode_product():
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[0])
+    for compress in [False, True]:
+        product = nexrad_level3_encode.encode_file(nfile, compress=compress)
+        assert (product[150:152] == b'BZ') == compress
+        nfile2 = nexrad_level3.NEXRADLevel3File(product)
+        assert nfile2.msg_header['length'] == len(product) - 30
+        assert np.all(nfile2.raw_data == nfile.raw_data)
+        assert np.all(nfile2.radial_headers == nfile.radial_headers)
+        assert np.ma.allequal(nfile2.get_data(), nfile.get_data())
+
+    # odd number of bins are padded to whole halfwords
+    raw_data = np.arange(360 * 5, dtype='uint8').reshape(360, 5)
+    product = nexrad_level3_encode.encode_product(
+        nfile.text_header, nfile.msg_header, nfile.prod_descr,
+        nfile.packet_header, nfile.radial_headers, raw_data)
+    nfile2 = nexrad_level3.NEXRADLevel3File(product)
+    assert nfile2.packet_header['nbins'] == 5
+    assert np.all(nfile2.raw_data[:, :5] == raw_data)
+    assert np.all(nfile2.raw_data[:, 5] == 0)
+
+
+def test_encode_af1f():
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[1])
+    raw_data = np.zeros((360, 230), dtype='uint8')
+    raw_data[:, 100:140] = 7     # runs longer than 15 gates
+    raw_data[::2, 3] = 15
+    raw_data[1, :] = np.arange(230) % 16
+    for compress in [False, True]:
+        product = nexrad_level3_encode.encode_product(
+            nfile.text_header, nfile.msg_header, nfile.prod_descr,
+            nfile.packet_header, nfile.radial_headers, raw_data, compress)
+        nfile2 = nexrad_level3.NEXRADLevel3File(product)
+        assert np.all(nfile2.raw_data == raw_data)
+        assert np.all(nfile2.radial_headers['angle_start'] ==
+                      nfile.radial_headers['angle_start'])
+
+    try:
+        nexrad_level3_encode.encode_product(
+            nfile.text_header, nfile.msg_header, nfile.prod_descr,
+            nfile.packet_header, nfile.radial_headers, raw_data + 16)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_encode_windowed_file():
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[1], sector=(10, 20))
+    nfile2 = nexrad_level3.NEXRADLevel3File(
+        nexrad_level3_encode.encode_file(nfile))
+    assert nfile2.packet_header['nradials'] == 10
+    assert np.all(nfile2.raw_data == nfile.raw_data)
+
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[1], range_window=(1e4, 5e4))
+    try:
+        nexrad_level3_encode.encode_file(nfile)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_generate_products():
+    products = list(nexrad_level3_encode.generate_products(
+        FILES, count=20, seed=0))
+    assert len(products) == 20
+    codes = set()
+    for name, product in products:
+        nfile = nexrad_level3.NEXRADLevel3File(product)
+        codes.add(nfile.msg_header['code'])
+        site = name.split('_')[0]
+        assert nfile.text_header.split(b'\r\r\n')[1].endswith(
+            site[1:].encode('ascii'))
+        assert name.endswith(
+            nfile.get_volume_start_datetime().strftime('%Y%m%d%H%M'))
+        data = nfile.get_data()
+        assert 0 < data.count() < data.size
+        # products round trip through the reader
+        assert nexrad_level3_encode.encode_file(nfile) == product
+    assert codes == set([94, 19, 78])
+
+    # the same seed generates the same products
+    assert list(nexrad_level3_encode.generate_products(
+        FILES, count=20, seed=0)) == products
+
+
+def test_write_products():
+    directory = tempfile.mkdtemp()
+    try:
+        paths = nexrad_level3_encode.write_products(
+            FILES[:1], directory, 3, seed=1)
+        assert len(paths) == 3
+        for path in paths:
+            assert os.path.dirname(path) == directory
+            nfile = nexrad_level3.NEXRADLevel3File(path)
+            assert nfile.msg_header['code'] == 94
+    finally:
+        shutil.rmtree(directory)
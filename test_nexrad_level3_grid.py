@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_grid
+
+FILENAME = 'sample_data/KBMX_SDUS54_N0QBMX_201501020205'
+
+
+def test_grid_nearest():
+    nfile = nexrad_level3.NEXRADLevel3File(FILENAME)
+    # points at the center of gates 10 and 20 of radials 0 and 90 degrees
+    azimuth = nfile.get_azimuth()
+    rng = nfile.get_range()
+    spacing = rng[1] - rng[0]
+    i, j = np.argmin(np.abs(azimuth - 0.5)), np.argmin(np.abs(azimuth - 90.5))
+    r10, r20 = rng[10] + spacing / 2, rng[20] + spacing / 2
+    x = [0, r20 * np.sin(np.radians(90.5)), 500e3]
+    y = [r10 * np.cos(np.radians(0.5)), r20 * np.cos(np.radians(90.5)), 0]
+    gridder = nexrad_level3_grid.Gridder(np.array([x]), np.array([y]))
+    data = gridder.grid(nfile, fill_value=-999.)
+    ref = nfile.get_data().filled(-999.)
+    assert data.shape == (1, 3)
+    assert data[0, 0] == ref[i, 10]
+    assert data[0, 1] == ref[j, 20]
+    assert data[0, 2] == -999.
+
+
+def test_grid_bilinear():
+    nfile = nexrad_level3.NEXRADLevel3File(FILENAME)
+    x = np.arange(-100e3, 100e3, 2e3)
+    nearest = nexrad_level3_grid.Gridder(x, x).grid(nfile)
+    bilinear = nexrad_level3_grid.Gridder(x, x, 'bilinear').grid(nfile)
+    assert bilinear.shape == nearest.shape == (100, 100)
+    valid = ~np.isnan(bilinear)
+    assert valid.any()
+    assert np.nanmin(bilinear) >= np.nanmin(nearest) - 1
+    assert np.nanmax(bilinear) <= np.nanmax(nearest) + 1
+
+
+def test_grid_sector():
+    nfile = nexrad_level3.NEXRADLevel3File(FILENAME)
+    sector = nexrad_level3.NEXRADLevel3File(FILENAME, sector=(0, 90))
+    x = np.arange(-100e3, 100e3, 2e3) + 1e3
+    azimuth = np.degrees(np.arctan2(*np.meshgrid(x, x))) % 360.
+    inside = (azimuth > 1) & (azimuth < 89)
+    outside = (azimuth > 90.5) & (azimuth < 359.5)
+    for method in nexrad_level3_grid.GRID_METHODS:
+        full = nexrad_level3_grid.Gridder(x, x, method).grid(nfile)
+        data = nexrad_level3_grid.Gridder(x, x, method).grid(sector)
+        # points outside the sector are outside the sweep
+        assert np.all(np.isnan(data[outside]))
+        assert np.array_equal(data[inside], full[inside], equal_nan=True)
+        assert not np.all(np.isnan(data[inside]))
+
+
+def test_gridder_cache():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        nfile = nexrad_level3.NEXRADLevel3File(FILENAME)
+        other = nexrad_level3.NEXRADLevel3File(
+            'sample_data/KBMX_SDUS24_N1QBMX_201501020205')
+        assert (nexrad_level3_grid.geometry_key(nfile) !=
+                nexrad_level3_grid.geometry_key(other))
+        x = np.arange(-50e3, 50e3, 5e3)
+        gridder = nexrad_level3_grid.Gridder(
+            x, x, cache_size=1, cache_dir=cache_dir, cache_dir_size=1)
+        index_map = gridder.index_map(nfile)
+        assert gridder.index_map(nfile) is index_map
+        assert len(os.listdir(cache_dir)) == 1
+
+        # a new gridder loads the index map from the cache directory
+        gridder2 = nexrad_level3_grid.Gridder(x, x, cache_dir=cache_dir)
+        index_map2 = gridder2.index_map(nfile)
+        for key in index_map:
+            assert np.all(index_map[key] == index_map2[key])
+        assert np.array_equal(gridder.grid(nfile), gridder2.grid(nfile),
+                              equal_nan=True)
+
+        # least recently used maps are evicted
+        gridder.index_map(other)
+        assert len(gridder._cache) == 1
+        assert len(os.listdir(cache_dir)) == 1
+    finally:
+        shutil.rmtree(cache_dir)
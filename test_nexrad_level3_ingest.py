@@ -0,0 +1,150 @@
+import asyncio
+import os
+import shutil
+import tempfile
+
+import nexrad_level3_ingest
+
+N0Q = 'sample_data/KBMX_SDUS54_N0QBMX_201501020205'
+N0R = 'sample_data/KBMX_SDUS54_N0RBMX_201501020205'
+
+
+def test_ingest_service():
+    directory = tempfile.mkdtemp()
+    try:
+        shutil.copy(N0R, directory)
+        asyncio.run(_ingest(directory))
+    finally:
+        shutil.rmtree(directory)
+
+
+async def _ingest(directory):
+    results = []
+    done = asyncio.Event()
+
+    async def callback(path, nfile):
+        results.append((path, nfile))
+        done.set()
+
+    service = nexrad_level3_ingest.IngestService(
+        directory, [callback], workers=2, interval=0.02)
+    task = asyncio.ensure_future(service.run())
+    await asyncio.sleep(0.1)
+    # existing files are not ingested
+    assert results == []
+
+    subdirectory = os.path.join(directory, 'sub')
+    os.mkdir(subdirectory)
+    shutil.copy(N0Q, subdirectory)
+    with open(os.path.join(directory, 'bad'), 'wb') as fhandle:
+        fhandle.write(b'not a nexrad file')
+    await asyncio.wait_for(done.wait(), 5)
+    for _ in range(100):
+        if service.errors:
+            break
+        await asyncio.sleep(0.02)
+    service.stop()
+    await asyncio.wait_for(task, 5)
+
+    path, nfile = results[0]
+    assert path == os.path.join(subdirectory, os.path.basename(N0Q))
+    assert len(results) == 1
+    assert service.decoded == 1
+    assert service.get_latest('BMX', 94) is nfile
+    assert service.get_latest('BMX', 19) is None
+    assert list(service.errors) == [os.path.join(directory, 'bad')]
+
+
+def test_directory_poller():
+    directory = tempfile.mkdtemp()
+    try:
+        subdirectory = os.path.join(directory, 'sub')
+        os.mkdir(subdirectory)
+        path = os.path.join(subdirectory, 'file')
+        with open(path, 'wb') as fhandle:
+            fhandle.write(b'1')
+        missing = os.path.join(directory, 'missing')
+        poller = nexrad_level3_ingest._DirectoryPoller([directory, missing])
+        stats, errors = poller.poll()
+        assert list(stats) == [path] and stats[path][0] == 1
+        assert list(errors) == [missing]
+        assert isinstance(errors[missing], FileNotFoundError)
+
+        # files written in place are seen when pending or in a full poll
+        with open(path, 'ab') as fhandle:
+            fhandle.write(b'2')
+        assert poller.poll()[0][path][0] == 1
+        assert poller.poll(set([path]))[0][path][0] == 2
+        with open(path, 'ab') as fhandle:
+            fhandle.write(b'3')
+        assert poller.poll(full=True)[0][path][0] == 3
+
+        # new and removed files and directories
+        path2 = os.path.join(directory, 'file2')
+        open(path2, 'wb').close()
+        assert sorted(poller.poll()[0]) == [path2, path]
+        shutil.rmtree(subdirectory)
+        assert list(poller.poll()[0]) == [path2]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_ingest_unreadable_directory():
+    directory = tempfile.mkdtemp()
+    try:
+        asyncio.run(_ingest_unreadable_directory(directory))
+    finally:
+        shutil.rmtree(directory)
+
+
+async def _ingest_unreadable_directory(directory):
+    results = []
+    missing = os.path.join(directory, 'missing')
+    service = nexrad_level3_ingest.IngestService(
+        [missing, directory], [lambda p, n: results.append(p)],
+        interval=0.02)
+    task = asyncio.ensure_future(service.run())
+    await asyncio.sleep(0.1)
+    assert list(service.errors) == [missing]
+
+    # the watcher keeps running and recovers when the directory appears
+    os.mkdir(missing)
+    shutil.copy(N0R, directory)
+    for _ in range(250):
+        if results:
+            break
+        await asyncio.sleep(0.02)
+    assert not task.done()
+    assert service.errors == {}
+    service.stop()
+    await asyncio.wait_for(task, 5)
+    assert results == [os.path.join(directory, os.path.basename(N0R))]
+
+
+def test_stop_decodes_queued_files():
+    directory = tempfile.mkdtemp()
+    try:
+        asyncio.run(_stop_decodes_queued_files(directory))
+    finally:
+        shutil.rmtree(directory)
+
+
+async def _stop_decodes_queued_files(directory):
+    started = asyncio.Event()
+    results = []
+
+    async def callback(path, nfile):
+        started.set()
+        await asyncio.sleep(0.1)
+        results.append(path)
+
+    for i in range(3):
+        shutil.copy(N0R, os.path.join(directory, 'file%i' % (i)))
+    service = nexrad_level3_ingest.IngestService(
+        directory, [callback], workers=1, interval=0.02,
+        ingest_existing=True)
+    task = asyncio.ensure_future(service.run())
+    await asyncio.wait_for(started.wait(), 5)
+    service.stop()
+    await asyncio.wait_for(task, 5)
+    assert len(results) == 3 and service.decoded == 3
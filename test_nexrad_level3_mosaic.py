@@ -0,0 +1,51 @@
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_mosaic
+
+N0Q = 'sample_data/KBMX_SDUS54_N0QBMX_201501020205'
+N0R = 'sample_data/KBMX_SDUS54_N0RBMX_201501020205'
+OKX = 'sample_data/KOKX_SDUS51_N0QOKX_201108280702'
+LATITUDE = np.arange(30, 43, 0.05)
+LONGITUDE = np.arange(-90, -70, 0.05)
+
+
+def test_composite_max():
+    mosaic = nexrad_level3_mosaic.Mosaic(LATITUDE, LONGITUDE)
+    result = mosaic.composite([N0Q, N0R, OKX, 'missing'], workers=2)
+    assert result['filenames'] == [N0Q, N0R, OKX]
+    assert list(result['errors']) == ['missing']
+    data = result['data']
+    assert data.shape == (len(LATITUDE), len(LONGITUDE))
+    for filename in [N0Q, N0R, OKX]:
+        single = mosaic.composite([filename])['data']
+        valid = ~np.isnan(single)
+        assert valid.any()
+        assert np.all(data[valid] >= single[valid])
+
+    # each radar only covers the grid points around it
+    bmx = mosaic.composite([N0Q])['data']
+    row = np.searchsorted(LATITUDE, 38)
+    assert np.all(np.isnan(bmx[row:]))
+
+
+def test_composite_nearest_latest():
+    mosaic = nexrad_level3_mosaic.Mosaic(LATITUDE, LONGITUDE)
+    n0q = mosaic.composite([N0Q])['data']
+    n0r = mosaic.composite([N0R])['data']
+    # same radar, ties go to the first file for nearest, last for latest
+    nearest = mosaic.composite([N0Q, N0R], rule='nearest')['data']
+    assert np.array_equal(nearest[~np.isnan(n0q)], n0q[~np.isnan(n0q)])
+    latest = mosaic.composite([N0Q, N0R], rule='latest')['data']
+    assert np.array_equal(latest[~np.isnan(n0r)], n0r[~np.isnan(n0r)])
+
+
+def test_geographic_to_cartesian():
+    nfile = nexrad_level3.NEXRADLevel3File(N0Q)
+    lat, lon, _ = nfile.get_gate_coordinates()
+    latitude, longitude, _ = nfile.get_location()
+    x, y = nexrad_level3_mosaic._geographic_to_cartesian(
+        lat, lon, latitude, longitude)
+    gx, gy, _ = nfile.get_gate_cartesian()
+    assert np.allclose(x, gx, atol=0.1)
+    assert np.allclose(y, gy, atol=0.1)
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import netCDF4
+
+import nexrad_level3
+import nexrad_level3_netcdf
+
+FILES = [
+    ('current_files/KBMX_SDUS54_N0RBMX_201501020205', 'BaseReflectivity'),
+    ('current_files/KBMX_SDUS54_N0QBMX_201501020205', 'BaseReflectivityDR'),
+]
+
+
+def test_write_netcdf():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for n3file, field in FILES:
+            for fmt in ['NETCDF4', 'NETCDF3_CLASSIC']:
+                check_write_netcdf.description = (
+                    'check_write_netcdf ' + os.path.basename(n3file) + fmt)
+                yield check_write_netcdf, n3file, field, fmt, tmpdir
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def check_write_netcdf(n3file, field, fmt, tmpdir):
+    ncfile = os.path.join(tmpdir, 'out.nc')
+    nfile = nexrad_level3.NEXRADLevel3File(n3file)
+    nexrad_level3_netcdf.write_netcdf(nfile, ncfile, format=fmt, zlib=True)
+    dset = netCDF4.Dataset(ncfile)
+    ref = netCDF4.Dataset(n3file + '.nc')
+    for name in ['azimuth', 'gate', 'elevation', 'latitude', 'longitude']:
+        assert np.allclose(dset.variables[name][:], ref.variables[name][:],
+                           atol=0.01)
+    raw = dset.variables[field + '_RAW'][:]
+    assert np.all(np.asarray(raw).astype('u1') == nfile.raw_data)
+    data = np.ma.masked_invalid(dset.variables[field][:])
+    mdata = nfile.get_data()
+    assert np.all(np.ma.getmaskarray(data) == np.ma.getmaskarray(mdata))
+    assert np.ma.allclose(data, mdata)
+    assert dset.time_coverage_start == ref.time_coverage_start
+    dset.close()
+    ref.close()
+
+
+def test_convert_many():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        infiles = [FILES[0][0], 'sample_data/KBMX_SDUS54_NCRBMX_201501020205']
+        outfiles = [os.path.join(tmpdir, str(i) + '.nc') for i in range(2)]
+        errors = nexrad_level3_netcdf.convert_many(infiles, outfiles)
+        assert list(errors) == [infiles[1]]
+        assert isinstance(errors[infiles[1]], NotImplementedError)
+        assert os.path.exists(outfiles[0])
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_write_netcdf_field_names():
+    # code 34 (clutter filter control) uses the name of netCDF Java
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ncfile = os.path.join(tmpdir, 'out.nc')
+        for i in range(2, 6):
+            n3file = 'sample_data/KAMA_SDUS64_NC%iAMA_201502150549' % (i)
+            nfile = nexrad_level3.NEXRADLevel3File(n3file)
+            nexrad_level3_netcdf.write_netcdf(nfile, ncfile)
+            with netCDF4.Dataset(ncfile) as dset:
+                raw = dset.variables['error_RAW'][:]
+                data = np.ma.masked_invalid(dset.variables['error'][:])
+            assert np.all(np.asarray(raw).astype('u1') == nfile.raw_data)
+            assert np.ma.allclose(data, nfile.get_data())
+    finally:
+        shutil.rmtree(tmpdir)
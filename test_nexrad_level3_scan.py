@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_scan
+
+
+def test_scan():
+    inventory = nexrad_level3_scan.scan('current_files', workers=2)
+    order = np.argsort(inventory['path'])
+    assert [inventory['path'][i] for i in order] == [
+        'current_files/KBMX_SDUS54_N0QBMX_201501020205',
+        'current_files/KBMX_SDUS54_N0RBMX_201501020205']
+    assert list(inventory['product_code'][order]) == [94, 19]
+    assert list(inventory['compressed'][order]) == [True, False]
+    assert inventory['site'] == ['BMX', 'BMX']
+    assert inventory['wmo_header'][0] == 'SDUS54 KBMX 020205'
+    # netCDF files are not NEXRAD Level 3 files
+    assert sorted(inventory['errors']) == [
+        'current_files/KBMX_SDUS54_N0QBMX_201501020205.nc',
+        'current_files/KBMX_SDUS54_N0RBMX_201501020205.nc']
+
+    i = order[0]
+    nfile = nexrad_level3.NEXRADLevel3File(inventory['path'][i])
+    assert inventory['volume_start'][i] == np.datetime64(
+        nfile.get_volume_start_datetime())
+    assert abs(inventory['elevation'][i] - nfile.get_elevation()) < 0.001
+    assert inventory['vcp'][i] == nfile.prod_descr['vcp']
+
+
+def test_scan_files():
+    files = ['sample_data/KBMX_SDUS54_NCRBMX_201501020205',
+             'sample_data/KBMX_SDUS54_N0RBMX_201501020205']
+    inventory = nexrad_level3_scan.scan(files)
+    assert inventory['path'] == files
+    assert list(inventory['product_code']) == [37, 19]
+
+
+def test_scan_bbb_indicator():
+    # WMO heading with a BBB indicator, the text header is 34 bytes
+    tmpdir = tempfile.mkdtemp()
+    try:
+        with open('current_files/KBMX_SDUS54_N0QBMX_201501020205',
+                  'rb') as fhandle:
+            product = fhandle.read()
+        path = os.path.join(tmpdir, 'KBMX_SDUS54_N0QBMX_201501020205')
+        with open(path, 'wb') as fhandle:
+            fhandle.write(product[:18] + b' RRA' + product[18:])
+        inventory = nexrad_level3_scan.scan([path])
+        assert inventory['path'] == [path]
+        assert list(inventory['product_code']) == [94]
+        assert list(inventory['compressed']) == [True]
+        assert inventory['site'] == ['BMX']
+        assert inventory['wmo_header'] == ['SDUS54 KBMX 020205 RRA']
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_iter_paths_removed_directory():
+    # directories removed while walking are recorded and skipped
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name in ['a', 'b']:
+            os.mkdir(os.path.join(tmpdir, name))
+            open(os.path.join(tmpdir, name, 'file'), 'wb').close()
+        open(os.path.join(tmpdir, 'file'), 'wb').close()
+        errors = {}
+        paths = nexrad_level3_scan._iter_paths([tmpdir], False, errors)
+        assert next(paths) == os.path.join(tmpdir, 'file')
+        shutil.rmtree(os.path.join(tmpdir, 'b'))
+        assert list(paths) == [os.path.join(tmpdir, 'a', 'file')]
+        assert list(errors) == [os.path.join(tmpdir, 'b')]
+        assert isinstance(errors[os.path.join(tmpdir, 'b')],
+                          FileNotFoundError)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_map_bounded():
+    consumed = []
+
+    def items():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = nexrad_level3_scan._map_bounded(
+            executor, lambda x: x * 2, items(), 4)
+        assert next(results) == 0
+        assert len(consumed) == 4
+        assert list(results) == list(range(2, 200, 2))
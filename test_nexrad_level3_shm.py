@@ -0,0 +1,177 @@
+import os
+import pickle
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_shm
+
+FILES = ['sample_data/KBMX_SDUS54_N0QBMX_201501020205',
+         'sample_data/KBMX_SDUS54_N0RBMX_201501020205',
+         'sample_data/KBMX_SDUS54_DVLBMX_201501020205']
+
+
+def _checksum(handle):
+    """ Attach to a sweep in another process and sum its data. """
+    with handle.attach() as sweep:
+        return float(sweep.nfile.get_data().sum())
+
+
+def _decode_or_exit(args):
+    """ Decode a file in a worker, or kill the worker for 'exit'. """
+    if args[0] == 'exit':
+        time.sleep(0.5)
+        os._exit(1)
+    return _decode_shared(args)
+
+
+_decode_shared = nexrad_level3_shm._decode_shared
+
+
+def test_share_sweep():
+    for filename in FILES:
+        nfile = nexrad_level3.NEXRADLevel3File(filename)
+        for scaled in [True, False]:
+            check_share_sweep.description = 'check_share_sweep %s %s' % (
+                filename.split('_')[-2], scaled)
+            yield check_share_sweep, nfile, scaled
+
+
+def check_share_sweep(nfile, scaled):
+    with nexrad_level3_shm.SharedSweepRegistry() as registry:
+        handle = registry.register(
+            nexrad_level3_shm.share_sweep(nfile, scaled))
+        assert ('data' in handle.arrays) == scaled
+        handle = pickle.loads(pickle.dumps(handle))
+        with handle.attach() as sweep:
+            nfile2 = sweep.nfile
+            assert nfile2.text_header == nfile.text_header
+            assert nfile2.prod_descr == nfile.prod_descr
+            assert not nfile2.raw_data.flags.writeable
+            assert np.all(nfile2.raw_data == nfile.raw_data)
+            assert np.all(nfile2.get_azimuth() == nfile.get_azimuth())
+            assert np.all(nfile2.get_range() == nfile.get_range())
+            data = nfile2.get_data()
+            assert ('data' in nfile2._cache) == scaled
+            assert np.ma.allequal(data, nfile.get_data())
+            assert np.all(data.mask == nfile.get_data().mask)
+            assert data.data.flags.writeable
+            if scaled:
+                block_data = nfile2._cache['data'][0]
+                assert not np.shares_memory(data.data, block_data)
+                data = nfile2.get_data(copy=False)
+                assert np.shares_memory(data.data, block_data)
+                del block_data
+            del nfile2, data
+
+
+def test_windowed_sweep():
+    nfile = nexrad_level3.NEXRADLevel3File(
+        FILES[0], sector=(90, 180), range_window=(1e4, 5e4), stride=2)
+    with nexrad_level3_shm.SharedSweepRegistry() as registry:
+        handle = registry.register(
+            nexrad_level3_shm.decode_shared(
+                FILES[0], sector=(90, 180), range_window=(1e4, 5e4),
+                stride=2))
+        with handle.attach() as sweep:
+            assert np.all(sweep.nfile.get_range() == nfile.get_range())
+            assert np.all(sweep.nfile.get_azimuth() == nfile.get_azimuth())
+            assert np.ma.allequal(sweep.nfile.get_data(), nfile.get_data())
+
+
+def test_registry():
+    nfile = nexrad_level3.NEXRADLevel3File(FILES[0])
+    registry = nexrad_level3_shm.SharedSweepRegistry()
+    handle = registry.register(nexrad_level3_shm.share_sweep(nfile))
+    assert handle in registry and len(registry) == 1
+    registry.acquire(handle, 2)
+    assert registry.refcount(handle) == 3
+    assert registry.release(handle) == 2
+    sweep = handle.attach()
+    assert registry.release(handle, 2) == 0
+    assert handle not in registry and registry.refcount(handle) == 0
+
+    # attached sweeps remain readable after the block is unlinked
+    assert np.all(sweep.nfile.raw_data == nfile.raw_data)
+    sweep.close()
+    try:
+        handle.attach()
+        assert False
+    except FileNotFoundError:
+        pass
+    try:
+        registry.release(handle)
+        assert False
+    except KeyError:
+        pass
+
+    # closing the registry unlinks the remaining blocks
+    handle = registry.register(nexrad_level3_shm.share_sweep(nfile))
+    registry.close()
+    assert len(registry) == 0
+    try:
+        handle.attach()
+        assert False
+    except FileNotFoundError:
+        pass
+
+
+def test_decode_many():
+    sources = FILES + ['sample_data/KBMX_NXUS64_GSMBMX_201501020258']
+    with nexrad_level3_shm.SharedSweepRegistry() as registry:
+        handles, errors = nexrad_level3_shm.decode_many(
+            sources, registry, workers=2)
+        assert sorted(handles) == sorted(FILES)
+        assert list(errors) == sources[-1:]
+        assert isinstance(errors[sources[-1]], NotImplementedError)
+        assert len(registry) == len(FILES)
+
+        # consumers in other processes attach to the blocks
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            sums = list(executor.map(_checksum, [handles[f] for f in FILES]))
+        for filename, total in zip(FILES, sums):
+            nfile = nexrad_level3.NEXRADLevel3File(filename)
+            assert np.isclose(total, nfile.get_data().sum())
+            registry.release(handles[filename])
+        assert len(registry) == 0
+
+
+def test_decode_many_fresh_process():
+    # blocks created by the workers of a process which has not used shared
+    # memory before must outlive the workers.
+    script = (
+        'import nexrad_level3_shm\n'
+        'registry = nexrad_level3_shm.SharedSweepRegistry()\n'
+        'handles, errors = nexrad_level3_shm.decode_many(\n'
+        '    %r, registry, workers=2)\n'
+        'assert not errors\n'
+        'for handle in handles.values():\n'
+        '    handle.attach().close()\n'
+        'registry.close()\n' % (FILES, ))
+    result = subprocess.run([sys.executable, '-c', script],
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'leaked' not in result.stderr, result.stderr
+
+
+def test_decode_many_broken_pool():
+    # files decoded before a worker dies are registered, not leaked
+    blocks = set(os.listdir('/dev/shm'))
+    sources = FILES + ['exit']
+    nexrad_level3_shm._decode_shared = _decode_or_exit
+    try:
+        with nexrad_level3_shm.SharedSweepRegistry() as registry:
+            handles, errors = nexrad_level3_shm.decode_many(
+                sources, registry, workers=2)
+            assert sorted(handles) == sorted(FILES)
+            assert list(errors) == ['exit']
+            assert isinstance(errors['exit'], BrokenProcessPool)
+            assert len(registry) == len(FILES)
+    finally:
+        nexrad_level3_shm._decode_shared = _decode_shared
+    assert set(os.listdir('/dev/shm')) == blocks
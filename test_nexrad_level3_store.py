@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_store
+
+FILES = ['current_files/KBMX_SDUS54_N0RBMX_201501020205',
+         'current_files/KBMX_SDUS54_N0QBMX_201501020205',
+         'sample_data/KBMX_SDUS54_N0UBMX_201501020205']
+
+
+def test_sweep_store():
+    directory = tempfile.mkdtemp()
+    try:
+        store = nexrad_level3_store.SweepStore(directory)
+        for filename in FILES:
+            for compress in [False, True]:
+                check_sweep_store.description = 'check_sweep_store %s %s' % (
+                    os.path.basename(filename), compress)
+                yield check_sweep_store, store, filename, compress
+    finally:
+        shutil.rmtree(directory)
+
+
+def check_sweep_store(store, filename, compress):
+    key = store.export(filename, compress=compress)
+    assert key == os.path.basename(filename)
+    assert key in store
+    assert store.keys() == [key]
+
+    nfile = nexrad_level3.NEXRADLevel3File(filename)
+    sweep = store.open(key)
+    if not compress:
+        assert isinstance(sweep.raw_data, np.memmap)
+        assert not sweep.raw_data.flags.writeable
+    assert sweep.text_header == nfile.text_header
+    assert sweep.msg_header == nfile.msg_header
+    assert sweep.prod_descr == nfile.prod_descr
+    assert sweep.symbology_header == nfile.symbology_header
+    assert sweep.packet_header == nfile.packet_header
+    assert np.all(sweep.radial_headers == nfile.radial_headers)
+    assert np.all(sweep.raw_data == nfile.raw_data)
+    assert np.all(sweep.get_azimuth() == nfile.get_azimuth())
+    assert np.all(sweep.get_range() == nfile.get_range())
+    assert sweep.get_elevation() == nfile.get_elevation()
+    assert (sweep.get_volume_start_datetime() ==
+            nfile.get_volume_start_datetime())
+    assert np.ma.allequal(sweep.get_data(), nfile.get_data())
+
+    store.remove(key)
+    assert len(store) == 0
+
+
+def test_sweep_store_key():
+    directory = tempfile.mkdtemp()
+    try:
+        store = nexrad_level3_store.SweepStore(directory)
+        nfile = nexrad_level3.NEXRADLevel3File(FILES[0])
+        for key in [None, '', '.tmp', 'a/b']:
+            try:
+                store.export(nfile, key=key)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('ValueError not raised')
+        assert store.export(nfile, key='sweep') == 'sweep'
+        assert store.export(nfile, key='sweep') == 'sweep'
+        assert list(store) == ['sweep']
+        try:
+            store.open('missing')
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('KeyError not raised')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_sweep_store_window():
+    directory = tempfile.mkdtemp()
+    try:
+        store = nexrad_level3_store.SweepStore(directory)
+        nfile = nexrad_level3.NEXRADLevel3File(
+            FILES[1], range_window=(10e3, 50e3), stride=2)
+        sweep = store.open(store.export(nfile, key='window'))
+        assert np.all(sweep.get_range() == nfile.get_range())
+        assert np.all(sweep.get_azimuth() == nfile.get_azimuth())
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_sweep_store_replace():
+    directory = tempfile.mkdtemp()
+    try:
+        store = nexrad_level3_store.SweepStore(directory)
+        nfiles = [nexrad_level3.NEXRADLevel3File(f) for f in FILES[:2]]
+        store.export(nfiles[0], key='sweep')
+        store.export(nfiles[1], key='sweep')
+        assert store.open('sweep').msg_header['code'] == 94
+        assert os.listdir(directory) == ['sweep']
+
+        # concurrent exports of the same key all succeed
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            keys = list(executor.map(
+                lambda i: store.export(nfiles[i % 2], key='sweep'),
+                range(16)))
+        assert keys == ['sweep'] * 16
+        assert os.listdir(directory) == ['sweep']
+        assert store.open('sweep').msg_header['code'] in [19, 94]
+    finally:
+        shutil.rmtree(directory)
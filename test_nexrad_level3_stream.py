@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import nexrad_level3
+import nexrad_level3_stream
+
+FILES = ['sample_data/KBMX_SDUS54_N0QBMX_201501020205',
+         'sample_data/KBMX_SDUS54_N0RBMX_201501020205',
+         'sample_data/KBMX_SDUS54_NCRBMX_201501020205']
+
+
+def _stream():
+    """ Return a NOAAPort style stream of products and their offsets. """
+    stream = b'garbage SDUS54 KBMX 020205\r\r\nN0QBMX\r\r\nshort'
+    offsets = []
+    for i, filename in enumerate(FILES):
+        with open(filename, 'rb') as fhandle:
+            product = fhandle.read()
+        if i == 1:
+            # WMO heading with a BBB indicator
+            product = product[:18] + b' RRA' + product[18:]
+        stream += b'\x01\r\r\n%03i \r\r\n' % (i)
+        offsets.append(len(stream))
+        stream += product + b'\r\r\n\x03'
+    return stream, offsets
+
+
+def test_split_products():
+    stream, offsets = _stream()
+    products = list(nexrad_level3_stream.split_products(stream))
+    assert [offset for offset, _ in products] == offsets
+    for (offset, product), filename in zip(products, FILES):
+        assert isinstance(product, memoryview)
+        assert product.obj is stream
+        with open(filename, 'rb') as fhandle:
+            data = fhandle.read()
+        assert bytes(product[-20:]) == data[-20:]
+
+
+def test_read_products():
+    stream, offsets = _stream()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'stream')
+        with open(filename, 'wb') as fhandle:
+            fhandle.write(stream)
+        products = list(nexrad_level3_stream.read_products(filename))
+    finally:
+        shutil.rmtree(tmpdir)
+    assert [offset for offset, _ in products] == offsets
+    assert isinstance(products[2][1], NotImplementedError)
+    for (_, nfile), filename in zip(products[:2], FILES[:2]):
+        ref = nexrad_level3.NEXRADLevel3File(filename)
+        assert nfile.msg_header == ref.msg_header
+        assert np.ma.allequal(nfile.get_data(), ref.get_data())
+    assert products[1][1].text_header == (
+        b'SDUS54 KBMX 020205 RRA\r\r\nN0RBMX\r\r\n')